@@ -0,0 +1,120 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import math
+import time
+from array import array
+
+###############################################################################
+# Aging wheel
+###############################################################################
+
+# Hashed timing wheel for table entry aging.
+#
+# Every entry is armed to expire `lifetime` ticks after it was last touched. A
+# touch only appends the key to the slot of its expiry tick; refreshed or
+# deleted entries are left behind in their old slot and skipped when that slot
+# comes due (lazy expiry). Touching, discarding and advancing by one tick are
+# therefore O(1) amortized, no matter how many entries are being aged.
+#
+# Keys are unsigned 64-bit integers (e.g. MAC addresses or packed VLAN/MAC
+# keys), so slots are compact arrays. The expiry tick of each key is kept in
+# the `expiry` dict; a table that stores expiry ticks itself may install its
+# own mapping there before the first touch (any object with `get`, `pop`,
+# `__getitem__`, `__setitem__`, `__delitem__` and `__len__`).
+class AgingWheel:
+    def __init__(self, lifetime):
+        if lifetime < 1:
+            raise ValueError('lifetime must be at least one tick')
+        self.lifetime = lifetime
+        self.now = 0
+        self.expiry = {}
+        # One slot more than the lifetime, so pending ticks never share a slot
+        self.slots = [array('Q') for _ in range(lifetime + 1)]
+
+    def __len__(self):
+        return len(self.expiry)
+
+    def __contains__(self, key):
+        return self.expiry.get(key) is not None
+
+    # (Re)arm the timer of an entry
+    def touch(self, key):
+        self.expiry[key] = self.schedule(key)
+
+    # Queue a key in the slot of its expiry tick and return that tick; the
+    # caller records the tick itself (see `touch`)
+    def schedule(self, key):
+        tick = self.now + self.lifetime
+        self.slots[tick % len(self.slots)].append(key)
+        return tick
+
+    # Stop aging an entry
+    def discard(self, key):
+        self.expiry.pop(key, None)
+
+    # Number of ticks left before an entry expires
+    def remaining(self, key):
+        return self.expiry[key] - self.now
+
+    # Advance the wheel up to the given tick and return the keys that expired
+    def advance_to(self, tick):
+        if tick <= self.now:
+            return ()
+
+        # Pending ticks all fit in one turn of the wheel, so never visit a slot twice
+        expired = []
+        expiry = self.expiry
+        num_slots = len(self.slots)
+        for now in range(self.now + 1, min(tick, self.now + num_slots) + 1):
+            index = now % num_slots
+            slot = self.slots[index]
+            if not slot:
+                continue
+            self.slots[index] = array('Q')
+            for key in slot:
+                if expiry.get(key) == now:
+                    del expiry[key]
+                    expired.append(key)
+
+        self.now = tick
+        return expired
+
+    # Expire entries on the packet-processing loop; ages by the number of packets seen
+    def expire(self, num_packets):
+        return self.advance_to(self.now + num_packets)
+
+
+# Wall-clock flavour of the aging wheel.
+#
+# Entries expire once they have been idle for more than `timeout` seconds,
+# whatever the packet rate is. The wheel ticks every `resolution` seconds of the
+# monotonic clock and is driven by the loop calling `expire`, including on the
+# iterations where no packet arrived.
+class IdleAgingWheel(AgingWheel):
+    def __init__(self, timeout, resolution=1.0, clock=time.monotonic):
+        # One extra tick, so an entry is never expired before `timeout` elapsed
+        super().__init__(math.ceil(timeout / resolution) + 1)
+        self.resolution = resolution
+        self.clock = clock
+        self.origin = clock()
+
+    # Expire entries idle for longer than the timeout; the packet count is ignored
+    def expire(self, num_packets=0):
+        return self.advance_to(int((self.clock() - self.origin) / self.resolution))
@@ -17,10 +17,17 @@
 ##
 #############################################################################
 
-import json
+import logging
 import argparse
 import p4runtime_sh.shell as p4sh
-from p4.v1 import p4runtime_pb2 as p4rt
+from aging import AgingWheel, IdleAgingWheel
+from ethernet import mac2str, parse_eth
+from packetout import PacketOutSender
+from snapshot import SnapshotWriter
+from topoconfig import LoadSwitchConfig
+from ratelog import LOG_RATE, ControllerLog, Lazy, get_logger, parse_samples
+
+log = get_logger()
 
 ###############################################################################
 # Default parameters
@@ -37,14 +44,13 @@ BRIDGE_ID = 1
 NUM_ENTRIES_THRESHOLD = 10
 NUM_LOGS_THRESHOLD = 10
 
+# Log level of the controller messages (per-packet messages are logged at DEBUG)
+LOG_LEVEL = 'INFO'
 
-###############################################################################
-# Helper functions 
-###############################################################################
-
-# MAC address in bytes to string
-def mac2str(mac):
-    return ':'.join('{:02x}'.format(b) for b in mac)
+# Aging mode ('packets': after NUM_ENTRIES_THRESHOLD packets, 'idle': after IDLE_TIMEOUT 
+# seconds without being refreshed)
+AGING_MODE = 'packets'
+IDLE_TIMEOUT = 300
 
 
 ###############################################################################
@@ -69,13 +75,21 @@ def DeleteMcastGrpEntry(mcast_group_id):
 
 # Process incoming packets
 def ProcPacketIn(bridge_name, mcast_group_id,
-                 eth_to_port_map, num_entries_threshold, 
+                 eth_to_port_map, ager,
                  logs_dir, num_logs_threshold):
+    packet_out = PacketOutSender(p4sh.client.stream_out_q)
+    snapshot = SnapshotWriter(logs_dir, '{0}-table'.format(bridge_name))
     try:
-        mcast_group_id_in_bytes = mcast_group_id.to_bytes(2, byteorder='big')
         num_logs = 0
         while True:
             rep = p4sh.client.get_stream_packet("packet", timeout=1)
+
+            # Age table entries, also on idle ticks (only those expiring now are visited)
+            for mac in ager.expire(0 if rep is None else 1):
+                log.info("Table entry deleted: mac=%s port=%d", Lazy(mac2str, mac),
+                         eth_to_port_map[mac]['port'], extra={'kind': 'entry_deleted'})
+                snapshot.expired(mac, eth_to_port_map.pop(mac)['port'])
+
             if rep is not None:
                 # Read the raw packet
                 payload = rep.packet.payload
@@ -88,17 +102,14 @@ def ProcPacketIn(bridge_name, mcast_group_id,
                 ##################################################################################
                 
                 # Parse Metadata
-                ingress_port_in_bytes = rep.packet.metadata[0].value
-                ingress_port = int.from_bytes(ingress_port_in_bytes, "big")
+                ingress_port = int.from_bytes(rep.packet.metadata[0].value, "big")
 
-                # Parse Ethernet header (source and destination MAC)
-                dst_mac_in_bytes = payload[0:6]
-                dst_mac = mac2str(dst_mac_in_bytes)
-                src_mac_in_bytes = payload[6:12]
-                src_mac = mac2str(src_mac_in_bytes)
+                # Parse Ethernet header (source and destination MAC as integers)
+                dst_mac, src_mac, _, _, _ = parse_eth(payload)
 
-                print("PacketIn: dst={0} src={1} port={2}".format(
-                    dst_mac, src_mac, ingress_port))
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("PacketIn: dst=%s src=%s port=%d", Lazy(mac2str, dst_mac),
+                              Lazy(mac2str, src_mac), ingress_port, extra={'kind': 'packet_in'})
 
                 ##################################################################################
                 # Packet parsing logic - Ends ####################################################
@@ -107,21 +118,6 @@ def ProcPacketIn(bridge_name, mcast_group_id,
 
 
 
-                # Decrement table entry's counter
-                del_mac_list = []
-                for mac in eth_to_port_map:
-                    eth_to_port_map[mac]['count'] -= 1
-                    if eth_to_port_map[mac]['count'] == 0:
-                        print("INFO: Table entry deleted: mac={0} port={1}".format(
-                              mac, eth_to_port_map[mac]['port']))
-                        del_mac_list.append(mac)
-
-                for mac in del_mac_list:
-                    del eth_to_port_map[mac]
-
-
-
-
                 ##################################################################################
                 # Learning bridge logic - Begins #################################################
                 ##################################################################################
@@ -130,19 +126,20 @@ def ProcPacketIn(bridge_name, mcast_group_id,
                 if dst_mac in eth_to_port_map:
                     if ingress_port != eth_to_port_map[dst_mac]['port']:
                         # Broadcast packet
-                        ProcPacketOut(payload, mcast_group_id_in_bytes, ingress_port_in_bytes) 
+                        packet_out.send(payload, mcast_group_id, ingress_port)
                     else:
                         None  # ... drop the packet
 
-                    eth_to_port_map[dst_mac]['count'] = num_entries_threshold  # ... reset the counter
+                    ager.touch(dst_mac)  # ... reset the counter
                 else:
                     # Broacast packet as-is, we haven't learned anything about it yet
-                    ProcPacketOut(payload, mcast_group_id_in_bytes, ingress_port_in_bytes)
+                    packet_out.send(payload, mcast_group_id, ingress_port)
 
                 # Learn Ethernet address to port mapping
                 if src_mac not in eth_to_port_map:
-                    eth_to_port_map[src_mac] = {'port': ingress_port,
-                                                'count': num_entries_threshold}
+                    eth_to_port_map[src_mac] = {'port': ingress_port}
+                    ager.touch(src_mac)
+                    snapshot.learned(src_mac, ingress_port)
 
                 ##################################################################################
                 # Learning bridge logic - Ends ###################################################
@@ -155,33 +152,14 @@ def ProcPacketIn(bridge_name, mcast_group_id,
             num_logs += 1
             if num_logs == num_logs_threshold:
                 num_logs = 0
-                with open('{0}/{1}-table.json'.format(logs_dir, bridge_name), 'w') as outfile:
-                    json.dump(eth_to_port_map, outfile)
+                snapshot.commit()  # ... written out in the background
 
-                print(
-                    "INFO: Log committed to {0}/{1}-table.json".format(logs_dir, bridge_name))
+                log.info("Log committed to %s/%s-table.json and .changes.jsonl",
+                         logs_dir, bridge_name, extra={'kind': 'logs'})
     except KeyboardInterrupt:
         return None
-
-# Process outgoing packets
-def ProcPacketOut(payload, mcast_grp_in_bytes=b'\00\00', ingress_port_in_bytes=None):
-    req = p4rt.StreamMessageRequest()
-    packet = req.packet
-    packet.payload = payload
-
-    metadata = p4rt.PacketMetadata()
-    # Append multicast group ID
-    metadata.metadata_id = 1
-    metadata.value = mcast_grp_in_bytes
-    packet.metadata.append(metadata)
-    if ingress_port_in_bytes is not None:
-        # Append ingress port
-        metadata.metadata_id = 2
-        metadata.value = ingress_port_in_bytes
-        packet.metadata.append(metadata)
-
-    # Send packet out
-    p4sh.client.stream_out_q.put(req)
+    finally:
+        snapshot.close()
 
 
 ###############################################################################
@@ -193,20 +171,38 @@ if __name__ == '__main__':
                         type=str, action="store", default='50001')
     parser.add_argument('--topo-config', help='Topology Configuration File', required=True,
                         type=str, action="store")
+    parser.add_argument('--log-level', help='Log Level', choices=['DEBUG', 'INFO', 'WARNING'],
+                        type=str, action="store", default=LOG_LEVEL)
+    parser.add_argument('--log-rate', help='Log Records per Second per Message Type',
+                        type=float, action="store", default=LOG_RATE)
+    parser.add_argument('--log-sample', help='Log 1 in N Records of a Message Type (type=N)',
+                        type=str, action="append", default=[])
+    parser.add_argument('--aging-mode', help='Entry Aging Mode', choices=['packets', 'idle'],
+                        type=str, action="store", default=AGING_MODE)
+    parser.add_argument('--idle-timeout', help='Idle Timeout in Seconds (idle aging mode)',
+                        type=float, action="store", default=IDLE_TIMEOUT)
     args = parser.parse_args()
 
+    # Log through the rate-limited background writer
+    controller_log = ControllerLog(args.log_level, args.log_rate,
+                                   samples=parse_samples(args.log_sample))
+
     # Create a bridge name postfixed with the grpc port number
     bridge_name = 'bridge-{0}'.format(args.grpc_port)
 
     # Create a Ethernet address to port mapping
     eth_to_port_map = {}
 
-    # Get Multicast to ports mapping
-    with open(args.topo_config, 'r') as infile:
-        topo_config = json.loads(infile.read())
+    # Age entries by packet count or by idle time
+    if args.aging_mode == 'idle':
+        ager = IdleAgingWheel(args.idle_timeout)
+    else:
+        ager = AgingWheel(NUM_ENTRIES_THRESHOLD)
 
-    mcast_group_id = topo_config['switch'][args.grpc_port]['mcast']['id']
-    mcast_group_ports = topo_config['switch'][args.grpc_port]['mcast']['ports']
+    # Get Multicast to ports mapping
+    switch_config = LoadSwitchConfig(args.topo_config, args.grpc_port)
+    mcast_group_id = switch_config.mcast_group_id
+    mcast_group_ports = switch_config.mcast_group_ports
 
     # Setup the P4Runtime connection with the bridge
     p4sh.setup(
@@ -225,10 +221,11 @@ if __name__ == '__main__':
 
     # Start the packet-processing loop
     ProcPacketIn(bridge_name, mcast_group_id,
-                 eth_to_port_map, NUM_ENTRIES_THRESHOLD, 
+                 eth_to_port_map, ager,
                  LOGS_DIR, NUM_LOGS_THRESHOLD)
 
     print("Bridge Stopped")
+    controller_log.close()
 
     # Delete the broadcast rule
     DeleteMcastGrpEntry(mcast_group_id)
@@ -0,0 +1,72 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import struct
+
+###############################################################################
+# Header formats
+###############################################################################
+
+# Ethernet type values (https://en.wikipedia.org/wiki/EtherType)
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_VLAN = 0x8100
+
+# Ethernet header: dst MAC (16 + 32 bits), src MAC (16 + 32 bits), type
+ETH_HEADER = struct.Struct('!HIHIH')
+
+# 802.1Q header following the Ethernet header: TCI, encapsulated type
+VLAN_HEADER = struct.Struct('!HH')
+VLAN_HEADER_OFFSET = ETH_HEADER.size
+
+VLAN_ID_MASK = 0x0FFF
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# MAC address as a 48-bit integer to string (only needed for logging)
+def mac2str(mac):
+    return mac.to_bytes(6, 'big').hex(':')
+
+# MAC address string to a 48-bit integer
+def str2mac(mac):
+    return int(mac.replace(':', ''), 16)
+
+
+###############################################################################
+# Packet parsing functions
+###############################################################################
+
+# Parse the Ethernet and 802.1Q headers of a raw packet.
+#
+# The headers are unpacked in place from any buffer (bytes, bytearray or
+# memoryview) without slicing the payload. MAC addresses are returned as 48-bit
+# integers, so they can be used as table keys without any string formatting.
+#
+# Returns (dst_mac, src_mac, eth_type, vlan_tci, inner_eth_type); for untagged
+# packets `vlan_tci` is None and `inner_eth_type` equals `eth_type`.
+def parse_eth(payload):
+    dst_hi, dst_lo, src_hi, src_lo, eth_type = ETH_HEADER.unpack_from(payload)
+    if eth_type == ETH_TYPE_VLAN:
+        vlan_tci, inner_eth_type = VLAN_HEADER.unpack_from(payload, VLAN_HEADER_OFFSET)
+    else:
+        vlan_tci, inner_eth_type = None, eth_type
+    return (dst_hi << 32 | dst_lo, src_hi << 32 | src_lo,
+            eth_type, vlan_tci, inner_eth_type)
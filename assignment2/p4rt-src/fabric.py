@@ -0,0 +1,310 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import json
+import time
+import signal
+import asyncio
+import argparse
+import grpc
+from google.protobuf import text_format
+from p4.v1 import p4runtime_pb2 as p4rt
+from p4.v1 import p4runtime_pb2_grpc as p4rt_grpc
+from p4.config.v1 import p4info_pb2
+from aging import AgingWheel, IdleAgingWheel
+from ethernet import VLAN_ID_MASK, mac2str, parse_eth
+from fdb import ForwardingDatabase
+from packetout import PacketOutBuilder
+from snapshot import SnapshotWriter
+from hotpath import PROFILER, PROFILERS, HotPathMonitor
+from ratelog import LOG_RATE, ControllerLog, Lazy, get_logger, parse_samples
+from switch import (CFG_DIR, LOGS_DIR, BRIDGE_ID, NUM_ENTRIES_THRESHOLD, NUM_LOGS_THRESHOLD,
+                    LOG_LEVEL, AGING_MODE, IDLE_TIMEOUT, ProcPacket)
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Compiled configuration pushed to every switch (cfg/<name>-p4info.txt and cfg/<name>.json)
+CFG_NAME = 'switch-50001'
+
+# Election ID of the controller (high, low), as used by the single-switch scripts
+ELECTION_ID = (0, 1)
+
+# Seconds between two idle ticks (aging and log commits without traffic)
+TICK_INTERVAL = 1
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Load the P4Info and device configuration once, to be shared by all switches
+def LoadPipelineConfig(cfg_dir, cfg_name):
+    p4info = p4info_pb2.P4Info()
+    with open('{0}/{1}-p4info.txt'.format(cfg_dir, cfg_name), 'r') as infile:
+        text_format.Merge(infile.read(), p4info)
+    with open('{0}/{1}.json'.format(cfg_dir, cfg_name), 'rb') as infile:
+        device_config = infile.read()
+    return p4info, device_config
+
+
+###############################################################################
+# Switch device
+###############################################################################
+
+# One switch of the fabric: its own P4Runtime channel and stream, FDB and
+# table log, all driven from the event loop. Packets are learned and forwarded
+# by the same ProcPacket as the single-switch controller.
+class SwitchDevice:
+    def __init__(self, grpc_port, switch_config, ager, stats, snapshots, num_logs_threshold):
+        self.name = 'switch-{0}'.format(grpc_port)
+        self.grpc_addr = '127.0.0.1:{0}'.format(grpc_port)
+        self.mcast_group_id = switch_config['mcast']['id']
+        self.mcast_group_ports = switch_config['mcast']['ports']
+        self.vlan_id_to_ports_map = {int(vlan_id): ports for vlan_id, ports
+                                     in switch_config['vlan_id_to_ports'].items()}
+        self.eth_to_port_map = ForwardingDatabase(ager)
+        self.builder = PacketOutBuilder()
+        self.stats = stats
+        self.snapshots = snapshots
+        self.num_logs_threshold = num_logs_threshold
+        self.logs_count = 0
+        self.requests = asyncio.Queue()
+        self.election_id = p4rt.Uint128(high=ELECTION_ID[0], low=ELECTION_ID[1])
+        self.channel = None
+        self.snapshot = None
+
+    # Stream requests, ended by a None
+    async def stream_requests(self):
+        while True:
+            req = await self.requests.get()
+            if req is None:
+                return
+            yield req
+
+    # Queue a PacketOut on the stream
+    def send(self, payload, mcast_grp=0, ingress_port=None, egress_port=None):
+        self.requests.put_nowait(self.builder.build(payload, mcast_grp, ingress_port, egress_port))
+
+    # Open the channel, become primary controller, and push the pipeline
+    async def setup(self, p4info, device_config):
+        self.channel = grpc.aio.insecure_channel(self.grpc_addr)
+        self.stub = p4rt_grpc.P4RuntimeStub(self.channel)
+        self.stream = self.stub.StreamChannel(self.stream_requests())
+
+        req = p4rt.StreamMessageRequest()
+        req.arbitration.device_id = BRIDGE_ID
+        req.arbitration.election_id.CopyFrom(self.election_id)
+        self.requests.put_nowait(req)
+        rep = await self.stream.read()
+        if rep is grpc.aio.EOF or rep.arbitration.status.code != 0:
+            raise RuntimeError('{0}: not the primary controller'.format(self.name))
+
+        req = p4rt.SetForwardingPipelineConfigRequest(
+            device_id=BRIDGE_ID, election_id=self.election_id,
+            action=p4rt.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT)
+        req.config.p4info.CopyFrom(p4info)
+        req.config.p4_device_config = device_config
+        await self.stub.SetForwardingPipelineConfig(req)
+
+        self.snapshot = self.snapshots.open('{0}-table'.format(self.name))
+
+    # Insert or delete the broadcast and VLAN multicast groups in one Write
+    async def write_mcast_groups(self, update_type):
+        groups = [(self.mcast_group_id, self.mcast_group_ports)]
+        groups.extend(self.vlan_id_to_ports_map.items())
+
+        req = p4rt.WriteRequest(device_id=BRIDGE_ID, election_id=self.election_id)
+        for mcast_group_id, ports in groups:
+            update = req.updates.add()
+            update.type = update_type
+            mcast_entry = update.entity.packet_replication_engine_entry.multicast_group_entry
+            mcast_entry.multicast_group_id = mcast_group_id
+            if update_type != p4rt.Update.DELETE:
+                for port in ports:
+                    mcast_entry.replicas.add(egress_port=port, instance=1)
+        await self.stub.Write(req)
+
+    # Age table entries and commit the table log every `num_logs_threshold` calls
+    def age(self, num_packets):
+        for vlan, mac, port in self.eth_to_port_map.expire(num_packets):
+            log.info("%s: Flow entry deleted: vlan=%d mac=%s port=%d", self.name,
+                     vlan, Lazy(mac2str, mac), port, extra={'kind': 'flow_deleted'})
+            self.snapshot.expired(mac, port, vlan)
+
+        self.logs_count += 1
+        if self.logs_count == self.num_logs_threshold:
+            self.logs_count = 0
+            self.snapshot.commit()  # ... written out in the background
+
+    # Process an incoming packet
+    def process(self, packet):
+        stats = self.stats
+        now = time.perf_counter_ns()
+        self.age(1)
+        now = stats.record('aging', now)
+
+        payload = packet.payload
+        ingress_port = int.from_bytes(packet.metadata[0].value, byteorder='big')
+        dst_mac, src_mac, _, vlan_tci, eth_type = parse_eth(payload)
+        vlan_id = 0 if vlan_tci is None else vlan_tci & VLAN_ID_MASK
+        stats.count('packets')
+        now = stats.record('parse', now)
+
+        ProcPacket(self.send, self.snapshot, stats,
+                   self.eth_to_port_map, self.vlan_id_to_ports_map, self.mcast_group_id,
+                   payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id)
+        stats.record('learn', now)
+
+    # Idle ticks
+    async def tick(self):
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            self.age(0)
+
+    # Packet-processing loop
+    async def run(self):
+        ticker = asyncio.ensure_future(self.tick())
+        try:
+            while True:
+                rep = await self.stream.read()
+                if rep is grpc.aio.EOF:
+                    log.error("%s: stream closed by the switch", self.name, extra={'kind': 'error'})
+                    return
+                if rep.HasField('packet'):
+                    self.process(rep.packet)
+        finally:
+            ticker.cancel()
+
+    # Delete the multicast groups and close the channel
+    async def teardown(self):
+        try:
+            await self.write_mcast_groups(p4rt.Update.DELETE)
+        finally:
+            self.requests.put_nowait(None)
+            await self.channel.close()
+            if self.snapshot is not None:
+                self.snapshot.commit()
+
+
+###############################################################################
+# Fabric
+###############################################################################
+
+# Drive every switch of the topology from one event loop until SIGINT/SIGTERM
+async def RunFabric(topo_config, p4info, device_config, new_ager, profiler, logs_dir, num_logs_threshold):
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+
+    # Time the stages of the packet processing, with stats per switch
+    hotpath = HotPathMonitor(logs_dir, 'fabric', profiler)
+
+    # Log the tables of all switches from one background thread
+    snapshots = SnapshotWriter(logs_dir)
+
+    devices = [SwitchDevice(grpc_port, switch_config, new_ager(), hotpath.fork(), snapshots, num_logs_threshold)
+               for grpc_port, switch_config in topo_config['switch'].items()]
+
+    # Set up all switches concurrently; those failing are left out
+    async def start(device):
+        await device.setup(p4info, device_config)
+        await device.write_mcast_groups(p4rt.Update.INSERT)
+    results = await asyncio.gather(*(start(device) for device in devices), return_exceptions=True)
+    started = []
+    for device, result in zip(devices, results):
+        if isinstance(result, BaseException):
+            log.error("%s: setup failed: %s", device.name, result, extra={'kind': 'error'})
+            device.requests.put_nowait(None)
+            if device.channel is not None:
+                await device.channel.close()
+        else:
+            started.append(device)
+
+    print("Fabric Started: {0} of {1} switches".format(len(started), len(devices)))
+    print("Press CTRL+C to stop ...")
+
+    tasks = [asyncio.ensure_future(device.run()) for device in started]
+    while not stopped.is_set():
+        try:
+            await asyncio.wait_for(stopped.wait(), TICK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        hotpath.check()  # ... start or stop the profiler, or dump the stats, if signaled
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    print("Fabric Stopped")
+    hotpath.close()
+
+    results = await asyncio.gather(*(device.teardown() for device in started),
+                                   return_exceptions=True)
+    for device, result in zip(started, results):
+        if isinstance(result, BaseException):
+            log.error("%s: teardown failed: %s", device.name, result, extra={'kind': 'error'})
+    snapshots.close()
+
+
+###############################################################################
+# Main
+###############################################################################
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fabric Controller Script')
+    parser.add_argument('--topo-config', help='Topology Configuration File', required=True,
+                        type=str, action="store")
+    parser.add_argument('--cfg-name', help='Compiled Configuration Pushed to Every Switch',
+                        type=str, action="store", default=CFG_NAME)
+    parser.add_argument('--log-level', help='Log Level', choices=['DEBUG', 'INFO', 'WARNING'],
+                        type=str, action="store", default=LOG_LEVEL)
+    parser.add_argument('--log-rate', help='Log Records per Second per Message Type',
+                        type=float, action="store", default=LOG_RATE)
+    parser.add_argument('--log-sample', help='Log 1 in N Records of a Message Type (type=N)',
+                        type=str, action="append", default=[])
+    parser.add_argument('--aging-mode', help='Entry Aging Mode', choices=['packets', 'idle'],
+                        type=str, action="store", default=AGING_MODE)
+    parser.add_argument('--idle-timeout', help='Idle Timeout in Seconds (idle aging mode)',
+                        type=float, action="store", default=IDLE_TIMEOUT)
+    parser.add_argument('--profiler', help='Profiler Toggled by SIGUSR1 (stats dumped on SIGUSR2)',
+                        choices=PROFILERS, type=str, action="store", default=PROFILER)
+    args = parser.parse_args()
+
+    # Log through the rate-limited background writer
+    controller_log = ControllerLog(args.log_level, args.log_rate,
+                                   samples=parse_samples(args.log_sample))
+
+    # Age entries by packet count or by idle time
+    def new_ager():
+        if args.aging_mode == 'idle':
+            return IdleAgingWheel(args.idle_timeout)
+        return AgingWheel(NUM_ENTRIES_THRESHOLD)
+
+    with open(args.topo_config, 'r') as infile:
+        topo_config = json.loads(infile.read())
+
+    p4info, device_config = LoadPipelineConfig(CFG_DIR, args.cfg_name)
+
+    asyncio.run(RunFabric(topo_config, p4info, device_config, new_ager, args.profiler,
+                          LOGS_DIR, NUM_LOGS_THRESHOLD))
+
+    controller_log.close()
@@ -0,0 +1,231 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+from array import array
+from ethernet import mac2str
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# (VLAN, MAC) keys are packed into one 64-bit integer: VLAN ID in bits 48-59
+MAC_BITS = 48
+MAC_MASK = (1 << MAC_BITS) - 1
+VLAN_MASK = 0x0FFF
+
+# Marks an unused slot (never a valid key, as the top 4 bits of a key are 0)
+EMPTY_KEY = 0xFFFFFFFFFFFFFFFF
+
+# Fibonacci hashing multiplier (2^64 / golden ratio)
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Smallest table (2^10 slots); the table doubles once it is half full
+MIN_SLOT_BITS = 10
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Pack a (VLAN ID, MAC address) pair into a 64-bit table key
+def fdb_key(vlan_id, mac):
+    return (vlan_id & VLAN_MASK) << MAC_BITS | mac
+
+
+###############################################################################
+# Forwarding database
+###############################################################################
+
+# Ethernet address to port mapping per VLAN.
+#
+# Entries live in an open-addressing hash table (linear probing, backward-shift
+# deletion) made of three parallel arrays: packed keys, ports and expiry ticks.
+# A slot costs 18 bytes and the table is kept at most half full, with no
+# per-entry Python objects; lookups, inserts and removals take a single probe
+# sequence. Entries are aged by the given aging wheel, which stores its expiry
+# ticks in the `expiry` array through `FdbExpiry`.
+class ForwardingDatabase:
+    def __init__(self, ager, capacity=1024):
+        if len(ager):
+            raise ValueError('ager is already aging entries')
+        slot_bits = MIN_SLOT_BITS
+        while (1 << slot_bits) < 2 * capacity:
+            slot_bits += 1
+        self.allocate(slot_bits)
+        self.count = 0
+        self.ager = ager
+        ager.expiry = FdbExpiry(self)
+
+    def __len__(self):
+        return self.count
+
+    # Iterate over the learned (VLAN ID, MAC address, port) entries
+    def __iter__(self):
+        ports = self.ports
+        for i, key in enumerate(self.keys):
+            if key != EMPTY_KEY:
+                yield key >> MAC_BITS, key & MAC_MASK, ports[i]
+
+    # Allocate empty slot arrays
+    def allocate(self, slot_bits):
+        num_slots = 1 << slot_bits
+        self.mask = num_slots - 1
+        self.shift = 64 - slot_bits
+        self.keys = array('Q', [EMPTY_KEY]) * num_slots
+        self.ports = array('H', [0]) * num_slots
+        self.expiry = array('Q', [0]) * num_slots
+
+    # Index of a key, or the bitwise complement of the free slot it would go into
+    def find(self, key):
+        keys = self.keys
+        mask = self.mask
+        i = ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        while True:
+            slot_key = keys[i]
+            if slot_key == key:
+                return i
+            if slot_key == EMPTY_KEY:
+                return ~i
+            i = (i + 1) & mask
+
+    # Double the number of slots and re-insert every entry
+    def grow(self):
+        keys, ports, expiry = self.keys, self.ports, self.expiry
+        self.allocate(64 - self.shift + 1)
+        for i, key in enumerate(keys):
+            if key != EMPTY_KEY:
+                j = ~self.find(key)
+                self.keys[j] = key
+                self.ports[j] = ports[i]
+                self.expiry[j] = expiry[i]
+
+    # Empty slot i, shifting back the entries of its probe sequence
+    def evict(self, i):
+        keys, ports, expiry = self.keys, self.ports, self.expiry
+        mask = self.mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            key = keys[j]
+            if key == EMPTY_KEY:
+                break
+            home = ((key * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+            # Move the entry back unless its home slot lies cyclically in (i, j]
+            if i <= j:
+                stays = i < home <= j
+            else:
+                stays = home > i or home <= j
+            if not stays:
+                keys[i] = key
+                ports[i] = ports[j]
+                expiry[i] = expiry[j]
+                i = j
+        keys[i] = EMPTY_KEY
+        expiry[i] = 0
+        self.count -= 1
+
+    # Port learned for a destination, or None if unknown
+    def lookup(self, vlan_id, mac):
+        i = self.find(fdb_key(vlan_id, mac))
+        return self.ports[i] if i >= 0 else None
+
+    # Learn (or move) a source and re-arm its aging timer; returns the previous port
+    def learn(self, vlan_id, mac, port):
+        key = fdb_key(vlan_id, mac)
+        i = self.find(key)
+        if i >= 0:
+            old_port = self.ports[i]
+        else:
+            if 2 * (self.count + 1) > len(self.keys):
+                self.grow()
+                i = self.find(key)
+            i = ~i
+            self.keys[i] = key
+            self.count += 1
+            old_port = None
+        self.ports[i] = port
+        self.expiry[i] = self.ager.schedule(key)
+        return old_port
+
+    # Forget an entry; returns its port, or None if it was not learned
+    def remove(self, vlan_id, mac):
+        i = self.find(fdb_key(vlan_id, mac))
+        if i < 0:
+            return None
+        port = self.ports[i]
+        self.evict(i)
+        return port
+
+    # Remove aged entries and return them as (VLAN ID, MAC address, port)
+    def expire(self, num_packets):
+        expired = []
+        for key in self.ager.expire(num_packets):
+            i = self.find(key)
+            expired.append((key >> MAC_BITS, key & MAC_MASK, self.ports[i]))
+            self.evict(i)
+        return expired
+
+    # Ethernet address to port mapping as logged to the JSON table dump
+    def to_dict(self):
+        table = {}
+        now = self.ager.now
+        for i, key in enumerate(self.keys):
+            if key != EMPTY_KEY:
+                table.setdefault(key >> MAC_BITS, {})[mac2str(key & MAC_MASK)] = {
+                    'port': self.ports[i], 'count': self.expiry[i] - now}
+        return table
+
+
+# Expiry ticks of a forwarding database, as the mapping used by the aging wheel.
+# A tick of 0 means the entry is not armed; entries are only removed from the
+# table by `ForwardingDatabase.expire`, after the wheel has handed them back.
+class FdbExpiry:
+    def __init__(self, fdb):
+        self.fdb = fdb
+
+    def __len__(self):
+        return self.fdb.count
+
+    def get(self, key, default=None):
+        i = self.fdb.find(key)
+        if i < 0 or not self.fdb.expiry[i]:
+            return default
+        return self.fdb.expiry[i]
+
+    def __getitem__(self, key):
+        tick = self.get(key)
+        if tick is None:
+            raise KeyError(key)
+        return tick
+
+    def __setitem__(self, key, tick):
+        i = self.fdb.find(key)
+        if i < 0:
+            raise KeyError(key)
+        self.fdb.expiry[i] = tick
+
+    def __delitem__(self, key):
+        self[key] = 0
+
+    def pop(self, key, default=None):
+        tick = self.get(key)
+        if tick is None:
+            return default
+        self[key] = 0
+        return tick
@@ -0,0 +1,255 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import os
+import sys
+import json
+import time
+import signal
+import cProfile
+import threading
+import collections
+from snapshot import write_atomic
+from ratelog import get_logger
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Timed stages of the packet-processing loops ('receive' is the dequeue of the
+# messages already waiting, not the wait for them; 'learn' includes sending the
+# PacketOuts), and their counters
+STAGES = ['receive', 'parse', 'aging', 'learn', 'table_write']
+COUNTERS = ['packets', 'floods', 'drops', 'table_writes', 'write_failures']
+
+# Histogram buckets: bucket i holds the times of at most 2^i ns
+HISTOGRAM_BUCKETS = 40
+
+# Signals starting or stopping the profiler, and dumping the statistics
+PROFILE_SIGNAL = signal.SIGUSR1
+DUMP_SIGNAL = signal.SIGUSR2
+
+# Profiler ('cprofile': the thread running the loop, 'sampling': the stacks of
+# every thread, every SAMPLING_INTERVAL seconds)
+PROFILERS = ['cprofile', 'sampling']
+PROFILER = 'cprofile'
+SAMPLING_INTERVAL = 0.005
+
+
+###############################################################################
+# Stage timing
+###############################################################################
+
+# Stage time histograms and counters of a thread of a packet-processing loop.
+# Each stage is timed from the end of the previous one:
+#
+#     now = time.perf_counter_ns()
+#     ...
+#     now = stats.record('parse', now)
+class HotPathStats:
+    def __init__(self):
+        self.histograms = {stage: [0] * HISTOGRAM_BUCKETS for stage in STAGES}
+        self.total_ns = dict.fromkeys(STAGES, 0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    # Record the time of a stage started at `start_ns`; returns the time now
+    def record(self, stage, start_ns):
+        now = time.perf_counter_ns()
+        elapsed = now - start_ns
+        self.histograms[stage][min(elapsed.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.total_ns[stage] += elapsed
+        return now
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    # Add the histograms and counters of other stats to these
+    def merge(self, other):
+        for stage in STAGES:
+            histogram = self.histograms[stage]
+            for i, count in enumerate(other.histograms[stage]):
+                histogram[i] += count
+            self.total_ns[stage] += other.total_ns[stage]
+        for counter in COUNTERS:
+            self.counters[counter] += other.counters[counter]
+
+
+# Upper bound in microseconds of the bucket holding fraction `q` of a histogram
+def HistogramPercentile(histogram, count, q):
+    rank = q * count
+    seen = 0
+    for i, bucket_count in enumerate(histogram):
+        seen += bucket_count
+        if bucket_count and seen >= rank:
+            return (1 << i) / 1e3
+    return 0.0
+
+
+###############################################################################
+# Profilers
+###############################################################################
+
+# Samples the stacks of every other thread every `interval` seconds, from a
+# thread of its own; dumped as folded stacks ("thread;file:function;... count"
+# lines, as flame graph tools read them)
+class SamplingProfiler:
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+
+    def enable(self):
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{0}:{1}'.format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        write_atomic(path, ''.join('{0} {1}\n'.format(stack, count)
+                                   for stack, count in self.samples.most_common()))
+
+
+###############################################################################
+# Hot path monitor
+###############################################################################
+
+# Collects the stage statistics of a controller, and dumps them to
+# `logs_dir`/`name`-hotpath.json on DUMP_SIGNAL and on close. PROFILE_SIGNAL
+# starts the profiler, and the next one stops it and dumps its results to
+# `logs_dir`/`name`-profile-N.prof (cProfile, for `python -m pstats`) or
+# -profile-N.txt (sampling). The signals only raise flags, acted upon by check()
+# from the packet-processing loop, as cProfile profiles the thread enabling it.
+#
+# Threads other than the loop's record into stats of their own (see fork);
+# `sources` are callables returning counters kept elsewhere, e.g. by the
+# WriteBatcher.
+class HotPathMonitor:
+    def __init__(self, logs_dir, name, profiler=PROFILER, sampling_interval=SAMPLING_INTERVAL):
+        self.logs_dir = logs_dir
+        self.name = name
+        self.profiler = profiler
+        self.sampling_interval = sampling_interval
+        self.stats = HotPathStats()
+        self.forks = []
+        self.sources = []
+        self.start_time = time.monotonic()
+        self.profile = None
+        self.num_profiles = 0
+        self.profile_requested = threading.Event()
+        self.dump_requested = threading.Event()
+        signal.signal(PROFILE_SIGNAL, lambda signum, frame: self.profile_requested.set())
+        signal.signal(DUMP_SIGNAL, lambda signum, frame: self.dump_requested.set())
+
+    # Stats for another thread, included in the dumps
+    def fork(self):
+        stats = HotPathStats()
+        self.forks.append(stats)
+        return stats
+
+    # Start or stop the profiler, or dump the statistics, if asked to
+    def check(self):
+        if self.profile_requested.is_set():
+            self.profile_requested.clear()
+            self.toggle_profile()
+        if self.dump_requested.is_set():
+            self.dump_requested.clear()
+            self.dump()
+
+    def toggle_profile(self):
+        if self.profile is None:
+            if self.profiler == 'sampling':
+                self.profile = SamplingProfiler(self.sampling_interval)
+            else:
+                self.profile = cProfile.Profile()
+            self.profile.enable()
+            log.info("Profiler %s started", self.profiler, extra={'kind': 'hotpath'})
+            return
+
+        self.profile.disable()
+        self.num_profiles += 1
+        path = '{0}/{1}-profile-{2}.{3}'.format(self.logs_dir, self.name, self.num_profiles,
+                                                'txt' if self.profiler == 'sampling' else 'prof')
+        self.profile.dump_stats(path)
+        self.profile = None
+        log.info("Profiler %s stopped, dumped to %s", self.profiler, path, extra={'kind': 'hotpath'})
+
+    # Statistics of every thread so far, as a JSON-serializable dict
+    def snapshot(self):
+        stats = HotPathStats()
+        stats.merge(self.stats)
+        for fork in self.forks:
+            stats.merge(fork)
+        for source in self.sources:
+            for counter, value in source().items():
+                stats.counters[counter] += value
+
+        stages = {}
+        for stage in STAGES:
+            histogram = stats.histograms[stage]
+            count = sum(histogram)
+            if not count:
+                continue
+            stages[stage] = {
+                'count': count,
+                'total_ms': stats.total_ns[stage] / 1e6,
+                'mean_us': stats.total_ns[stage] / count / 1e3,
+                'p50_us': HistogramPercentile(histogram, count, 0.5),
+                'p90_us': HistogramPercentile(histogram, count, 0.9),
+                'p99_us': HistogramPercentile(histogram, count, 0.99),
+                'max_us': HistogramPercentile(histogram, count, 1.0),
+                'histogram': {str(1 << i): bucket_count for i, bucket_count in enumerate(histogram)
+                              if bucket_count},  # ... {bucket upper bound in ns: count}
+            }
+        return {'seconds': time.monotonic() - self.start_time, 'counters': stats.counters, 'stages': stages}
+
+    def dump(self):
+        snapshot = self.snapshot()
+        path = '{0}/{1}-hotpath.json'.format(self.logs_dir, self.name)
+        write_atomic(path, json.dumps(snapshot, indent=1))
+        log.info("Hot path %s, %s; dumped to %s",
+                 ' '.join('{0}={1}'.format(counter, value) for counter, value in snapshot['counters'].items()),
+                 ' '.join('{0}={1:.1f}/{2:.1f}us'.format(stage, times['p50_us'], times['p99_us'])
+                          for stage, times in snapshot['stages'].items()),
+                 path, extra={'kind': 'hotpath'})
+
+    # Stop the profiler if it runs, and dump the statistics
+    def close(self):
+        if self.profile is not None:
+            self.toggle_profile()
+        self.dump()
@@ -0,0 +1,84 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+from p4.v1 import p4runtime_pb2 as p4rt
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# PacketOut metadata IDs (see the "packet_out" controller header in cfg/*-p4info.txt)
+METADATA_ID_MCAST_GRP = 1
+METADATA_ID_INGRESS_PORT = 2
+METADATA_ID_EGRESS_PORT = 4
+
+
+###############################################################################
+# PacketOut builder
+###############################################################################
+
+# Builds PacketOut stream requests from cached metadata.
+#
+# The metadata of a (multicast group, ingress port, egress port) combination is
+# encoded once; each packet then builds a new request, sets its payload and
+# appends copies of the cached PacketMetadata messages, instead of encoding the
+# values again. (Parsing a serialized template per packet is slower than that.)
+class PacketOutBuilder:
+    def __init__(self):
+        self.metadata = {}
+
+    # PacketMetadata messages of a combination
+    @staticmethod
+    def encode(mcast_grp, ingress_port, egress_port):
+        return [p4rt.PacketMetadata(metadata_id=metadata_id, value=value.to_bytes(2, byteorder='big'))
+                for metadata_id, value in ((METADATA_ID_MCAST_GRP, mcast_grp),
+                                           (METADATA_ID_INGRESS_PORT, ingress_port),
+                                           (METADATA_ID_EGRESS_PORT, egress_port))
+                if value is not None]
+
+    # Stream request sending a payload out of a multicast group or egress port
+    def build(self, payload, mcast_grp=0, ingress_port=None, egress_port=None):
+        key = (mcast_grp, ingress_port, egress_port)
+        metadata = self.metadata.get(key)
+        if metadata is None:
+            metadata = self.metadata[key] = self.encode(*key)
+        req = p4rt.StreamMessageRequest()
+        packet = req.packet
+        packet.payload = payload
+        packet.metadata.extend(metadata)
+        return req
+
+
+###############################################################################
+# PacketOut sender
+###############################################################################
+
+# Sends PacketOuts on the P4Runtime stream queue, each built as it is sent.
+#
+# The stream's gRPC thread serializes the requests; another thread building
+# them would not overlap with it (both hold the GIL), so the requests are built
+# in the caller's thread, and never buffered on the way to the stream queue.
+class PacketOutSender:
+    def __init__(self, stream_out_q):
+        self.put = stream_out_q.put
+        self.build = PacketOutBuilder().build
+
+    # Send a payload out of a multicast group or egress port
+    def send(self, payload, mcast_grp=0, ingress_port=None, egress_port=None):
+        self.put(self.build(payload, mcast_grp, ingress_port, egress_port))
@@ -0,0 +1,187 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import time
+import queue
+import threading
+from ethernet import VLAN_ID_MASK, parse_eth
+from ratelog import get_logger
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# PacketIns drained from the gRPC stream at once, and seconds to wait for one
+MAX_BURST_SIZE = 256
+RECEIVE_TIMEOUT = 1
+
+# Bursts a decision stage may fall behind by
+MAX_STAGE_QUEUE = 64
+
+
+###############################################################################
+# Stage queues
+###############################################################################
+
+# Bounded queue between two stages, keeping depth metrics: the deepest it has
+# been and how many puts found it full (i.e. had to wait on the next stage).
+# Counters are updated without a lock, so with several producers they are
+# approximate.
+class StageQueue(queue.Queue):
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.num_puts = 0
+        self.num_full = 0
+        self.high_water = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.full():
+            self.num_full += 1
+        super().put(item, block, timeout)
+        self.num_puts += 1
+        depth = self.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+
+    # Current depth, deepest depth, puts and puts that found the queue full
+    def metrics(self):
+        return self.qsize(), self.high_water, self.num_puts, self.num_full
+
+
+###############################################################################
+# Packet pipeline
+###############################################################################
+
+# Runs the PacketIn loop as a pipeline of threads:
+#
+# - the receiver drains the gRPC stream queue in bursts of up to `max_burst`
+#   PacketIns, parses them and splits each burst by VLAN over the stages;
+# - each decision stage owns the VLANs with `vlan_id % len(stages)` equal to
+#   its index, so its FDB is only ever touched by its own thread;
+# - the stages send their PacketOuts through a shared PacketOutSender, which
+#   builds them straight onto the P4Runtime stream queue.
+#
+# A stage is an object with `process(seq, packets)`, called with the global
+# sequence number of the last packet received and a list of
+# (seq, payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id), and
+# `close()`. An empty list is an idle tick, sent to every stage when no
+# PacketIn arrived for `timeout` seconds.
+# The receiver stops, and the stages drain and close, when the stream closes
+# (p4runtime_sh queues a None); `receiving()` tells whether it still runs.
+# The receiver times its bursts in `stats` (see hotpath.HotPathStats), if any.
+class PacketPipeline:
+    def __init__(self, stream_in_q, stages, max_burst=MAX_BURST_SIZE,
+                 max_queue=MAX_STAGE_QUEUE, timeout=RECEIVE_TIMEOUT, stats=None):
+        self.stream_in_q = stream_in_q
+        self.stages = stages
+        self.stats = stats
+        self.max_burst = max_burst
+        self.timeout = timeout
+        self.queues = [StageQueue(max_queue) for _ in stages]
+        self.num_received = 0
+        self.num_bursts = 0
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=self.receive, name='pipeline-receiver', daemon=True)]
+        for i in range(len(stages)):
+            self.threads.append(threading.Thread(target=self.decide, args=(i,),
+                                                 name='pipeline-stage-{0}'.format(i), daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    # Whether the receiver still runs, i.e. the stream is open and not stopped
+    def receiving(self):
+        return self.threads[0].is_alive()
+
+    # Stop receiving, let the stages drain their queues, and close them
+    def stop(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+
+    # Receiver stage
+    def receive(self):
+        get = self.stream_in_q.get
+        get_nowait = self.stream_in_q.get_nowait
+        num_stages = len(self.stages)
+        seq = 0
+        closed = False
+        while not closed and not self.stopped.is_set():
+            try:
+                burst = [get(timeout=self.timeout)]
+            except queue.Empty:
+                for stage_q in self.queues:
+                    stage_q.put((seq, []))
+                continue
+            start = time.perf_counter_ns()  # ... the wait for the first PacketIn is not timed
+            try:
+                while burst[-1] is not None and len(burst) < self.max_burst:
+                    burst.append(get_nowait())
+            except queue.Empty:
+                pass
+            if burst[-1] is None:  # ... the stream is closed
+                burst.pop()
+                closed = True
+                log.error("PacketIn stream closed", extra={'kind': 'error'})
+            if self.stats is not None:
+                start = self.stats.record('receive', start)
+
+            shards = [[] for _ in range(num_stages)]
+            for rep in burst:
+                payload = rep.packet.payload
+                ingress_port = int.from_bytes(rep.packet.metadata[0].value, byteorder='big')
+                dst_mac, src_mac, _, vlan_tci, eth_type = parse_eth(payload)
+                vlan_id = 0 if vlan_tci is None else vlan_tci & VLAN_ID_MASK
+                seq += 1
+                shards[vlan_id % num_stages].append(
+                    (seq, payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id))
+            if self.stats is not None:
+                self.stats.count('packets', len(burst))
+                self.stats.record('parse', start)
+            for stage_q, packets in zip(self.queues, shards):
+                if packets:
+                    stage_q.put((seq, packets))
+            self.num_received = seq
+            self.num_bursts += 1
+
+        for stage_q in self.queues:
+            stage_q.put(None)
+
+    # Decision stage
+    def decide(self, i):
+        stage = self.stages[i]
+        stage_q = self.queues[i]
+        while True:
+            item = stage_q.get()
+            if item is None:
+                break
+            stage.process(*item)
+        stage.close()
+
+    # Log the packets received and the depth of each stage queue
+    def log_metrics(self):
+        queues = [('stage{0}'.format(i), stage_q) for i, stage_q in enumerate(self.queues)]
+        log.info("Pipeline: received=%d bursts=%d queues (depth/max/puts/full): %s",
+                 self.num_received, self.num_bursts,
+                 ' '.join('{0}={1}/{2}/{3}/{4}'.format(name, *stage_q.metrics())
+                          for name, stage_q in queues),
+                 extra={'kind': 'pipeline'})
@@ -0,0 +1,213 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import sys
+import time
+import queue
+import logging
+import threading
+import logging.handlers
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Name of the controller logger
+LOGGER_NAME = 'controller'
+
+# Records per second (and burst) let through for each message type
+LOG_RATE = 100
+LOG_BURST = 200
+
+# Seconds between two summary lines, and records buffered for the writer thread
+LOG_SUMMARY_INTERVAL = 10
+LOG_QUEUE_SIZE = 10000
+
+# Record layout; `kind` is the message type passed with extra={'kind': ...}
+LOG_FORMAT = '%(levelname)s: %(message)s'
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Logger used by the controllers
+def get_logger():
+    return logging.getLogger(LOGGER_NAME)
+
+# Log argument formatted by the writer thread only, e.g. Lazy(mac2str, mac)
+class Lazy:
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+# Parse 'kind=N' sampling options into {kind: N}
+def parse_samples(samples):
+    sample_map = {}
+    for sample in samples or []:
+        kind, _, every = sample.partition('=')
+        sample_map[kind] = int(every)
+    return sample_map
+
+
+###############################################################################
+# Rate limiting
+###############################################################################
+
+# Token bucket: `rate` tokens per second, holding at most `burst` tokens
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    # Take a token if one is available
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+# Filter sampling and rate-limiting records per message type.
+#
+# A type sampled 1-in-N only lets every Nth record through; the records left
+# then have to take a token from the type's bucket. Counters of seen and
+# suppressed records are kept per type for the summary line. Runs in the
+# calling thread, so suppressed records are never queued nor formatted.
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate=LOG_RATE, burst=LOG_BURST, samples=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.samples = samples or {}
+        self.buckets = {}
+        self.seen = {}
+        self.suppressed = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        kind = getattr(record, 'kind', record.levelname)
+        seen = self.seen.get(kind, 0) + 1
+        self.seen[kind] = seen
+
+        every = self.samples.get(kind)
+        if every and seen % every:
+            self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+            return False
+
+        bucket = self.buckets.get(kind)
+        if bucket is None:
+            bucket = self.buckets[kind] = TokenBucket(self.rate, self.burst)
+        if not bucket.take(time.monotonic()):
+            self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+            return False
+        return True
+
+    # Counters since the last call, as {kind: (seen, suppressed)}, and dropped records
+    def collect(self):
+        seen, self.seen = self.seen, {}
+        suppressed, self.suppressed = self.suppressed, {}
+        dropped, self.dropped = self.dropped, 0
+        return {kind: (count, suppressed.get(kind, 0)) for kind, count in seen.items()}, dropped
+
+
+###############################################################################
+# Background writer
+###############################################################################
+
+# Queue handler that leaves formatting to the writer thread, and drops (and
+# counts) records instead of blocking when the writer falls behind
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, rate_filter):
+        super().__init__(log_queue)
+        self.rate_filter = rate_filter
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.rate_filter.dropped += 1
+
+
+# Controller logging: levels, per-type sampling and rate limiting, records
+# formatted and written by a background thread, and a summary line with the
+# per-type counters every `interval` seconds.
+class ControllerLog:
+    def __init__(self, level='INFO', rate=LOG_RATE, burst=LOG_BURST, samples=None,
+                 interval=LOG_SUMMARY_INTERVAL, stream=None):
+        self.logger = get_logger()
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+
+        self.rate_filter = RateLimitFilter(rate, burst, samples)
+        self.logger.addFilter(self.rate_filter)
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.handler = DeferredQueueHandler(log_queue, self.rate_filter)
+        self.logger.addHandler(self.handler)
+
+        writer = logging.StreamHandler(stream or sys.stdout)
+        writer.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.listener = logging.handlers.QueueListener(log_queue, writer)
+        self.listener.start()
+
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='log-summary', daemon=True)
+        self.thread.start()
+
+    # Write the summary line, bypassing the rate limit
+    def summarize(self):
+        counters, dropped = self.rate_filter.collect()
+        if not counters and not dropped:
+            return
+        fields = ' '.join('{0}={1}/{2}'.format(kind, seen - suppressed, seen)
+                          for kind, (seen, suppressed) in sorted(counters.items()))
+        record = self.logger.makeRecord(
+            self.logger.name, logging.INFO, __file__, 0,
+            'Log summary (written/seen): %s dropped=%d', (fields, dropped), None)
+        self.handler.handle(record)
+
+    # Summary thread
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.summarize()
+
+    # Write a final summary and flush the writer thread
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.summarize()
+        self.listener.stop()
+        self.logger.removeHandler(self.handler)
+        self.logger.removeFilter(self.rate_filter)
@@ -0,0 +1,230 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import json
+import queue
+import threading
+from ethernet import mac2str
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Compact the change log into a full snapshot every so many commits, or as soon
+# as it holds that many records
+COMPACT_EVERY_COMMITS = 100
+COMPACT_MAX_RECORDS = 10000
+
+# Entries up to which the table is small enough to be written out as a full
+# snapshot on every commit with changes
+COMPACT_MAX_ENTRIES = 1000
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Write a file atomically: write a temporary file, sync it, then rename it over
+def write_atomic(path, data):
+    tmp_path = '{0}.tmp'.format(path)
+    with open(tmp_path, 'w') as outfile:
+        outfile.write(data)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+# Apply a change record to a table of {[vlan:] {mac: {'port': port}}}; returns
+# the change in the number of entries
+def apply_change(table, record):
+    *path, mac = record['key']
+    node = table
+    for part in path:
+        node = node.setdefault(part, {})
+    if record['op'] == 'expire':
+        if node.pop(mac, None) is None:
+            return 0
+        if path and not node:
+            del table[path[0]]
+        return -1
+    num_added = 0 if mac in node else 1
+    node[mac] = {'port': record['port']}
+    return num_added
+
+# Load a table from its snapshot and replay its change log on top of it; a
+# last record cut short (e.g. by a crash while appending) is skipped
+def load_table(snapshot_path, changes_path):
+    with open(snapshot_path, 'r') as infile:
+        table = json.load(infile)
+    if os.path.exists(changes_path):
+        with open(changes_path, 'r') as infile:
+            for line in infile:
+                if not line.endswith('\n'):
+                    break
+                apply_change(table, json.loads(line))
+    return table
+
+
+###############################################################################
+# Snapshot writer
+###############################################################################
+
+# Records learned, moved and expired entries of the table `name`, and hands
+# them over in commits to the queue of a SnapshotWriter. Each thread recording
+# changes needs its own ChangeLog (see SnapshotWriter.fork).
+class ChangeLog:
+    def __init__(self, commits, name=None):
+        self.changes = []
+        self.commits = commits
+        self.name = name
+
+    # Record a learned entry; nothing is logged if it was already learned on that port
+    def learned(self, mac, port, old_port=None, vlan=None):
+        if old_port is None:
+            self.changes.append(('learn', vlan, mac, port))
+        elif old_port != port:
+            self.changes.append(('move', vlan, mac, port))
+
+    # Record an expired entry
+    def expired(self, mac, port, vlan=None):
+        self.changes.append(('expire', vlan, mac, port))
+
+    # Hand the changes recorded so far to the background thread
+    def commit(self):
+        self.commits.put((self.name, self.changes))
+        self.changes = []
+
+
+# Files of one table logged by a SnapshotWriter, with the writer's own copy of
+# the table; only used by the background thread
+class TableLog:
+    def __init__(self, logs_dir, name, compact_every, compact_max_records, compact_max_entries):
+        self.snapshot_path = '{0}/{1}.json'.format(logs_dir, name)
+        self.changes_path = '{0}/{1}.changes.jsonl'.format(logs_dir, name)
+        self.compact_every = compact_every
+        self.compact_max_records = compact_max_records
+        self.compact_max_entries = compact_max_entries
+        self.table = {}
+        self.num_entries = 0
+        self.num_commits = 0
+        self.num_records = 0
+
+    # Write the full table and start a new change log
+    def compact(self):
+        write_atomic(self.snapshot_path, json.dumps(self.table))
+        write_atomic(self.changes_path, '')
+        self.num_commits = 0
+        self.num_records = 0
+
+    # Apply and write out the changes of a commit
+    def commit(self, changes):
+        self.num_commits += 1
+        if not changes:
+            return
+        records = []
+        for op, vlan, mac, port in changes:
+            key = [mac2str(mac)] if vlan is None else [str(vlan), mac2str(mac)]
+            record = {'op': op, 'key': key, 'port': port}
+            self.num_entries += apply_change(self.table, record)
+            records.append(record)
+        self.num_records += len(records)
+
+        # A small table is written out whole, instead of appending to the log
+        if self.num_entries <= self.compact_max_entries or \
+           self.num_records >= self.compact_max_records or self.num_commits >= self.compact_every:
+            self.compact()
+        else:
+            with open(self.changes_path, 'a') as outfile:
+                outfile.write(''.join(json.dumps(record) + '\n' for record in records))
+
+
+# Logs the Ethernet address to port mapping without blocking packet processing.
+#
+# The packet-processing loop records learned, moved and expired entries, which
+# only appends a tuple to a list; `commit` hands that list to a background
+# thread in O(1), never waiting on it. The thread appends the changes to an
+# append-only change log (`<name>.changes.jsonl`, one JSON record per line)
+# and keeps its own copy of the table, which it writes out as a full snapshot
+# (`<name>.json`) with an atomic rename before truncating the log: on every
+# commit with changes while the table is small (`compact_max_entries`), so that
+# the snapshot alone is current, and periodically otherwise. Replaying the log
+# over the snapshot (`load_table`) gives the table as of the last commit.
+#
+# One writer, and its one thread, can log many tables (e.g. one per switch of
+# a fabric): `open` returns the ChangeLog of another table. Given a `name`, the
+# writer is itself the ChangeLog of that table.
+class SnapshotWriter(ChangeLog):
+    def __init__(self, logs_dir, name=None, compact_every=COMPACT_EVERY_COMMITS,
+                 compact_max_records=COMPACT_MAX_RECORDS, compact_max_entries=COMPACT_MAX_ENTRIES):
+        super().__init__(queue.SimpleQueue(), name)
+        self.logs_dir = logs_dir
+        self.compact_every = compact_every
+        self.compact_max_records = compact_max_records
+        self.compact_max_entries = compact_max_entries
+        self.tables = {}  # ... by name, only used by the background thread
+        self.thread = threading.Thread(target=self.run, name='snapshot', daemon=True)
+        self.thread.start()
+        if name is not None:
+            self.open(name)
+
+    # Change log of the table `name`, written out by this writer; it must be
+    # committed a last time before the writer is closed
+    def open(self, name):
+        self.commits.put((name, None))
+        return ChangeLog(self.commits, name)
+
+    # Change log for another thread, committing to the table of this writer
+    def fork(self):
+        return ChangeLog(self.commits, self.name)
+
+    # Commit, then wait for the background thread to write final snapshots
+    def close(self):
+        if self.name is not None:
+            self.commit()
+        self.commits.put(None)
+        self.thread.join()
+
+    # Background thread
+    def run(self):
+        closing = False
+        while not closing:
+            # Coalesce the commits that queued up while writing, per table
+            commits = {}
+            message = self.commits.get()
+            while True:
+                if message is None:
+                    closing = True
+                    break
+                name, changes = message
+                if changes is None:
+                    table = TableLog(self.logs_dir, name, self.compact_every,
+                                     self.compact_max_records, self.compact_max_entries)
+                    table.compact()
+                    self.tables[name] = table
+                else:
+                    commits.setdefault(name, []).extend(changes)
+                if self.commits.empty():
+                    break
+                message = self.commits.get()
+
+            for name, changes in commits.items():
+                self.tables[name].commit(changes)
+
+        for table in self.tables.values():
+            table.compact()
@@ -19,10 +19,23 @@
 ## Done by Shourya Verma
 #############################################################################
 
-import json
+import time
+import logging
 import argparse
+import grpc
 import p4runtime_sh.shell as p4sh
-from p4.v1 import p4runtime_pb2 as p4rt
+from p4runtime_sh.p4runtime import P4RuntimeException, P4RuntimeWriteException
+from aging import AgingWheel, IdleAgingWheel
+from ethernet import ETH_TYPE_ARP, VLAN_ID_MASK, mac2str, parse_eth
+from fdb import ForwardingDatabase
+from packetout import PacketOutSender
+from pipeline import PacketPipeline
+from snapshot import SnapshotWriter
+from hotpath import PROFILER, PROFILERS, HotPathMonitor
+from topoconfig import TOPO_WATCH_INTERVAL, DiffGroups, LoadSwitchConfig, TopoConfigWatcher
+from ratelog import LOG_RATE, ControllerLog, Lazy, get_logger, parse_samples
+
+log = get_logger()
 
 ###############################################################################
 # Default parameters
@@ -39,19 +52,18 @@ BRIDGE_ID = 1
 NUM_ENTRIES_THRESHOLD = 100
 NUM_LOGS_THRESHOLD = 10
 
-# Ethernet type values (https://en.wikipedia.org/wiki/EtherType)
-# - ARP: 0x0806
-ETH_TYPE_ARP = 0x0806
-ETH_TYPE_VLAN = 0x8100
+# Log level of the controller messages (per-packet messages are logged at DEBUG)
+LOG_LEVEL = 'INFO'
 
+# Aging mode ('packets': after NUM_ENTRIES_THRESHOLD packets, 'idle': after IDLE_TIMEOUT 
+# seconds without being refreshed)
+AGING_MODE = 'packets'
+IDLE_TIMEOUT = 300
 
-###############################################################################
-# Helper functions
-###############################################################################
-
-# MAC address in bytes to string
-def mac2str(mac):
-	return ':'.join('{:02x}'.format(b) for b in mac)
+# Decision stages of the pipelined mode (0: process packets serially), and seconds
+# between two pipeline metrics lines
+PIPELINE_STAGES = 0
+PIPELINE_METRICS_INTERVAL = 10
 
 
 ###############################################################################
@@ -65,25 +77,107 @@ def InstallMcastGrpEntry(mcast_group_id, bridge_ports):
 		mcast_entry.add(port)
 	mcast_entry.insert()
 
+# Change the ports of a multicast group entry
+def ModifyMcastGrpEntry(mcast_group_id, bridge_ports):
+	mcast_entry = p4sh.MulticastGroupEntry(mcast_group_id)
+	for port in bridge_ports:
+		mcast_entry.add(port)
+	mcast_entry.modify()
+
 # Delete a multicast group entry
 def DeleteMcastGrpEntry(mcast_group_id):
 	mcast_entry = p4sh.MulticastGroupEntry(mcast_group_id)
 	mcast_entry.delete()
 
+# Write only the multicast groups that differ between two switch configs: the
+# broadcast group, and the group of each VLAN (with the VLAN ID as group ID)
+def UpdateMcastGrpEntries(old_config, new_config):
+	old_groups = dict(old_config.vlan_id_to_ports_map)
+	old_groups[old_config.mcast_group_id] = old_config.mcast_group_ports
+	new_groups = dict(new_config.vlan_id_to_ports_map)
+	new_groups[new_config.mcast_group_id] = new_config.mcast_group_ports
+
+	inserted, modified, deleted = DiffGroups(old_groups, new_groups)
+	for mcast_group_id, ports in inserted.items():
+		InstallMcastGrpEntry(mcast_group_id, ports)
+	for mcast_group_id, ports in modified.items():
+		ModifyMcastGrpEntry(mcast_group_id, ports)
+	for mcast_group_id in deleted:
+		DeleteMcastGrpEntry(mcast_group_id)
+	log.info("Multicast groups: %d inserted, %d modified, %d deleted", len(inserted), len(modified),
+			 len(deleted), extra={'kind': 'reload'})
+
 
 ###############################################################################
 # Packet processing functions
 ###############################################################################
 
+# Learn and forward a parsed packet, sending it out through `send`, and count
+# the floods and drops in `stats`
+def ProcPacket(send, snapshot, stats,
+			   eth_to_port_map, vlan_id_to_ports_map, mcast_group_id,
+			   payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id):
+	if eth_type == ETH_TYPE_ARP:
+		if log.isEnabledFor(logging.DEBUG):
+			log.debug("ARP packet received - vlan_id=%d", vlan_id, extra={'kind': 'arp'})
+			log.debug("VLAN ports map: %s", vlan_id_to_ports_map, extra={'kind': 'arp'})
+		# Handle ARP request
+		# Learn the Ethernet address to port mapping
+		old_port = eth_to_port_map.learn(vlan_id, src_mac, ingress_port)
+		snapshot.learned(src_mac, ingress_port, old_port, vlan_id)
+
+		# # For broadcast, always use the default multicast group ID for untagged traffic
+		vlan_ports = vlan_id_to_ports_map.get(vlan_id)  # ... one lookup, as a reload may change the map
+		if vlan_ports is not None:
+			log.debug("Broadcasting ARP in VLAN %d to ports %s", vlan_id,
+					  vlan_ports, extra={'kind': 'arp'})
+			mcast_grp = vlan_id
+		else:
+			mcast_grp = mcast_group_id
+		send(payload, mcast_grp, ingress_port)
+		stats.count('floods')
+
+	else:
+		# Handle other packets
+		egress_port = eth_to_port_map.lookup(vlan_id, dst_mac)
+		if egress_port is not None:
+			# Forward packet using learned mapping
+			if egress_port != ingress_port:
+				send(payload, 0, ingress_port, egress_port)
+			else:
+				stats.count('drops')  # ... back out of its ingress port
+		else:
+			log.debug("Dropping packet: VLAN %d, dst_mac %s not found", vlan_id,
+					  Lazy(mac2str, dst_mac), extra={'kind': 'drop'})
+			stats.count('drops')
+
 # Process incoming packets
 def ProcPacketIn(switch_name, mcast_group_id,
-				 eth_to_port_map, num_entries_threshold, 
-				 vlan_id_to_ports_map,
+				 eth_to_port_map,
+				 vlan_id_to_ports_map, topo_watcher, hotpath,
 				 logs_dir, num_logs_threshold):
+	packet_out = PacketOutSender(p4sh.client.stream_out_q)
+	snapshot = SnapshotWriter(logs_dir, '{0}-table'.format(switch_name))
+	stats = hotpath.stats
 	try:
 		logs_count = 0
 		while True:
-			rep = p4sh.client.get_stream_packet("packet", timeout=1)
+			# Time the dequeue of a PacketIn already waiting, not the wait for one
+			start = time.perf_counter_ns()
+			rep = p4sh.client.get_stream_packet("packet", timeout=0)
+			if rep is not None:
+				now = stats.record('receive', start)
+			else:
+				rep = p4sh.client.get_stream_packet("packet", timeout=1)
+				now = time.perf_counter_ns()
+
+			# Age table entries, also on idle ticks (only those expiring now are visited)
+			for vlan, mac, port in eth_to_port_map.expire(0 if rep is None else 1):
+				log.info("Flow entry deleted: vlan=%d mac=%s port=%d",
+						 vlan, Lazy(mac2str, mac), port, extra={'kind': 'flow_deleted'})
+				snapshot.expired(mac, port, vlan)
+			now = stats.record('aging', now)
+
 			if rep is not None:
 				# Read the raw packet
 				payload = rep.packet.payload
@@ -100,65 +194,27 @@ def ProcPacketIn(switch_name, mcast_group_id,
 				# NOTE: please follow p4rt-src/bridge.py for a reference example
 
 				# Parse Metadata
-				ingress_port_in_bytes = rep.packet.metadata[0].value
-				ingress_port = int.from_bytes(ingress_port_in_bytes, byteorder='big')
-
-				payload_offset = 0
-
-				# Parse Ethernet Header
-				dst_mac_in_bytes = payload[payload_offset:payload_offset+6]
-				dst_mac = mac2str(dst_mac_in_bytes)
-				payload_offset += 6
-
-				src_mac_in_bytes = payload[payload_offset:payload_offset+6]
-				src_mac = mac2str(src_mac_in_bytes)
-				payload_offset += 6
-
-				eth_type_in_bytes = payload[payload_offset:payload_offset+2]
-				eth_type = int.from_bytes(eth_type_in_bytes, byteorder='big')
-				payload_offset += 2
-
-				vlan_id = None
-
-				# Check for VLAN Tag
-				if eth_type == ETH_TYPE_VLAN:
-					# VLAN Tag is present
-					vlan_tag_in_bytes = payload[payload_offset:payload_offset+2]
-					vlan_tag = int.from_bytes(vlan_tag_in_bytes, byteorder='big')
-					vlan_id = vlan_tag & 0x0FFF  # Lower 12 bits
-					payload_offset += 2
-
-					# Read the encapsulated EtherType
-					eth_type_in_bytes = payload[payload_offset:payload_offset+2]
-					eth_type = int.from_bytes(eth_type_in_bytes, byteorder='big')
-					payload_offset += 2
+				ingress_port = int.from_bytes(rep.packet.metadata[0].value, byteorder='big')
+
+				# Parse Ethernet and VLAN headers (MAC addresses as integers; eth_type is the
+				# encapsulated EtherType for tagged packets)
+				dst_mac, src_mac, _, vlan_tci, eth_type = parse_eth(payload)
+				if vlan_tci is not None:
+					vlan_id = vlan_tci & VLAN_ID_MASK  # Lower 12 bits
 				else:
 					vlan_id = 0  # Default VLAN
 
-				print("PacketIn: dst={0} src={1} eth_type={2:#06x} vlan_id={3} ingress_port={4}".format(
-					dst_mac, src_mac, eth_type, vlan_id, ingress_port))
+				if log.isEnabledFor(logging.DEBUG):
+					log.debug("PacketIn: dst=%s src=%s eth_type=%#06x vlan_id=%d ingress_port=%d",
+							  Lazy(mac2str, dst_mac), Lazy(mac2str, src_mac), eth_type, vlan_id,
+							  ingress_port, extra={'kind': 'packet_in'})
 
 				##################################################################################
 				# Packet parsing logic - Ends ####################################################
 				##################################################################################
 
-				# Decrement table entry's counter
-
-				del_vlans = []
-				for vlan in eth_to_port_map:
-					del_mac_list = []
-					for mac in eth_to_port_map[vlan]:
-						eth_to_port_map[vlan][mac]['count'] -= 1
-						if eth_to_port_map[vlan][mac]['count'] == 0:
-							print("INFO: Flow entry deleted: vlan={0} mac={1} port={2}".format(
-								vlan, mac, eth_to_port_map[vlan][mac]['port']))
-							del_mac_list.append(mac)
-					for mac in del_mac_list:
-						del eth_to_port_map[vlan][mac]
-					if not eth_to_port_map[vlan]:
-						del_vlans.append(vlan)
-				for vlan in del_vlans:
-					del eth_to_port_map[vlan]
+				stats.count('packets')
+				now = stats.record('parse', now)
 
 				##################################################################################
 				# Learning switch logic - Begins #################################################
@@ -177,34 +233,10 @@ def ProcPacketIn(switch_name, mcast_group_id,
 				#   - if no mapping exists, drop the packet (we haven't received an ARP request for 
 				#     it yet)
 				
-				if eth_type == ETH_TYPE_ARP:
-					print(f"DEBUG: ARP packet received - vlan_id={vlan_id}")
-					print(f"DEBUG: VLAN ports map: {vlan_id_to_ports_map}")
-					# Handle ARP request
-					# Learn the Ethernet address to port mapping
-					if vlan_id not in eth_to_port_map:
-						eth_to_port_map[vlan_id] = {}
-					eth_to_port_map[vlan_id][src_mac] = {'port': ingress_port,
-														'count': num_entries_threshold}
-
-					# # For broadcast, always use the default multicast group ID for untagged traffic
-					if vlan_id in vlan_id_to_ports_map:
-						print(f"DEBUG: Broadcasting ARP in VLAN {vlan_id} to ports {vlan_id_to_ports_map[vlan_id]}")
-						mcast_grp_in_bytes = vlan_id.to_bytes(2, byteorder='big')
-					else:
-						mcast_grp_in_bytes = mcast_group_id.to_bytes(2, byteorder='big')
-					ProcPacketOut(payload, mcast_grp_in_bytes, ingress_port_in_bytes)
-
-				else:
-					# Handle other packets
-					if vlan_id in eth_to_port_map and dst_mac in eth_to_port_map[vlan_id]:
-						# Forward packet using learned mapping
-						egress_port = eth_to_port_map[vlan_id][dst_mac]['port']
-						if egress_port != ingress_port:
-							egress_port_in_bytes = egress_port.to_bytes(2, byteorder='big')
-							ProcPacketOut(payload, b'\x00\x00', ingress_port_in_bytes, egress_port_in_bytes)
-					else:
-						print(f"Dropping packet: VLAN {vlan_id}, dst_mac {dst_mac} not found")
+				ProcPacket(packet_out.send, snapshot, stats,
+						   eth_to_port_map, vlan_id_to_ports_map, mcast_group_id,
+						   payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id)
+				now = stats.record('learn', now)
 
 				##################################################################################
 				# Learning switch logic - Ends ###################################################
@@ -214,38 +246,110 @@ def ProcPacketIn(switch_name, mcast_group_id,
 			logs_count += 1
 			if logs_count == num_logs_threshold:
 				logs_count = 0
-				with open('{0}/{1}-table.json'.format(logs_dir, switch_name), 'w') as outfile:
-					json.dump(eth_to_port_map, outfile)
+				snapshot.commit()  # ... written out in the background
 
-				print(
-					"INFO: Logs committed to {0}/{1}-table.json".format(logs_dir, switch_name))
+				log.info("Logs committed to %s/%s-table.json and .changes.jsonl",
+						 logs_dir, switch_name, extra={'kind': 'logs'})
+
+			# Apply the changes of the topo config, if any
+			topo_watcher.check()
+
+			# Start or stop the profiler, or dump the hot path stats, if signaled
+			hotpath.check()
+	except KeyboardInterrupt:
+		return None
+	finally:
+		snapshot.close()
+
+
+# Decision stage of the pipelined mode: learns and forwards the packets of the
+# VLANs assigned to it, with an FDB and change log of its own
+class SwitchStage:
+	def __init__(self, switch_name, mcast_group_id,
+				 eth_to_port_map, vlan_id_to_ports_map,
+				 snapshot, packet_out, stats,
+				 logs_dir, num_logs_threshold):
+		self.switch_name = switch_name
+		self.mcast_group_id = mcast_group_id
+		self.eth_to_port_map = eth_to_port_map
+		self.vlan_id_to_ports_map = vlan_id_to_ports_map
+		self.changes = snapshot.fork()
+		self.packet_out = packet_out
+		self.stats = stats
+		self.logs_dir = logs_dir
+		self.num_logs_threshold = num_logs_threshold
+		self.logs_count = 0
+		self.seq = 0
+
+	# Age table entries up to the global packet `seq`, as the serial loop would have
+	def age(self, seq):
+		for vlan, mac, port in self.eth_to_port_map.expire(seq - self.seq):
+			log.info("Flow entry deleted: vlan=%d mac=%s port=%d",
+					 vlan, Lazy(mac2str, mac), port, extra={'kind': 'flow_deleted'})
+			self.changes.expired(mac, port, vlan)
+		self.seq = seq
+
+	# Commit the change log every `num_logs_threshold` packets or idle ticks
+	def count(self):
+		self.logs_count += 1
+		if self.logs_count == self.num_logs_threshold:
+			self.logs_count = 0
+			self.changes.commit()
+
+			log.info("Logs committed to %s/%s-table.json and .changes.jsonl",
+					 self.logs_dir, self.switch_name, extra={'kind': 'logs'})
+
+	def process(self, seq, packets):
+		if not packets:
+			self.age(seq)  # ... idle tick
+			self.count()
+		stats = self.stats
+		now = time.perf_counter_ns()
+		for packet_seq, payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id in packets:
+			self.age(packet_seq)
+			now = stats.record('aging', now)
+			ProcPacket(self.packet_out.send, self.changes, stats,
+					   self.eth_to_port_map, self.vlan_id_to_ports_map, self.mcast_group_id,
+					   payload, ingress_port, dst_mac, src_mac, eth_type, vlan_id)
+			now = stats.record('learn', now)
+			self.count()
+
+	def close(self):
+		self.changes.commit()
+
+
+# Process incoming packets in a pipeline: a receiver thread, one decision thread
+# per FDB in `eth_to_port_maps` (VLANs are split over them)
+def ProcPacketInPipelined(switch_name, mcast_group_id,
+						  eth_to_port_maps,
+						  vlan_id_to_ports_map, topo_watcher, hotpath,
+						  logs_dir, num_logs_threshold):
+	packet_out = PacketOutSender(p4sh.client.stream_out_q)
+	snapshot = SnapshotWriter(logs_dir, '{0}-table'.format(switch_name))
+	stages = [SwitchStage(switch_name, mcast_group_id,
+						  eth_to_port_map, vlan_id_to_ports_map,
+						  snapshot, packet_out, hotpath.fork(),
+						  logs_dir, num_logs_threshold) for eth_to_port_map in eth_to_port_maps]
+	pipeline = PacketPipeline(p4sh.client.stream_in_q['packet'], stages, stats=hotpath.fork())
+	pipeline.start()
+	try:
+		metrics_deadline = time.monotonic() + PIPELINE_METRICS_INTERVAL
+		while True:
+			topo_watcher.reload_requested.wait(1)  # ... or less, on SIGHUP
+			if not pipeline.receiving():
+				return None  # ... the stream is closed
+			topo_watcher.check()
+			hotpath.check()
+			if time.monotonic() >= metrics_deadline:
+				metrics_deadline += PIPELINE_METRICS_INTERVAL
+				pipeline.log_metrics()
 	except KeyboardInterrupt:
 		return None
+	finally:
+		pipeline.stop()
+		pipeline.log_metrics()
+		snapshot.close()
 
-# Process outgoing packets
-def ProcPacketOut(payload, mcast_grp_in_bytes=b'\00\00', ingress_port_in_bytes=None, egress_port_in_bytes=None):
-	req = p4rt.StreamMessageRequest()
-	packet = req.packet
-	packet.payload = payload
-
-	metadata = p4rt.PacketMetadata()
-	# Append multicast group ID
-	metadata.metadata_id = 1
-	metadata.value = mcast_grp_in_bytes
-	packet.metadata.append(metadata)
-	if ingress_port_in_bytes is not None:
-		# Append ingress port
-		metadata.metadata_id = 2
-		metadata.value = ingress_port_in_bytes
-		packet.metadata.append(metadata)
-	if egress_port_in_bytes is not None:
-		# Append egress port
-		metadata.metadata_id = 4
-		metadata.value = egress_port_in_bytes
-		packet.metadata.append(metadata)
-
-	# Send packet out
-	p4sh.client.stream_out_q.put(req)
 
 ###############################################################################
 # Main 
@@ -256,24 +360,46 @@ if __name__ == '__main__':
 						type=str, action="store", default='50001')
 	parser.add_argument('--topo-config', help='Topology Configuration File', required=True,
 						type=str, action="store")
+	parser.add_argument('--log-level', help='Log Level', choices=['DEBUG', 'INFO', 'WARNING'],
+						type=str, action="store", default=LOG_LEVEL)
+	parser.add_argument('--log-rate', help='Log Records per Second per Message Type',
+						type=float, action="store", default=LOG_RATE)
+	parser.add_argument('--log-sample', help='Log 1 in N Records of a Message Type (type=N)',
+						type=str, action="append", default=[])
+	parser.add_argument('--aging-mode', help='Entry Aging Mode', choices=['packets', 'idle'],
+						type=str, action="store", default=AGING_MODE)
+	parser.add_argument('--idle-timeout', help='Idle Timeout in Seconds (idle aging mode)',
+						type=float, action="store", default=IDLE_TIMEOUT)
+	parser.add_argument('--topo-watch-interval', help='Seconds Between Two Checks of the Topo Config for Changes (0: on SIGHUP only)',
+						type=float, action="store", default=TOPO_WATCH_INTERVAL)
+	parser.add_argument('--pipeline-stages', help='Decision Stages of the Pipelined Mode (0: serial)',
+						type=int, action="store", default=PIPELINE_STAGES)
+	parser.add_argument('--profiler', help='Profiler Toggled by SIGUSR1 (stats dumped on SIGUSR2; sampling: all pipeline threads)',
+						choices=PROFILERS, type=str, action="store", default=PROFILER)
 	args = parser.parse_args()
 
+	# Log through the rate-limited background writer
+	controller_log = ControllerLog(args.log_level, args.log_rate,
+								   samples=parse_samples(args.log_sample))
+
 	# Create a bridge name postfixed with the grpc port number
 	switch_name = 'switch-{0}'.format(args.grpc_port)
 
-	# Create a Ethernet address to port mapping
-	eth_to_port_map = {}
+	# Age entries by packet count or by idle time
+	def new_ager():
+		if args.aging_mode == 'idle':
+			return IdleAgingWheel(args.idle_timeout)
+		return AgingWheel(NUM_ENTRIES_THRESHOLD)
 
-	# Get Multicast/VLAN ID to ports mapping
-	with open(args.topo_config, 'r') as infile:
-		topo_config = json.loads(infile.read())
+	# Create a Ethernet address to port mapping (one per decision stage when pipelined)
+	eth_to_port_maps = [ForwardingDatabase(new_ager()) for _ in range(max(args.pipeline_stages, 1))]
 
-	mcast_group_id = topo_config['switch'][args.grpc_port]['mcast']['id']
-	mcast_group_ports = topo_config['switch'][args.grpc_port]['mcast']['ports']
+	# Get Multicast/VLAN ID to ports mapping
+	switch_config = LoadSwitchConfig(args.topo_config, args.grpc_port)
 
-	vlan_id_to_ports_map = {}
-	for vlan_id, ports in topo_config['switch'][args.grpc_port]['vlan_id_to_ports'].items():
-		vlan_id_to_ports_map[int(vlan_id)] = ports
+	mcast_group_id = switch_config.mcast_group_id
+	mcast_group_ports = switch_config.mcast_group_ports
+	vlan_id_to_ports_map = switch_config.vlan_id_to_ports_map  # ... updated in place on a reload
 
 	# Setup the P4Runtime connection with the bridge
 	p4sh.setup(
@@ -305,13 +431,30 @@ if __name__ == '__main__':
 	# Install VLAN Broadcast Rules - Ends ############################################
 	##################################################################################
 
+	# Apply the changes of the topo config without a restart, on SIGHUP or when the file changes;
+	# a change the switch rejects is logged, keeping the running config and the controller up
+	topo_watcher = TopoConfigWatcher(args.topo_config, args.grpc_port, switch_config,
+									 UpdateMcastGrpEntries, args.topo_watch_interval,
+									 (P4RuntimeWriteException, P4RuntimeException, grpc.RpcError))
+
+	# Time the stages of the packet-processing loop
+	hotpath = HotPathMonitor(LOGS_DIR, switch_name, args.profiler)
+
 	# Start the packet-processing loop
-	ProcPacketIn(switch_name, mcast_group_id, 
-				 eth_to_port_map, NUM_ENTRIES_THRESHOLD, 
-				 vlan_id_to_ports_map,
-				 LOGS_DIR, NUM_LOGS_THRESHOLD)
+	if args.pipeline_stages:
+		ProcPacketInPipelined(switch_name, mcast_group_id,
+							  eth_to_port_maps,
+							  vlan_id_to_ports_map, topo_watcher, hotpath,
+							  LOGS_DIR, NUM_LOGS_THRESHOLD)
+	else:
+		ProcPacketIn(switch_name, mcast_group_id, 
+					 eth_to_port_maps[0],
+					 vlan_id_to_ports_map, topo_watcher, hotpath,
+					 LOGS_DIR, NUM_LOGS_THRESHOLD)
 
 	print("Switch Stopped")
+	hotpath.close()
+	controller_log.close()
 
 	# Delete broadcast rule
 	DeleteMcastGrpEntry(mcast_group_id)
@@ -0,0 +1,220 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import os
+import re
+import json
+import time
+import signal
+import threading
+from ratelog import get_logger
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Seconds between two checks of the topo config file for changes (0: reload on SIGHUP only)
+TOPO_WATCH_INTERVAL = 0
+
+# Suffix of the index of a topo config file (see utils/gen-topo.py): the size
+# of the file, and the byte offset and length of each switch section in it
+TOPO_INDEX_SUFFIX = '.idx'
+
+
+###############################################################################
+# Topo config parsing
+###############################################################################
+
+JSON_DECODER = json.JSONDecoder()
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Position in `text` of the value of member `name` of the JSON object at
+# `pos`, or None if it has none; only the members before it are decoded
+def FindJsonMember(text, pos, name):
+    pos = JSON_WHITESPACE.match(text, pos).end()
+    if text[pos:pos + 1] != '{':
+        raise ValueError('Expected an object at {0}'.format(pos))
+    pos = JSON_WHITESPACE.match(text, pos + 1).end()
+    if text[pos:pos + 1] == '}':
+        return None
+    while True:
+        key, pos = JSON_DECODER.raw_decode(text, pos)
+        pos = JSON_WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] != ':':
+            raise ValueError('Expected ":" at {0}'.format(pos))
+        pos = JSON_WHITESPACE.match(text, pos + 1).end()
+        if key == name:
+            return pos
+        _, pos = JSON_DECODER.raw_decode(text, pos)  # ... skip the value
+        pos = JSON_WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] == '}':
+            return None
+        if text[pos:pos + 1] != ',':
+            raise ValueError('Expected "," at {0}'.format(pos))
+        pos = JSON_WHITESPACE.match(text, pos + 1).end()
+
+# Section of the switch at `grpc_port` in a topo config file, without parsing
+# the rest of the file: read at its offset if the file has an up-to-date index,
+# else parsed from the start of the file up to it
+def ReadSwitchSection(topo_config_path, grpc_port):
+    try:
+        with open(topo_config_path + TOPO_INDEX_SUFFIX, 'r') as infile:
+            index = json.loads(infile.read())
+    except (OSError, ValueError):
+        index = None
+
+    with open(topo_config_path, 'rb') as infile:
+        if index is not None and index.get('size') == os.fstat(infile.fileno()).st_size \
+           and grpc_port in index.get('switch', {}):
+            offset, length = index['switch'][grpc_port]
+            prefix = '"{0}": '.format(grpc_port).encode()
+            infile.seek(offset - len(prefix))
+            data = infile.read(len(prefix) + length)
+            if data.startswith(prefix):  # ... else the index is stale
+                return json.loads(data[len(prefix):])
+            infile.seek(0)
+        text = infile.read().decode()
+
+    switch_pos = FindJsonMember(text, 0, 'switch')
+    section_pos = None if switch_pos is None else FindJsonMember(text, switch_pos, grpc_port)
+    if section_pos is None:
+        raise KeyError(grpc_port)
+    return JSON_DECODER.raw_decode(text, section_pos)[0]
+
+
+###############################################################################
+# Switch configuration
+###############################################################################
+
+# Multicast and VLAN configuration of a switch, from its section of a topo
+# config file (topo/*.json)
+class SwitchConfig:
+    def __init__(self, mcast_group_id, mcast_group_ports, vlan_id_to_ports_map):
+        self.mcast_group_id = mcast_group_id
+        self.mcast_group_ports = mcast_group_ports
+        self.vlan_id_to_ports_map = vlan_id_to_ports_map
+
+    # Take the ports of `config`, keeping the VLAN map object, which the
+    # packet-processing code holds on to
+    def update(self, config):
+        self.mcast_group_ports = config.mcast_group_ports
+        for vlan_id, ports in config.vlan_id_to_ports_map.items():
+            self.vlan_id_to_ports_map[vlan_id] = ports
+        for vlan_id in [vlan_id for vlan_id in self.vlan_id_to_ports_map
+                        if vlan_id not in config.vlan_id_to_ports_map]:
+            del self.vlan_id_to_ports_map[vlan_id]
+
+# Configuration of the switch at `grpc_port` in a topo config file
+def LoadSwitchConfig(topo_config_path, grpc_port):
+    switch_config = ReadSwitchSection(topo_config_path, grpc_port)
+    vlan_id_to_ports_map = {}
+    for vlan_id, ports in switch_config['vlan_id_to_ports'].items():
+        vlan_id_to_ports_map[int(vlan_id)] = ports
+    return SwitchConfig(switch_config['mcast']['id'], switch_config['mcast']['ports'], vlan_id_to_ports_map)
+
+# Differences between two {group ID: ports} maps, as the groups to insert and
+# to modify ({group ID: new ports}), and the IDs of the groups to delete
+def DiffGroups(old_groups, new_groups):
+    inserted = {}
+    modified = {}
+    for group_id, ports in new_groups.items():
+        if group_id not in old_groups:
+            inserted[group_id] = ports
+        elif set(old_groups[group_id]) != set(ports):
+            modified[group_id] = ports
+    deleted = [group_id for group_id in old_groups if group_id not in new_groups]
+    return inserted, modified, deleted
+
+
+###############################################################################
+# Topo config reloading
+###############################################################################
+
+# Reloads the configuration of a switch when its topo config file changes: on
+# SIGHUP, or when the modification time of the file changes (checked every
+# `interval` seconds). The signal only raises a flag, the reload is done by
+# check(), from the packet-processing loop.
+#
+# `on_change(old_config, new_config)` writes the differences to the switch;
+# `config` is then updated in place. If the writes fail with one of
+# `write_errors`, the running config is kept, with a warning, as for a config
+# that does not parse. The broadcast group ID cannot change, as packets are
+# being sent to it: it is kept, with a warning.
+class TopoConfigWatcher:
+    def __init__(self, topo_config_path, grpc_port, config, on_change, interval=TOPO_WATCH_INTERVAL,
+                 write_errors=()):
+        self.topo_config_path = topo_config_path
+        self.grpc_port = grpc_port
+        self.config = config
+        self.on_change = on_change
+        self.write_errors = write_errors
+        self.interval = interval
+        self.deadline = time.monotonic() + interval
+        self.mtime = self.stat()
+        self.reload_requested = threading.Event()
+        self.num_reloads = 0
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.reload_requested.set())
+
+    # Modification time of the topo config file, or None if it is gone
+    def stat(self):
+        try:
+            return os.stat(self.topo_config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    # Reload the configuration if asked to, or if the file changed
+    def check(self):
+        if not self.reload_requested.is_set():
+            if not self.interval or time.monotonic() < self.deadline:
+                return
+            self.deadline = time.monotonic() + self.interval
+            if self.stat() == self.mtime:
+                return
+        self.reload_requested.clear()
+        self.reload()
+
+    # Read the topo config file again and apply its differences
+    def reload(self):
+        start = time.perf_counter()
+        self.mtime = self.stat()
+        try:
+            config = LoadSwitchConfig(self.topo_config_path, self.grpc_port)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Topo config %s not reloaded: %r", self.topo_config_path, e, extra={'kind': 'reload'})
+            return
+
+        if config.mcast_group_id != self.config.mcast_group_id:
+            log.warning("Broadcast group ID change %d -> %d needs a restart, keeping %d",
+                        self.config.mcast_group_id, config.mcast_group_id, self.config.mcast_group_id,
+                        extra={'kind': 'reload'})
+            config.mcast_group_id = self.config.mcast_group_id
+
+        try:
+            self.on_change(self.config, config)
+        except self.write_errors as e:
+            log.warning("Topo config %s not applied, keeping the running config: %s", self.topo_config_path,
+                        e, extra={'kind': 'reload'})
+            return
+        self.config.update(config)
+        self.num_reloads += 1
+        log.info("Topo config %s reloaded in %.1f ms", self.topo_config_path,
+                 (time.perf_counter() - start) * 1e3, extra={'kind': 'reload'})
@@ -0,0 +1,91 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from aging import AgingWheel
+
+
+# Per-packet aging as done originally: decrement every entry of the table
+def full_walk(eth_to_port_map, num_packets):
+    for _ in range(num_packets):
+        del_vlans = []
+        for vlan in eth_to_port_map:
+            del_mac_list = []
+            for mac in eth_to_port_map[vlan]:
+                eth_to_port_map[vlan][mac]['count'] -= 1
+                if eth_to_port_map[vlan][mac]['count'] == 0:
+                    del_mac_list.append(mac)
+            for mac in del_mac_list:
+                del eth_to_port_map[vlan][mac]
+            if not eth_to_port_map[vlan]:
+                del_vlans.append(vlan)
+        for vlan in del_vlans:
+            del eth_to_port_map[vlan]
+
+
+# Per-packet aging with the timing wheel; one entry is re-learned per packet
+def wheel(ager, keys, num_packets):
+    num_keys = len(keys)
+    for i in range(num_packets):
+        ager.advance()
+        ager.touch(keys[i % num_keys])
+
+
+# Time a callable and return the cost per packet in nanoseconds
+def per_packet_ns(func, num_packets):
+    start = time.perf_counter_ns()
+    func()
+    return (time.perf_counter_ns() - start) / num_packets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Aging Benchmark Script')
+    parser.add_argument('--sizes', help='Table Sizes', type=str, action="store",
+                        default='10,100,1000,10000,100000')
+    parser.add_argument('--packets', help='Packets per Run', type=int, action="store",
+                        default=100000)
+    parser.add_argument('--walk-budget', help='Entry Visits for the Full Walk', type=int,
+                        action="store", default=2000000)
+    args = parser.parse_args()
+
+    print("{0:>8} {1:>16} {2:>16}".format("entries", "full walk ns/pkt", "wheel ns/pkt"))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        # Entries never expire during a run, so the table size stays constant
+        lifetime = args.packets + 1
+        keys = [(i % 4096, '02:00:{0:02x}:{1:02x}:{2:02x}:{3:02x}'.format(
+                    (i >> 24) & 0xff, (i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff))
+                for i in range(size)]
+
+        eth_to_port_map = {}
+        for vlan, mac in keys:
+            eth_to_port_map.setdefault(vlan, {})[mac] = {'port': 1, 'count': lifetime}
+        walk_packets = max(1, min(args.packets, args.walk_budget // size))
+        walk_ns = per_packet_ns(lambda: full_walk(eth_to_port_map, walk_packets), walk_packets)
+
+        ager = AgingWheel(lifetime)
+        for key in keys:
+            ager.touch(key)
+        wheel_ns = per_packet_ns(lambda: wheel(ager, keys, args.packets), args.packets)
+
+        print("{0:>8} {1:>16.0f} {2:>16.0f}".format(size, walk_ns, wheel_ns))
@@ -0,0 +1,94 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from aging import AgingWheel
+from ethernet import mac2str
+from fdb import ForwardingDatabase
+
+
+# Learn every host into the nested dict table used originally
+def build_dicts(hosts):
+    eth_to_port_map = {}
+    for vlan_id, mac, port in hosts:
+        eth_to_port_map.setdefault(vlan_id, {})[mac2str(mac)] = {'port': port, 'count': 100}
+    return eth_to_port_map
+
+
+# Learn every host into the forwarding database
+def build_fdb(hosts):
+    eth_to_port_map = ForwardingDatabase(AgingWheel(100))
+    for vlan_id, mac, port in hosts:
+        eth_to_port_map.learn(vlan_id, mac, port)
+    return eth_to_port_map
+
+
+# Build a table and return it with the memory it holds and the time per entry
+def measure(build, hosts):
+    tracemalloc.start()
+    table = build(hosts)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+
+    # Time a second build, as tracing slows down allocations
+    start = time.perf_counter_ns()
+    table = build(hosts)
+    elapsed = time.perf_counter_ns() - start
+    return table, current, elapsed / len(hosts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Forwarding Database Benchmark Script')
+    parser.add_argument('--entries', help='Learned Entries', type=int, action="store",
+                        default=1000000)
+    parser.add_argument('--vlans', help='Number of VLANs', type=int, action="store",
+                        default=16)
+    parser.add_argument('--skip-dicts', help='Skip the Nested Dict Table', action="store_true",
+                        default=False)
+    args = parser.parse_args()
+
+    hosts = [(1 + i % args.vlans, 0x020000000000 | i, 1 + i % 48) for i in range(args.entries)]
+
+    builds = [('fdb', build_fdb)]
+    if not args.skip_dicts:
+        builds.insert(0, ('dicts', build_dicts))
+
+    print("{0:>6} {1:>10} {2:>12} {3:>12} {4:>14}".format(
+        "table", "MB", "bytes/entry", "learn ns", "lookup ns"))
+    for name, build in builds:
+        table, nbytes, learn_ns = measure(build, hosts)
+        sample = hosts[::max(1, len(hosts) // 100000)]
+        start = time.perf_counter_ns()
+        if name == 'fdb':
+            for vlan_id, mac, _ in sample:
+                table.lookup(vlan_id, mac)
+        else:
+            for vlan_id, mac, _ in sample:
+                table[vlan_id][mac2str(mac)]['port']
+        lookup_ns = (time.perf_counter_ns() - start) / len(sample)
+        print("{0:>6} {1:>10.1f} {2:>12.0f} {3:>12.0f} {4:>14.0f}".format(
+            name, nbytes / 1e6, nbytes / len(hosts), learn_ns, lookup_ns))
+        del table
@@ -0,0 +1,126 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import gc
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from p4.v1 import p4runtime_pb2 as p4rt
+from packetout import PacketOutSender
+
+
+# Stand-ins for the stream queue: keeping the requests, dropping them, or
+# serializing and dropping them as the gRPC thread would (in the same thread,
+# as the GIL serializes the two anyway; queuing between threads would time the
+# scheduler)
+class KeepStream(list):
+    put = list.append
+
+class DropStream:
+    @staticmethod
+    def put(req):
+        pass
+
+class SerializeStream:
+    @staticmethod
+    def put(req):
+        req.SerializeToString()
+
+
+# Build and queue every PacketOut as the controllers used to do
+def send_legacy(stream_out_q, packets):
+    for payload, mcast_grp, ingress_port, egress_port in packets:
+        req = p4rt.StreamMessageRequest()
+        packet = req.packet
+        packet.payload = payload
+
+        metadata = p4rt.PacketMetadata()
+        metadata.metadata_id = 1
+        metadata.value = mcast_grp.to_bytes(2, byteorder='big')
+        packet.metadata.append(metadata)
+        metadata.metadata_id = 2
+        metadata.value = ingress_port.to_bytes(2, byteorder='big')
+        packet.metadata.append(metadata)
+        if egress_port is not None:
+            metadata.metadata_id = 4
+            metadata.value = egress_port.to_bytes(2, byteorder='big')
+            packet.metadata.append(metadata)
+        stream_out_q.put(req)
+
+
+# Queue every PacketOut through the sender, with its cached metadata
+def send_cached(stream_out_q, packets):
+    send = PacketOutSender(stream_out_q).send
+    for payload, mcast_grp, ingress_port, egress_port in packets:
+        send(payload, mcast_grp, ingress_port, egress_port)
+
+
+# Fastest of `runs` runs of a sender into a stream, in us per packet (without
+# garbage collection, as timeit does)
+def time_sender(send, stream, packets, runs):
+    times = []
+    gc.disable()
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            send(stream(), packets)
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times) * 1e6 / len(packets)
+
+
+# Bytes held per queued PacketOut, e.g. while the stream falls behind
+def queued_bytes(send, packets):
+    tracemalloc.start()
+    stream_out_q = KeepStream()
+    send(stream_out_q, packets)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / len(packets)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PacketOut Benchmark Script')
+    parser.add_argument('--packets', help='Number of PacketOuts', type=int, action="store",
+                        default=20000)
+    parser.add_argument('--runs', help='Timed Runs per Sender (the Fastest Is Reported)', type=int,
+                        action="store", default=5)
+    args = parser.parse_args()
+
+    # Mix of VLAN floods and unicast forwards over a few ports
+    payload = bytes(64)
+    packets = []
+    for i in range(args.packets):
+        if i % 4 == 0:
+            packets.append((payload, 100 + i % 3, 1 + i % 8, None))
+        else:
+            packets.append((payload, 0, 1 + i % 8, 1 + (i + 1) % 8))
+
+    print("{0:>8} {1:>14} {2:>16} {3:>12} {4:>14}".format(
+        "sender", "build us/pkt", "+ serialize us", "packets/s", "queued B/pkt"))
+    for name, send in [('legacy', send_legacy), ('cached', send_cached)]:
+        build_us = time_sender(send, DropStream, packets, args.runs)
+        total_us = time_sender(send, SerializeStream, packets, args.runs)
+        print("{0:>8} {1:>14.2f} {2:>16.2f} {3:>12.0f} {4:>14.0f}".format(
+            name, build_us, total_us, 1e6 / total_us, queued_bytes(send, packets)))
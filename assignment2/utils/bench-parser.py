@@ -0,0 +1,68 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from ethernet import ETH_TYPE_VLAN, VLAN_ID_MASK, parse_eth
+
+
+# MAC address in bytes to string, as the controllers used to do
+def mac2str(mac):
+    return ':'.join('{:02x}'.format(b) for b in mac)
+
+
+# Header parsing with slices and string MAC addresses, as the controllers used to do
+def parse_slices(payload):
+    dst_mac = mac2str(payload[0:6])
+    src_mac = mac2str(payload[6:12])
+    eth_type = int.from_bytes(payload[12:14], byteorder='big')
+    vlan_id = 0
+    if eth_type == ETH_TYPE_VLAN:
+        vlan_id = int.from_bytes(payload[14:16], byteorder='big') & VLAN_ID_MASK
+        eth_type = int.from_bytes(payload[16:18], byteorder='big')
+    return dst_mac, src_mac, eth_type, vlan_id
+
+
+# Header parsing with the struct-based parser and integer MAC addresses
+def parse_struct(payload):
+    dst_mac, src_mac, _, vlan_tci, eth_type = parse_eth(payload)
+    vlan_id = 0 if vlan_tci is None else vlan_tci & VLAN_ID_MASK
+    return dst_mac, src_mac, eth_type, vlan_id
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parser Benchmark Script')
+    parser.add_argument('--number', help='Packets per Run', type=int, action="store",
+                        default=200000)
+    args = parser.parse_args()
+
+    untagged = bytes.fromhex('ffffffffffff' '0200000000a1' '0806') + bytes(46)
+    tagged = bytes.fromhex('ffffffffffff' '0200000000a1' '8100' '0064' '0806') + bytes(42)
+
+    print("{0:>10} {1:>16} {2:>16}".format("packet", "mac2str ns/pkt", "parse_eth ns/pkt"))
+    for name, payload in [('untagged', untagged), ('802.1Q', tagged)]:
+        results = []
+        for func in (parse_slices, parse_struct):
+            seconds = min(timeit.repeat(lambda: func(payload), number=args.number, repeat=5))
+            results.append(seconds * 1e9 / args.number)
+        print("{0:>10} {1:>16.0f} {2:>16.0f}".format(name, *results))
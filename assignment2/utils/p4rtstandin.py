@@ -0,0 +1,408 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+import collections
+from concurrent import futures
+
+import grpc
+from google.rpc import code_pb2, status_pb2
+from p4.v1 import p4runtime_pb2 as p4rt
+from p4.v1 import p4runtime_pb2_grpc
+
+# P4Runtime API version reported by Capabilities
+P4RUNTIME_API_VERSION = '1.3.0'
+
+# Entities sent in one ReadResponse
+MAX_READ_ENTITIES = 1000
+
+# Seconds between two checks of a controller being set up
+READY_POLL_INTERVAL = 0.05
+
+# Last lines of the controller's stderr shown when it fails
+ERROR_OUTPUT_LINES = 20
+
+# Line with which Python starts printing an uncaught exception
+TRACEBACK_LINE = 'Traceback (most recent call last):'
+
+
+# Key of a table entry: its match fields and priority, as stored bytes
+def entry_key(table_entry):
+    return (tuple(sorted(match.SerializeToString(deterministic=True) for match in table_entry.match)),
+            table_entry.priority)
+
+
+# A controller run against a stand-in failed: it exited, raised an exception,
+# or did not set up in time
+class ControllerError(Exception):
+    pass
+
+
+# In-memory P4Runtime server standing in for a switch (e.g. Stratum/BMv2), to
+# run the controllers without Mininet: it keeps the pipeline config, the table
+# entries, default actions, multicast groups and digest configs written to it,
+# answers reads of them, and exchanges packets with the controller over the
+# StreamChannel. It does not forward packets, nor time entries out.
+#
+# Scripted traffic is sent with send_packet_in() and send_digest_list(); the
+# controller's output is counted and handed to the optional on_write(updates)
+# and on_packet_out(packet) hooks, called from the gRPC threads.
+class P4RuntimeStandIn(p4runtime_pb2_grpc.P4RuntimeServicer):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = p4rt.ForwardingPipelineConfig()
+        self.tables = {}  # ... {table ID: {entry key: (TableEntry, insert time)}}
+        self.default_actions = {}
+        self.groups = {}
+        self.digest_configs = {}
+        self.stream_q = None
+        self.connected = threading.Event()
+        self.connect_time = None  # ... time.perf_counter() of the last arbitration
+        self.pipeline_time = None  # ... and of the last pipeline set
+        self.on_write = None
+        self.on_packet_out = None
+        self.num_write_rpcs = 0
+        self.num_updates = 0
+        self.num_errors = 0
+        self.num_read_rpcs = 0
+        self.num_packet_ins = 0
+        self.num_packet_outs = 0
+        self.num_digest_acks = 0
+
+    ###########################################################################
+    # Scripted traffic
+    ###########################################################################
+
+    # Send a PacketIn from `ingress_port` (the first packet_in metadata)
+    def send_packet_in(self, payload, ingress_port):
+        rep = p4rt.StreamMessageResponse()
+        rep.packet.payload = payload
+        rep.packet.metadata.add(metadata_id=1, value=ingress_port.to_bytes(2, byteorder='big'))
+        self.num_packet_ins += 1
+        self.stream_q.put(rep)
+
+    # Send a DigestList of digests with integer members, e.g. [(src MAC, port)]
+    def send_digest_list(self, digest_id, list_id, digests, member_bytes):
+        rep = p4rt.StreamMessageResponse()
+        rep.digest.digest_id = digest_id
+        rep.digest.list_id = list_id
+        for values in digests:
+            data = rep.digest.data.add()
+            for value, num_bytes in zip(values, member_bytes):
+                data.struct.members.add(bitstring=value.to_bytes(num_bytes, byteorder='big'))
+        rep.digest.timestamp = time.time_ns()
+        self.stream_q.put(rep)
+
+    ###########################################################################
+    # P4Runtime service
+    ###########################################################################
+
+    def Capabilities(self, request, context):
+        return p4rt.CapabilitiesResponse(p4runtime_api_version=P4RUNTIME_API_VERSION)
+
+    # Accept the controller as primary, then stream it the scripted traffic
+    def StreamChannel(self, request_iterator, context):
+        stream_q = queue.Queue()
+
+        def receive():
+            try:
+                for req in request_iterator:
+                    kind = req.WhichOneof('update')
+                    if kind == 'arbitration':
+                        rep = p4rt.StreamMessageResponse()
+                        rep.arbitration.CopyFrom(req.arbitration)
+                        rep.arbitration.status.code = code_pb2.OK
+                        stream_q.put(rep)
+                        self.stream_q = stream_q
+                        self.connect_time = time.perf_counter()
+                        self.connected.set()
+                    elif kind == 'packet':
+                        self.num_packet_outs += 1
+                        if self.on_packet_out is not None:
+                            self.on_packet_out(req.packet)
+                    elif kind == 'digest_ack':
+                        self.num_digest_acks += 1
+            except grpc.RpcError:  # ... the controller is gone
+                pass
+            stream_q.put(None)
+
+        threading.Thread(target=receive, daemon=True).start()
+        while True:
+            rep = stream_q.get()
+            if rep is None:
+                break
+            yield rep
+
+    # Take the new pipeline; committing it clears the forwarding state
+    def SetForwardingPipelineConfig(self, request, context):
+        with self.lock:
+            self.config.CopyFrom(request.config)
+            if request.action != p4rt.SetForwardingPipelineConfigRequest.RECONCILE_AND_COMMIT:
+                self.tables.clear()
+                self.default_actions.clear()
+                self.groups.clear()
+                self.digest_configs.clear()
+            self.pipeline_time = time.perf_counter()
+        return p4rt.SetForwardingPipelineConfigResponse()
+
+    def GetForwardingPipelineConfig(self, request, context):
+        rep = p4rt.GetForwardingPipelineConfigResponse()
+        response_type = request.response_type
+        Request = p4rt.GetForwardingPipelineConfigRequest
+        with self.lock:
+            if response_type in (Request.ALL, Request.P4INFO_AND_COOKIE):
+                rep.config.p4info.CopyFrom(self.config.p4info)
+            if response_type in (Request.ALL, Request.DEVICE_CONFIG_AND_COOKIE):
+                rep.config.p4_device_config = self.config.p4_device_config
+            if self.config.HasField('cookie'):
+                rep.config.cookie.CopyFrom(self.config.cookie)
+        return rep
+
+    # Apply the updates in order; failed ones are reported as the switches do,
+    # with one p4.v1.Error per update in the status details
+    def Write(self, request, context):
+        with self.lock:
+            errors = [self.apply(update) for update in request.updates]
+            self.num_write_rpcs += 1
+            self.num_updates += len(request.updates)
+        if self.on_write is not None:
+            self.on_write(request.updates)
+
+        num_errors = sum(1 for error in errors if error.canonical_code != code_pb2.OK)
+        if num_errors:
+            with self.lock:
+                self.num_errors += num_errors
+            status = status_pb2.Status(code=code_pb2.UNKNOWN,
+                                       message='{0} of {1} updates failed'.format(num_errors, len(errors)))
+            for error in errors:
+                status.details.add().Pack(error)
+            context.set_trailing_metadata([('grpc-status-details-bin', status.SerializeToString())])
+            context.set_code(grpc.StatusCode.UNKNOWN)
+            context.set_details(status.message)
+        return p4rt.WriteResponse()
+
+    # Apply an update, returning its p4.v1.Error (OK on success)
+    def apply(self, update):
+        entity = update.entity
+        kind = entity.WhichOneof('entity')
+        if kind == 'table_entry':
+            return self.apply_table_entry(update.type, entity.table_entry)
+        if kind == 'packet_replication_engine_entry':
+            pre_entry = entity.packet_replication_engine_entry
+            if pre_entry.WhichOneof('type') == 'multicast_group_entry':
+                mcast_entry = pre_entry.multicast_group_entry
+                return self.apply_keyed(update.type, self.groups, mcast_entry.multicast_group_id, mcast_entry)
+        if kind == 'digest_entry':
+            return self.apply_keyed(update.type, self.digest_configs, entity.digest_entry.digest_id,
+                                    entity.digest_entry)
+        return p4rt.Error(canonical_code=code_pb2.UNIMPLEMENTED, message=kind or '')
+
+    def apply_table_entry(self, update_type, table_entry):
+        if table_entry.is_default_action:
+            if update_type != p4rt.Update.MODIFY:
+                return p4rt.Error(canonical_code=code_pb2.INVALID_ARGUMENT, message='default action')
+            self.default_actions[table_entry.table_id] = p4rt.TableEntry()
+            self.default_actions[table_entry.table_id].CopyFrom(table_entry)
+            return p4rt.Error(canonical_code=code_pb2.OK)
+        table = self.tables.setdefault(table_entry.table_id, {})
+        key = entry_key(table_entry)
+        if update_type == p4rt.Update.INSERT and key in table:
+            return p4rt.Error(canonical_code=code_pb2.ALREADY_EXISTS)
+        if update_type != p4rt.Update.INSERT and key not in table:
+            return p4rt.Error(canonical_code=code_pb2.NOT_FOUND)
+        if update_type == p4rt.Update.DELETE:
+            del table[key]
+        else:
+            stored = p4rt.TableEntry()
+            stored.CopyFrom(table_entry)
+            table[key] = (stored, time.monotonic_ns())
+        return p4rt.Error(canonical_code=code_pb2.OK)
+
+    def apply_keyed(self, update_type, entries, key, entry):
+        if update_type == p4rt.Update.INSERT and key in entries:
+            return p4rt.Error(canonical_code=code_pb2.ALREADY_EXISTS)
+        if update_type != p4rt.Update.INSERT and key not in entries:
+            return p4rt.Error(canonical_code=code_pb2.NOT_FOUND)
+        if update_type == p4rt.Update.DELETE:
+            del entries[key]
+        else:
+            entries[key] = type(entry)()
+            entries[key].CopyFrom(entry)
+        return p4rt.Error(canonical_code=code_pb2.OK)
+
+    # Read table entries and multicast groups, all of them or by table or group ID
+    def Read(self, request, context):
+        self.num_read_rpcs += 1
+        entities = []
+        with self.lock:
+            for entity in request.entities:
+                kind = entity.WhichOneof('entity')
+                if kind == 'table_entry':
+                    entities.extend(self.read_table_entries(entity.table_entry))
+                elif kind == 'packet_replication_engine_entry':
+                    group_id = entity.packet_replication_engine_entry.multicast_group_entry.multicast_group_id
+                    for mcast_entry in self.groups.values():
+                        if group_id in (0, mcast_entry.multicast_group_id):
+                            read_entity = p4rt.Entity()
+                            read_entity.packet_replication_engine_entry.multicast_group_entry.CopyFrom(mcast_entry)
+                            entities.append(read_entity)
+        for i in range(0, len(entities), MAX_READ_ENTITIES):
+            yield p4rt.ReadResponse(entities=entities[i:i + MAX_READ_ENTITIES])
+
+    def read_table_entries(self, request_entry):
+        now = time.monotonic_ns()
+        for table_id, table in self.tables.items():
+            if request_entry.table_id not in (0, table_id):
+                continue
+            for stored, insert_time in table.values():
+                read_entity = p4rt.Entity()
+                read_entity.table_entry.CopyFrom(stored)
+                if request_entry.HasField('time_since_last_hit'):  # ... never hit: since the insert
+                    read_entity.table_entry.time_since_last_hit.elapsed_ns = now - insert_time
+                yield read_entity
+
+    ###########################################################################
+    # State
+    ###########################################################################
+
+    # Entries of a table
+    def table_entries(self, table_id):
+        with self.lock:
+            return [stored for stored, _ in self.tables.get(table_id, {}).values()]
+
+    # Counters, as a log message
+    def stats(self):
+        return ('packet_ins={0} packet_outs={1} write_rpcs={2} updates={3} errors={4} reads={5} '
+                'digest_acks={6}'.format(self.num_packet_ins, self.num_packet_outs, self.num_write_rpcs,
+                                         self.num_updates, self.num_errors, self.num_read_rpcs,
+                                         self.num_digest_acks))
+
+
+# Serve a stand-in on `address` (port 0: any free port); returns (server, port)
+def serve(standin, address='127.0.0.1:0', max_workers=8):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    p4runtime_pb2_grpc.add_P4RuntimeServicer_to_server(standin, server)
+    port = server.add_insecure_port(address)
+    server.start()
+    return server, port
+
+
+# A controller (p4rt-src/<name>.py) run against a stand-in, from a scratch
+# directory holding what it expects: cfg/<name>-<port>-p4info.txt and .json
+# (copies of `cfg_name` in `cfg_dir`, taken at each start), logs/ and topo.json, the section of
+# `topo_config` for the switch renamed to the port.
+#
+# Unless shown, the controller's stderr is kept in the scratch directory:
+# `check` fails with its last lines when the controller has exited or raised
+# an exception. (A controller whose main thread raised may keep running on
+# its gRPC threads, without handling anything, until it is stopped.)
+class ControllerProcess:
+    def __init__(self, p4rt_src_dir, name, cfg_dir, cfg_name, topo_config, switch, grpc_port, args=()):
+        self.work_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.work_dir, 'cfg'))
+        os.makedirs(os.path.join(self.work_dir, 'logs'))
+        self.cfg_files = [(os.path.join(cfg_dir, cfg_name + suffix),
+                           os.path.join(self.work_dir, 'cfg', '{0}-{1}{2}'.format(name, grpc_port, suffix)))
+                          for suffix in ['-p4info.txt', '.json']]
+        with open(os.path.join(self.work_dir, 'topo.json'), 'w') as outfile:
+            json.dump({'switch': {str(grpc_port): topo_config['switch'][switch]}}, outfile)
+        self.name = name
+        self.cmd = [sys.executable, os.path.join(p4rt_src_dir, '{0}.py'.format(name)),
+                    '--grpc-port', str(grpc_port), '--topo-config', 'topo.json'] + list(args)
+        self.stderr_path = os.path.join(self.work_dir, 'stderr.txt')
+        self.proc = None
+        self.returncode = None
+
+    # Copy the cfg files (as built by `make controller`) and start the
+    # controller, its output shown (`output` None) or not
+    def start(self, output=subprocess.DEVNULL):
+        for cfg_path, copy_path in self.cfg_files:
+            if not os.path.exists(cfg_path):
+                raise ControllerError('{0}: not found (built by `make controller name={1}`)'.format(
+                    os.path.normpath(cfg_path), self.name))
+            shutil.copy(cfg_path, copy_path)
+        self.returncode = None
+        if output is None:
+            self.proc = subprocess.Popen(self.cmd, cwd=self.work_dir)
+        else:
+            with open(self.stderr_path, 'wb') as stderr:
+                self.proc = subprocess.Popen(self.cmd, cwd=self.work_dir, stdout=output, stderr=stderr)
+
+    # Wait for the controller to connect to `standin` and write its initial
+    # config (multicast groups, ...), i.e. for Write RPCs beyond the first
+    # `num_write_rpcs`; fails if it does not in `timeout` seconds
+    def wait_ready(self, standin, timeout, num_write_rpcs=0):
+        deadline = time.perf_counter() + timeout
+        while not (standin.connected.is_set() and standin.num_write_rpcs > num_write_rpcs):
+            self.check()
+            if time.perf_counter() > deadline:
+                self.fail('did not {0} in {1}s'.format(
+                    'write its initial config' if standin.connected.is_set() else 'connect', timeout))
+            time.sleep(READY_POLL_INTERVAL)
+
+    # Fail if the controller has exited (or, once stopped, did not stop
+    # cleanly), or has raised an exception
+    def check(self):
+        if self.proc is not None:
+            if self.proc.poll() is not None:
+                self.fail('exited with status {0}'.format(self.proc.returncode))
+        elif self.returncode:
+            self.fail('stopped with status {0}'.format(self.returncode))
+        if any(line.startswith(TRACEBACK_LINE) for line in self.error_output(None)):
+            self.fail('raised an exception')
+
+    # Last lines of the kept stderr (all of them if `num_lines` is None)
+    def error_output(self, num_lines=ERROR_OUTPUT_LINES):
+        try:
+            with open(self.stderr_path, 'r', errors='replace') as infile:
+                return list(collections.deque(infile, num_lines))
+        except OSError:
+            return []
+
+    def fail(self, reason):
+        raise ControllerError('{0} {1}{2}'.format(self.name, reason, ''.join(
+            ['\n'] + self.error_output()).rstrip()))
+
+    # Stop the controller as CTRL+C would, so that it cleans up; returns its
+    # exit status, also kept in `returncode`
+    def stop(self, timeout=10):
+        if self.proc is not None:
+            self.proc.send_signal(signal.SIGINT)
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            self.returncode = self.proc.returncode
+            self.proc = None
+        return self.returncode
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
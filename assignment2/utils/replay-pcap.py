@@ -0,0 +1,218 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from google.protobuf import json_format
+from p4.v1 import p4runtime_pb2 as p4rt
+from snapshot import load_table
+from p4rtstandin import ControllerError, ControllerProcess, P4RuntimeStandIn, serve
+from l2stream import is_l2stream, read_packets
+from pcapfile import read_frames
+
+ASSIGNMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+# Replays frames as PacketIns and matches what the controller answers to them:
+# a PacketOut of the same frame. Each frame is answered at most once, the
+# oldest unanswered one first. What the controller sends is appended to
+# `capture`, if any, as JSON lines.
+class Replay:
+    def __init__(self, standin, capture=None):
+        self.lock = threading.Lock()
+        self.standin = standin
+        self.capture = capture
+        self.start = None
+        self.sent = []
+        self.answered = {}
+        self.by_payload = collections.defaultdict(collections.deque)
+        self.last_output = None
+        self.num_packet_outs = 0
+        self.num_write_rpcs = 0
+        self.num_updates = 0
+
+    def send(self, frame, ingress_port):
+        with self.lock:
+            index = len(self.sent)
+            now = time.perf_counter()
+            if self.start is None:
+                self.start = now
+            self.sent.append(now)
+            self.by_payload[frame].append(index)
+        self.standin.send_packet_in(frame, ingress_port)
+
+    # Mark the oldest unanswered frame of a queue answered
+    def mark_answered(self, indexes, now):
+        while indexes:
+            index = indexes.popleft()
+            if index not in self.answered:
+                self.answered[index] = now
+                return
+
+    def record(self, kind, msg, now):
+        self.last_output = now
+        if self.capture is not None:
+            self.capture.write(json.dumps({'time': now - self.start, 'kind': kind,
+                                           'message': json_format.MessageToDict(msg)}) + '\n')
+
+    def on_packet_out(self, packet):
+        now = time.perf_counter()
+        with self.lock:
+            self.num_packet_outs += 1
+            self.record('packet_out', packet, now)
+            self.mark_answered(self.by_payload.get(bytes(packet.payload), ()), now)
+
+    def on_write(self, updates):
+        now = time.perf_counter()
+        with self.lock:
+            self.num_write_rpcs += 1
+            self.num_updates += len(updates)
+            self.record('write', p4rt.WriteRequest(updates=updates), now)
+
+    def done(self):
+        with self.lock:
+            return len(self.answered) == len(self.sent)
+
+
+# Table the controller learned, from its snapshot and change log (see
+# snapshot.SnapshotWriter), as {[vlan:] {mac: {'port': port}}}
+def read_fdb(controller, name):
+    return load_table(os.path.join(controller.work_dir, 'logs', '{0}-table.json'.format(name)),
+                      os.path.join(controller.work_dir, 'logs', '{0}-table.changes.jsonl'.format(name)))
+
+
+# Value at fraction `q` of sorted `values`
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Controller pcap Replay Script')
+    parser.add_argument('pcap', help='pcap, pcapng or PacketIn Stream (gen-traffic.py) File', type=str, action="store")
+    parser.add_argument('--controller', help='Controller (p4rt-src/<name>.py)', choices=['bridge', 'switch'],
+                        type=str, action="store", default='switch')
+    parser.add_argument('--topo-config', help='Topology Configuration File', type=str, action="store",
+                        default=os.path.join(ASSIGNMENT_DIR, 'topo', 'linear,2,2.json'))
+    parser.add_argument('--ingress-port', help='Ingress Port of the PacketIns (pcap Files)', type=int, action="store",
+                        default=1)
+    parser.add_argument('--timing', help='Send Timing', choices=['line-rate', 'recorded'], type=str,
+                        action="store", default='line-rate')
+    parser.add_argument('--speed', help='Speed-Up of the Recorded Timing', type=float, action="store",
+                        default=1)
+    parser.add_argument('--capture', help='File of the Captured PacketOuts and Writes (JSON Lines)', type=str,
+                        action="store", default=None)
+    parser.add_argument('--fdb', help='File of the Final Learned Table (JSON; default: printed)', type=str,
+                        action="store", default=None)
+    parser.add_argument('--settle', help='Seconds Given to the Controller to Set Up', type=float,
+                        action="store", default=1)
+    parser.add_argument('--idle', help='Seconds Without Output After Which the Replay Is Over', type=float,
+                        action="store", default=2)
+    parser.add_argument('--timeout', help='Seconds to Wait for the Controller', type=float, action="store",
+                        default=60)
+    parser.add_argument('--controller-output', help='Show the Controller Output', action="store_true")
+    parser.add_argument('args', help='Controller Arguments (after --)', nargs='*')
+    args = parser.parse_args()
+
+    if is_l2stream(args.pcap):
+        frames = list(read_packets(args.pcap))
+    else:
+        frames = [(timestamp, args.ingress_port, frame) for timestamp, frame in read_frames(args.pcap)]
+    if not frames:
+        sys.exit("{0}: no Ethernet frames".format(args.pcap))
+    with open(args.topo_config, 'r') as infile:
+        topo_config = json.loads(infile.read())
+
+    standin = P4RuntimeStandIn()
+    server, grpc_port = serve(standin)
+    controller = ControllerProcess(os.path.join(ASSIGNMENT_DIR, 'p4rt-src'), args.controller,
+                                   os.path.join(ASSIGNMENT_DIR, 'cfg'), '{0}-50001'.format(args.controller),
+                                   topo_config, '50001', grpc_port, args.args)
+    capture = open(args.capture, 'w') if args.capture else None
+    try:
+        controller.start(None if args.controller_output else subprocess.DEVNULL)
+        controller.wait_ready(standin, args.timeout)
+        time.sleep(args.settle)
+
+        replay = Replay(standin, capture)
+        standin.on_write = replay.on_write
+        standin.on_packet_out = replay.on_packet_out
+
+        # Send the frames, at the recorded timing if asked to
+        start = time.perf_counter()
+        first_timestamp = frames[0][0]
+        for timestamp, ingress_port, frame in frames:
+            if args.timing == 'recorded':
+                delay = start + (timestamp - first_timestamp) / args.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            replay.send(frame, ingress_port)
+        send_seconds = time.perf_counter() - start
+
+        # Wait until every frame is answered, or the controller has gone quiet
+        deadline = time.perf_counter() + args.timeout
+        while not replay.done() and time.perf_counter() < deadline:
+            if time.perf_counter() - max(replay.last_output or start, start + send_seconds) > args.idle:
+                break
+            time.sleep(0.01)
+        seconds = max(replay.last_output or start, start + send_seconds) - start
+        standin.on_write = standin.on_packet_out = None
+        controller.check()  # ... a dead controller also goes quiet
+        controller.stop()  # ... which writes out its table
+        controller.check()
+        fdb = read_fdb(controller, '{0}-{1}'.format(args.controller, grpc_port))
+    except ControllerError as e:
+        sys.exit(str(e))
+    finally:
+        controller.close()
+        server.stop(None)
+        if capture is not None:
+            capture.close()
+
+    samples = sorted((replay.answered[index] - sent) * 1e3 for index, sent in enumerate(replay.sent)
+                     if index in replay.answered)
+    print("{0}: {1} frames sent in {2:.2f} s, {3} answered, {4} unanswered".format(
+        args.controller, len(replay.sent), send_seconds, len(samples), len(replay.sent) - len(samples)))
+    print("{0:>12} {1:>12} {2:>12} {3:>12}".format("frames/s", "pkt-outs/s", "writes/s", "updates/s"))
+    print("{0:>12.0f} {1:>12.0f} {2:>12.0f} {3:>12.0f}".format(
+        len(replay.sent) / seconds, replay.num_packet_outs / seconds, replay.num_write_rpcs / seconds,
+        replay.num_updates / seconds))
+    if samples:
+        print("{0:>12} {1:>12} {2:>12} {3:>12}".format("p50 ms", "p90 ms", "p99 ms", "max ms"))
+        print("{0:>12.2f} {1:>12.2f} {2:>12.2f} {3:>12.2f}".format(
+            percentile(samples, 0.5), percentile(samples, 0.9), percentile(samples, 0.99), samples[-1]))
+
+    entries = [(key, mac, entry['port']) for key, node in fdb.items()
+               for mac, entry in (node.items() if 'port' not in node else [(key, node)])]
+    print("{0} table: {1} entries".format(args.controller, len(entries)))
+    if args.fdb:
+        with open(args.fdb, 'w') as outfile:
+            json.dump(fdb, outfile, indent=1)
+    else:
+        for key, mac, port in sorted(entries):
+            print("  {0} port {1}".format(mac if key == mac else 'vlan {0} {1}'.format(key, mac), port))
+    print("Stand-in: {0}".format(standin.stats()))
@@ -17,12 +17,29 @@
 ##
 #############################################################################
 
-import json
+import time
+import logging
 import argparse
+import functools
 import contextlib
-import p4runtime_sh.shell as p4sh
+import p4rtclient
 from p4.v1 import p4runtime_pb2 as p4rt
-
+from ratelog import LOG_RATE, ControllerLog, Lazy, get_logger, parse_samples
+from writebatch import WriteBatcher
+from tableupdate import MulticastGroupUpdate, TableUpdateBuilder
+from shadow import ShadowTable
+from capacity import EVICTION_POLICIES, TableCapacity
+from snapshot import SnapshotWriter
+from topoconfig import LoadSwitchConfig
+from reconcile import RECONCILE_INTERVAL, TableReconciler
+from digest import LEARN_DIGEST, LEARNING_MODES, AckDigestList, DigestConfigUpdate, DigestId, DigestValues
+from warmstart import SetupP4Runtime, SyncMulticastGroups
+from hotpath import PROFILER, PROFILERS, HotPathMonitor
+from idletimeout import ExpireIdleEntries, MatchValue
+from ethernet import mac2str, parse_eth
+
+
+log = get_logger()
 
 ###############################################################################
 # Default parameters
@@ -39,44 +56,98 @@ BRIDGE_CPU_PORT = 255
 # Logs threshold
 NUM_LOGS_THRESHOLD = 10
 
+# Seconds a learned entry may go unused before the switch times it out (0: never)
+IDLE_TIMEOUT = 300
 
-###############################################################################
-# Helper functions 
-###############################################################################
+# Entries of the learned bridge table (`size` in p4-src/bridge.p4), and how
+# entries are evicted before it is full
+TABLE_SIZE = 1024
+EVICTION_POLICY = 'lru'
 
-# MAC address in bytes to string
-def mac2str(mac):
-    return ':'.join('{:02x}'.format(b) for b in mac)
+# Learn from copies of the flooded packets sent to the CPU port ('packet'), or from digests ('digest')
+LEARNING_MODE = 'packet'
+
+# Table log: JSON diffs of the shadow table ('diff'), or a read of the switch table ('read')
+TABLE_LOG = 'diff'
+
+# Log level of the controller messages (per-packet messages are logged at DEBUG)
+LOG_LEVEL = 'INFO'
 
 
 ###############################################################################
 # Multicast group functions 
 ###############################################################################
 
-# Create a multicast group entry
-def InstallMcastGrpEntry(mcast_group_id, bridge_ports):
-    mcast_entry = p4sh.MulticastGroupEntry(mcast_group_id)
-    for port in bridge_ports:
-        mcast_entry.add(port)
-    mcast_entry.insert()
+# Create a multicast group entry (written with the next batch of `writes`)
+def InstallMcastGrpEntry(writes, mcast_group_id, bridge_ports):
+    writes.add(MulticastGroupUpdate(p4rt.Update.INSERT, mcast_group_id, bridge_ports))
 
-# Delete a multicast group entry
-def DeleteMcastGrpEntry(mcast_group_id):
-    mcast_entry = p4sh.MulticastGroupEntry(mcast_group_id)
-    mcast_entry.delete()
+# Delete a multicast group entry (written with the next batch of `writes`)
+def DeleteMcastGrpEntry(writes, mcast_group_id):
+    writes.add(MulticastGroupUpdate(p4rt.Update.DELETE, mcast_group_id))
 
 
 ###############################################################################
 # Packet processing functions
 ###############################################################################
 
-# Process incoming packets
-def ProcPacketIn(bridge_name, logs_dir, num_logs_threshold):
+# Update of the bridge table entry dropping packets from `mac` received on `port`
+def BridgeTableUpdate(bridge_table, update_type, mac, port, idle_timeout_ns=0):
+    return bridge_table.build(update_type, (mac, port), (), idle_timeout_ns)
+
+# JSON path of a bridge table entry in the table log: [MAC]
+def BridgeTablePath(mac):
+    return [mac2str(mac)]
+
+# Shadow table key and value of a bridge table entry: MAC and ingress port,
+# by the match field IDs of `bridge_table`
+def BridgeTableKey(bridge_table, table_entry):
+    mac_field_id, port_field_id = bridge_table.field_ids
+    return MatchValue(table_entry, mac_field_id), MatchValue(table_entry, port_field_id)
+
+# Learn that `mac` is behind `port`, installing a flow entry to drop packets
+# belonging to the same segment unless it is already installed
+def LearnBridgeEntry(writes, bridge_table, bridge_table_cache, table_capacity, mac, port, idle_timeout_ns):
+    old_port = bridge_table_cache.update(mac, port)
+    if old_port != port:
+        # The port is part of the match, so a moved MAC replaces its entry
+        if old_port is not None:
+            writes.add(BridgeTableUpdate(bridge_table, p4rt.Update.DELETE, mac, old_port))
+
+        writes.add(BridgeTableUpdate(bridge_table, p4rt.Update.INSERT, mac, port, idle_timeout_ns),
+                   bridge_table_cache.write_failed(writes, mac, port))
+
+        # Make room for the next entries if the table is nearly full
+        table_capacity.check()
+
+# Process incoming packets, or digests in digest learning mode
+def ProcPacketIn(bridge_name, writes, bridge_table, bridge_table_cache, table_capacity, reconciler,
+                 hotpath, snapshot, learning, idle_timeout_ns, logs_dir, num_logs_threshold):
+    stats = hotpath.stats
+    bridge_table_key = functools.partial(BridgeTableKey, bridge_table)
     try:
         num_logs = 0
         while True:
-            rep = p4sh.client.get_stream_packet("packet", timeout=1)
+            # Time the dequeue of a message already waiting, not the wait for one
+            start = time.perf_counter_ns()
+            rep = p4rtclient.client.get_stream_packet(learning, timeout=0)
             if rep is not None:
+                now = stats.record('receive', start)
+            else:
+                rep = p4rtclient.client.get_stream_packet(learning, timeout=1)
+                now = time.perf_counter_ns()
+            if rep is not None and learning == 'digest':
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("DigestList: %d digests", len(rep.digest.data), extra={'kind': 'digest'})
+
+                # Learn the whole list, then let the switch send these digests again
+                for src_mac, ingress_port in DigestValues(rep.digest):
+                    LearnBridgeEntry(writes, bridge_table, bridge_table_cache, table_capacity,
+                                     src_mac, ingress_port, idle_timeout_ns)
+                AckDigestList(rep.digest)
+                stats.count('packets', len(rep.digest.data))
+                now = stats.record('learn', now)
+            elif rep is not None:
                 # Read the raw packet
                 payload = rep.packet.payload
                 
@@ -84,45 +155,67 @@ def ProcPacketIn(bridge_name, logs_dir, num_logs_threshold):
                 ingress_port_in_bytes = rep.packet.metadata[0].value
                 ingress_port = int.from_bytes(ingress_port_in_bytes, "big")
 
-                # Parse Ethernet header (source and destination MAC)
-                dst_mac_in_bytes = payload[0:6]
-                dst_mac = mac2str(dst_mac_in_bytes)
-                src_mac_in_bytes = payload[6:12]
-                src_mac = mac2str(src_mac_in_bytes)
+                # Parse Ethernet header (source and destination MAC as integers)
+                dst_mac, src_mac, _, _, _ = parse_eth(payload)
+
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("PacketIn: dst=%s src=%s port=%d", Lazy(mac2str, dst_mac),
+                              Lazy(mac2str, src_mac), ingress_port, extra={'kind': 'packet_in'})
 
-                print("PacketIn: dst={0} src={1} port={2}".format(
-                    dst_mac, src_mac, ingress_port))
+                now = stats.record('parse', now)
 
                 try:
-                    with contextlib.redirect_stdout(None):  # A hack to suppress print statements 
-                        # within the table_entry.match get/set objects
-
-                        ##################################################################################
-                        # Learning bridge logic - Begins #################################################
-                        ##################################################################################
-                        
-                        # Install a flow entry to drop packets beloning to the same segment
-                        table_entry = p4sh.TableEntry('MyIngress.bridge_table')(action='MyIngress.drop')
-                        table_entry.match['hdr.ethernet.dstAddr'] = src_mac
-                        table_entry.match['standard_metadata.ingress_port'] = str(ingress_port)
-                        table_entry.insert()
-
-                        ##################################################################################
-                        # Learning bridge logic - Ends ###################################################
-                        ##################################################################################
+                    ##################################################################################
+                    # Learning bridge logic - Begins #################################################
+                    ##################################################################################
+                    
+                    # Install a flow entry to drop packets beloning to the same segment, 
+                    # unless it is already installed
+                    LearnBridgeEntry(writes, bridge_table, bridge_table_cache, table_capacity,
+                                     src_mac, ingress_port, idle_timeout_ns)
+
+                    ##################################################################################
+                    # Learning bridge logic - Ends ###################################################
+                    ##################################################################################
 
                 except:
                     pass
+                stats.count('packets')
+                now = stats.record('learn', now)
+
+            # Delete the learned entries the switch timed out
+            ExpireIdleEntries(writes, bridge_table_cache, bridge_table_key)
+            now = stats.record('aging', now)
+
+            # Send the learned entries once the burst of PacketIns (or DigestLists) is drained
+            if p4rtclient.client.stream_in_q[learning].empty():
+                writes.flush()
+                stats.record('table_write', now)
+
+            # Forget (or retry) the learned entries whose writes failed
+            bridge_table_cache.handle_failed_writes()
 
             # Log the Ethernet address to port mapping
             num_logs += 1
             if num_logs == num_logs_threshold:
                 num_logs = 0
-                with open('{0}/{1}-table.json'.format(logs_dir, bridge_name), 'w') as outfile:
-                    with contextlib.redirect_stdout(outfile):
-                        p4sh.TableEntry('MyIngress.bridge_table').read(lambda te: print(te))
-                print(
-                    "INFO: Log committed to {0}/{1}-table.json".format(logs_dir, bridge_name))
+                if snapshot is not None:
+                    snapshot.commit()  # ... written out in the background
+                else:
+                    writes.flush()
+                    with open('{0}/{1}-table.json'.format(logs_dir, bridge_name), 'w') as outfile:
+                        with contextlib.redirect_stdout(outfile):
+                            p4rtclient.Shell().TableEntry('MyIngress.bridge_table').read(lambda te: print(te))
+                    log.info("Log committed to %s/%s-table.json", logs_dir, bridge_name,
+                             extra={'kind': 'logs'})
+                log.debug("Shadow table %s", Lazy(bridge_table_cache.stats), extra={'kind': 'shadow'})
+                log.debug("Table capacity %s", Lazy(table_capacity.stats), extra={'kind': 'eviction'})
+
+            # Check the learned entries against the switch, once in a while
+            reconciler.check()
+
+            # Start or stop the profiler, or dump the hot path stats, if signaled
+            hotpath.check()
     except KeyboardInterrupt:
         return None
 
@@ -136,40 +229,123 @@ if __name__ == '__main__':
                         type=str, action="store", default='50001')
     parser.add_argument('--topo-config', help='Topology Configuration File', required=True,
                         type=str, action="store")
+    parser.add_argument('--log-level', help='Log Level', choices=['DEBUG', 'INFO', 'WARNING'],
+                        type=str, action="store", default=LOG_LEVEL)
+    parser.add_argument('--log-rate', help='Log Records per Second per Message Type',
+                        type=float, action="store", default=LOG_RATE)
+    parser.add_argument('--log-sample', help='Log 1 in N Records of a Message Type (type=N)',
+                        type=str, action="append", default=[])
+    parser.add_argument('--idle-timeout', help='Idle Timeout of Learned Entries in Seconds (0: never)',
+                        type=float, action="store", default=IDLE_TIMEOUT)
+    parser.add_argument('--learning', help='Learning Mode (packet: copies sent to the CPU port, digest: digests)',
+                        choices=LEARNING_MODES, type=str, action="store", default=LEARNING_MODE)
+    parser.add_argument('--table-log', help='Table Log (diff: JSON diffs of the learned entries, read: switch table read)',
+                        choices=['diff', 'read'], type=str, action="store", default=TABLE_LOG)
+    parser.add_argument('--reconcile-interval', help='Seconds Between Two Read-Back Reconciliations (0: never)',
+                        type=float, action="store", default=RECONCILE_INTERVAL)
+    parser.add_argument('--warm-restart', help='Keep the Running Pipeline and Entries Across Restarts',
+                        action="store_true")
+    parser.add_argument('--eviction-policy', help='Eviction Policy of Learned Entries (table nearly full)',
+                        choices=EVICTION_POLICIES, type=str, action="store", default=EVICTION_POLICY)
+    parser.add_argument('--profiler', help='Profiler Toggled by SIGUSR1 (stats dumped on SIGUSR2)',
+                        choices=PROFILERS, type=str, action="store", default=PROFILER)
     args = parser.parse_args()
 
+    # Log through the rate-limited background writer
+    controller_log = ControllerLog(args.log_level, args.log_rate,
+                                   samples=parse_samples(args.log_sample))
+
     # Create a bridge name postfixed with the grpc port number
     bridge_name = 'bridge-{0}'.format(args.grpc_port)
 
     # Get Multicast to ports mapping
-    with open(args.topo_config, 'r') as infile:
-        topo_config = json.loads(infile.read())
-
-    mcast_group_id = topo_config['switch'][args.grpc_port]['mcast']['id']
-    mcast_group_ports = topo_config['switch'][args.grpc_port]['mcast']['ports']
-
-    # Setup the P4Runtime connection with the bridge
-    p4sh.setup(
-        device_id=BRIDGE_ID, grpc_addr='127.0.0.1:{0}'.format(args.grpc_port), election_id=(0, 1),
-        config=p4sh.FwdPipeConfig(
-            '{0}/{1}-p4info.txt'.format(CFG_DIR, bridge_name),  # Path to P4Info file
-            '{0}/{1}.json'.format(CFG_DIR, bridge_name)  # Path to config file
-        )
+    switch_config = LoadSwitchConfig(args.topo_config, args.grpc_port)
+    mcast_group_id = switch_config.mcast_group_id
+    mcast_group_ports = switch_config.mcast_group_ports
+
+    # Setup the P4Runtime connection with the bridge, keeping its pipeline and
+    # entries on a warm restart if it runs the same configuration
+    warm = SetupP4Runtime(
+        BRIDGE_ID, '127.0.0.1:{0}'.format(args.grpc_port), (0, 1),
+        '{0}/{1}-p4info.txt'.format(CFG_DIR, bridge_name),  # Path to P4Info file
+        '{0}/{1}.json'.format(CFG_DIR, bridge_name),  # Path to config file
+        args.warm_restart
     )
 
     print("Bridge Started @ Port: {0}".format(args.grpc_port))
     print("Press CTRL+C to stop ...")
 
-    # Install broadcast rule (with CPU port)
-    InstallMcastGrpEntry(mcast_group_id, mcast_group_ports + [BRIDGE_CPU_PORT])
+    # Batch the P4Runtime writes
+    writes = WriteBatcher()
+
+    # Build the table updates from the IDs in the P4Info index
+    p4info_index = p4rtclient.p4info.index
+    bridge_table = TableUpdateBuilder(p4info_index, 'MyIngress.bridge_table',
+                                      ['hdr.ethernet.dstAddr', 'standard_metadata.ingress_port'],
+                                      'MyIngress.drop')
+
+    # Install broadcast rule, with the CPU port unless learning from digests; on
+    # a warm restart, only the differences are written
+    if args.learning == 'digest':
+        broadcast_ports = mcast_group_ports
+        writes.add(DigestConfigUpdate(DigestId(p4info_index, LEARN_DIGEST)))
+        writes.add(TableUpdateBuilder(p4info_index, 'MyIngress.learn_table', [], 'MyIngress.learn').build_default())
+    else:
+        broadcast_ports = mcast_group_ports + [BRIDGE_CPU_PORT]
+        if warm:  # ... undo the digests of a run learning from them
+            writes.add(TableUpdateBuilder(p4info_index, 'MyIngress.learn_table', [], 'NoAction').build_default())
+    if warm:
+        SyncMulticastGroups(writes, {mcast_group_id: broadcast_ports})
+    else:
+        InstallMcastGrpEntry(writes, mcast_group_id, broadcast_ports)
+    writes.flush()
+
+    # Log the learned entries from the shadow table, unless the switch table is read
+    snapshot = None
+    if args.table_log == 'diff':
+        snapshot = SnapshotWriter(LOGS_DIR, '{0}-table'.format(bridge_name), BridgeTablePath)
+
+    # Cache the learned bridge table entries, as {mac: port}
+    bridge_table_cache = ShadowTable('MyIngress.bridge_table', [] if snapshot is None else [snapshot])
+
+    # Evict learned entries before the bridge table is full
+    table_capacity = TableCapacity(bridge_table_cache, bridge_table.table_id, TABLE_SIZE, writes,
+                                   functools.partial(BridgeTableUpdate, bridge_table),
+                                   functools.partial(BridgeTableKey, bridge_table), args.eviction_policy)
+
+    # Reconcile the cached entries with the switch table once in a while
+    reconciler = TableReconciler(writes, bridge_table_cache, bridge_table.table_id,
+                                 functools.partial(BridgeTableKey, bridge_table),
+                                 args.reconcile_interval)
+
+    # Take over the entries learned before a warm restart
+    if warm:
+        reconciler.reconcile(adopt=True)
+
+    # Time the stages of the packet-processing loop, with the write counts of the batcher
+    hotpath = HotPathMonitor(LOGS_DIR, bridge_name, args.profiler)
+    hotpath.sources.append(lambda: {'table_writes': writes.num_updates, 'write_failures': writes.num_errors})
 
     # Start the packet-processing loop
-    ProcPacketIn(bridge_name, LOGS_DIR, NUM_LOGS_THRESHOLD)
+    ProcPacketIn(bridge_name, writes, bridge_table, bridge_table_cache, table_capacity, reconciler,
+                 hotpath, snapshot, args.learning, int(args.idle_timeout * 1e9), LOGS_DIR, NUM_LOGS_THRESHOLD)
 
     print("Bridge Stopped")
-
-    # Delete the broadcast rule
-    DeleteMcastGrpEntry(mcast_group_id)
+    hotpath.close()
+
+    # Delete the broadcast rule, unless the bridge is left running for a warm restart
+    if not args.warm_restart:
+        DeleteMcastGrpEntry(writes, mcast_group_id)
+
+    # Write the remaining updates
+    writes.close()
+    if snapshot is not None:
+        snapshot.close()
+    log.info("Shadow table %s", bridge_table_cache.stats(), extra={'kind': 'shadow'})
+    log.info("Table capacity %s", table_capacity.stats(), extra={'kind': 'eviction'})
+    log.info("Writes: %d updates in %d RPCs, %d failed, %d early flushes", writes.num_updates,
+             writes.num_writes, writes.num_errors, writes.num_conflicts, extra={'kind': 'writes'})
+    controller_log.close()
 
     # Close the P4Runtime connection
-    p4sh.teardown()
+    p4rtclient.client.tear_down()
@@ -0,0 +1,125 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import itertools
+import grpc
+from p4.v1 import p4runtime_pb2 as p4rt
+from ratelog import get_logger
+from reconcile import ReadTableEntries
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Occupancy (fraction of the table size) at which entries are evicted, and
+# occupancy the eviction brings the table back to
+HIGH_WATER_MARK = 0.9
+LOW_WATER_MARK = 0.8
+
+# Eviction policies: least recently learned, or least recently hit on the switch
+EVICTION_POLICIES = ['lru', 'lru-hit']
+
+
+###############################################################################
+# Table capacity manager
+###############################################################################
+
+# Keeps a learned table below its size by evicting entries.
+#
+# Occupancy is that of the shadow table. Once it reaches the high-water mark,
+# entries are deleted (in one batch) down to the low-water mark, picked by:
+# - 'lru': the least recently learned, in the order of the shadow table;
+# - 'lru-hit': the least recently hit, by reading the table back with the
+#   time since the last hit of each entry (needs support_timeout on the
+#   table); entries it does not find are picked as for 'lru'.
+# `table_id` is the P4Info ID of the table, `update_of(update_type, key, value)`
+# builds the update of a cached entry, and `key_of(table_entry)` gives the
+# (key, value) of a read-back entry.
+class TableCapacity:
+    def __init__(self, table_cache, table_id, size, writes, update_of, key_of, policy='lru',
+                 high_water=HIGH_WATER_MARK, low_water=LOW_WATER_MARK):
+        self.table_cache = table_cache
+        self.table_id = table_id
+        self.size = size
+        self.writes = writes
+        self.update_of = update_of
+        self.key_of = key_of
+        self.policy = policy
+        self.high_water = int(size * high_water)
+        self.low_water = int(size * low_water)
+        self.peak = 0
+        self.num_evictions = 0
+        self.num_rounds = 0
+
+    # Evict entries if the table reached its high-water mark
+    def check(self):
+        occupancy = len(self.table_cache)
+        if occupancy > self.peak:
+            self.peak = occupancy
+        if occupancy >= self.high_water:
+            self.evict(occupancy - self.low_water)
+
+    # Least recently learned entries, as (key, value), but those in `excluded`
+    def lru_victims(self, count, excluded=()):
+        return list(itertools.islice(((key, value) for key, value in self.table_cache.entries.items()
+                                      if key not in excluded), count))
+
+    # Least recently hit entries, as (key, value)
+    def lru_hit_victims(self, count):
+        candidates = []
+        for table_entry in ReadTableEntries(self.table_id, time_since_last_hit=True):
+            key, value = self.key_of(table_entry)
+            if self.table_cache.get(key) == value:
+                candidates.append((table_entry.time_since_last_hit.elapsed_ns, key, value))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        return [(key, value) for _, key, value in candidates[:count]]
+
+    # Delete `count` entries
+    def evict(self, count):
+        victims = []
+        if self.policy == 'lru-hit':
+            try:
+                victims = self.lru_hit_victims(count)
+            except grpc.RpcError as e:
+                log.warning("Reading %s failed, evicting by learning order: %s",
+                            self.table_cache.name, e.details(), extra={'kind': 'eviction'})
+        if len(victims) < count:
+            # ... entries not read back (e.g. not yet written) are evicted by learning order
+            excluded = set(key for key, _ in victims)
+            victims.extend(self.lru_victims(count - len(victims), excluded))
+
+        # Pending inserts go first, as a batch does not order its updates
+        self.writes.flush()
+        for key, value in victims:
+            self.table_cache.discard(key, value)
+            self.writes.add(self.update_of(p4rt.Update.DELETE, key, value))
+        self.writes.flush()
+
+        self.num_evictions += len(victims)
+        self.num_rounds += 1
+        log.info("Table %s full: %d entries evicted, occupancy %d/%d", self.table_cache.name,
+                 len(victims), len(self.table_cache), self.size, extra={'kind': 'eviction'})
+
+    # Occupancy and eviction counters, as a log message
+    def stats(self):
+        return '{0}: occupancy={1}/{2} peak={3} evictions={4} rounds={5} policy={6}'.format(
+            self.table_cache.name, len(self.table_cache), self.size, self.peak,
+            self.num_evictions, self.num_rounds, self.policy)
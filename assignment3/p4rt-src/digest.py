@@ -0,0 +1,71 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import p4rtclient
+from p4.v1 import p4runtime_pb2 as p4rt
+from tableupdate import FindP4InfoObject
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Learning modes: copies of the packets punted to the CPU port, or digests
+LEARNING_MODES = ['packet', 'digest']
+
+# Digest of the learned (source MAC, ..., ingress port), see p4-src/*.p4
+LEARN_DIGEST = 'learn_digest_t'
+
+# Seconds the switch may buffer digests, and digests it sends in one DigestList
+DIGEST_MAX_DELAY = 0.01
+DIGEST_MAX_LIST_SIZE = 256
+
+# Seconds the switch suppresses the same digest data while its list is not acknowledged
+DIGEST_ACK_TIMEOUT = 1
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# ID of a digest in the P4Info index
+def DigestId(p4info_index, digest_name):
+    return FindP4InfoObject(p4info_index['digests'], digest_name)
+
+# Update configuring how the switch batches and suppresses a digest
+def DigestConfigUpdate(digest_id, max_delay=DIGEST_MAX_DELAY, max_list_size=DIGEST_MAX_LIST_SIZE,
+                       ack_timeout=DIGEST_ACK_TIMEOUT):
+    update = p4rt.Update(type=p4rt.Update.INSERT)
+    digest_entry = update.entity.digest_entry
+    digest_entry.digest_id = digest_id
+    digest_entry.config.max_timeout_ns = int(max_delay * 1e9)
+    digest_entry.config.max_list_size = max_list_size
+    digest_entry.config.ack_timeout_ns = int(ack_timeout * 1e9)
+    return update
+
+# Values of the members of each digest of a DigestList, as tuples of integers
+def DigestValues(digest_list):
+    for data in digest_list.data:
+        yield tuple(int.from_bytes(member.bitstring, byteorder='big') for member in data.struct.members)
+
+# Acknowledge a DigestList, so that the switch may send its digests again
+def AckDigestList(digest_list):
+    req = p4rt.StreamMessageRequest()
+    req.digest_ack.digest_id = digest_list.digest_id
+    req.digest_ack.list_id = digest_list.list_id
+    p4rtclient.client.stream_out_q.put(req)
@@ -0,0 +1,83 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import p4rtclient
+from p4.v1 import p4runtime_pb2 as p4rt
+from ratelog import get_logger
+
+log = get_logger()
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Value of an exact match field of a table entry, as an integer
+def MatchValue(table_entry, field_id):
+    for match in table_entry.match:
+        if match.field_id == field_id:
+            return int.from_bytes(match.exact.value, byteorder='big')
+    return None
+
+# Value of a parameter of the action of a table entry, as an integer
+def ActionParamValue(table_entry, param_id):
+    for param in table_entry.action.action.params:
+        if param.param_id == param_id:
+            return int.from_bytes(param.value, byteorder='big')
+    return None
+
+# Drain the idle timeout notifications received so far; returns the timed-out entries
+def ReadIdleTimeouts():
+    notifications = p4rtclient.client.stream_in_q['idle_timeout_notification']
+    table_entries = []
+    while not notifications.empty():
+        rep = notifications.get_nowait()
+        if rep is None:  # ... the stream is closed
+            break
+        table_entries.extend(rep.idle_timeout_notification.table_entry)
+    return table_entries
+
+
+###############################################################################
+# Idle timeout handling
+###############################################################################
+
+# Delete the entries that timed out since the last call, in one batch.
+#
+# `key_of(table_entry)` gives the (key, value) of a timed-out entry in the
+# shadow table, which forgets it so that it is inserted again when its host is
+# next learned; entries rewritten since the notification are left alone. The
+# deletes are flushed right away, so they are never in the same batch as such
+# a re-insert. Returns the number of entries deleted.
+def ExpireIdleEntries(writes, table_cache, key_of):
+    num_deleted = 0
+    for table_entry in ReadIdleTimeouts():
+        if not table_cache.expire(*key_of(table_entry)):
+            continue
+
+        update = p4rt.Update(type=p4rt.Update.DELETE)
+        update.entity.table_entry.table_id = table_entry.table_id
+        update.entity.table_entry.match.extend(table_entry.match)
+        writes.add(update)
+        num_deleted += 1
+
+    if num_deleted:
+        writes.flush()
+        log.info("Idle entries deleted: %d from %s", num_deleted, table_cache.name,
+                 extra={'kind': 'idle_timeout'})
+    return num_deleted
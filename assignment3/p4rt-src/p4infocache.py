@@ -0,0 +1,120 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import os
+import sys
+import json
+import hashlib
+from p4.config.v1 import p4info_pb2
+from snapshot import write_atomic
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Directory of the compiled P4Info files, next to the text P4Info files
+CACHE_DIRNAME = '.p4info-cache'
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Name to ID index of a P4Info: {'tables': {name: {'id': ID, 'match_fields':
+# {name: ID}}}, 'actions': {name: {'id': ID, 'params': {name: ID}}}, 'digests':
+# {name: ID}}
+def P4InfoIndex(p4info):
+    return {
+        'tables': {table.preamble.name: {'id': table.preamble.id,
+                                         'match_fields': {mf.name: mf.id for mf in table.match_fields}}
+                   for table in p4info.tables},
+        'actions': {action.preamble.name: {'id': action.preamble.id,
+                                           'params': {param.name: param.id for param in action.params}}
+                    for action in p4info.actions},
+        'digests': {digest.preamble.name: digest.preamble.id for digest in p4info.digests},
+    }
+
+
+###############################################################################
+# Compiled P4Info
+###############################################################################
+
+# P4Info of a text P4Info file (cfg/<name>-p4info.txt), compiled on first use.
+#
+# Parsing the text format is the slow part of loading a P4Info, so the first
+# load of a file content writes it to the cache directory as a binary P4Info
+# and a JSON name to ID index, both named after the SHA-256 of the content:
+# later loads (of any file with that content) only read them, and rebuilding
+# the P4 program without changes keeps the cache valid. `index` is loaded
+# eagerly, for the table update builders; the P4Info message only when needed
+# (pushing the pipeline, P4Runtime shell reads).
+class CompiledP4Info:
+    def __init__(self, p4info_path, cache_dir=None):
+        with open(p4info_path, 'rb') as infile:
+            self.text = infile.read()
+        self.hash = hashlib.sha256(self.text).hexdigest()
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(p4info_path), CACHE_DIRNAME)
+        self.bin_path = os.path.join(cache_dir, '{0}.bin'.format(self.hash))
+        self.index_path = os.path.join(cache_dir, '{0}.index.json'.format(self.hash))
+        self.message = None
+        self.cached = True
+        try:
+            with open(self.index_path, 'r') as infile:
+                self.index = json.load(infile)
+        except (OSError, ValueError):
+            self.cached = False
+            self.compile()
+
+    # Parse the text P4Info and write it to the cache; failing to write it
+    # (e.g. a read-only directory) only costs the next load a parse
+    def compile(self):
+        from google.protobuf import text_format  # ... only needed on a cache miss
+        self.message = p4info_pb2.P4Info()
+        text_format.Merge(self.text.decode(), self.message)
+        self.index = P4InfoIndex(self.message)
+        try:
+            os.makedirs(os.path.dirname(self.bin_path), exist_ok=True)
+            write_atomic(self.bin_path, self.message.SerializeToString())
+            write_atomic(self.index_path, json.dumps(self.index).encode())  # ... last: marks the entry complete
+        except OSError:
+            pass
+
+    # P4Info message
+    def p4info(self):
+        if self.message is None:
+            try:
+                with open(self.bin_path, 'rb') as infile:
+                    self.message = p4info_pb2.P4Info.FromString(infile.read())
+            except OSError:
+                self.compile()
+        return self.message
+
+
+###############################################################################
+# Main
+###############################################################################
+
+# Precompile P4Info files: python3 p4rt-src/p4infocache.py cfg/*-p4info.txt
+if __name__ == '__main__':
+    for p4info_path in sys.argv[1:]:
+        compiled = CompiledP4Info(p4info_path)
+        print("{0}: {1} ({2})".format(p4info_path, compiled.hash[:16],
+                                      'cached' if compiled.cached else 'compiled'))
@@ -0,0 +1,38 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+###############################################################################
+# P4Runtime connection
+###############################################################################
+
+# The P4Runtime connection of the controller (see warmstart.SetupP4Runtime),
+# kept here rather than in p4runtime_sh.shell: importing the shell pulls in
+# IPython, which takes most of the controller startup time. The shell is only
+# imported for what needs it, through Shell().
+client = None  # p4runtime_sh.p4runtime.P4RuntimeClient
+p4info = None  # p4infocache.CompiledP4Info
+
+# The P4Runtime shell, on the connection of the controller
+def Shell():
+    import p4runtime_sh.shell as p4sh  # ... imported on first use
+    if p4sh.client is not client:
+        p4sh.client = client
+        p4sh.context.set_p4info(p4info.p4info())
+    return p4sh
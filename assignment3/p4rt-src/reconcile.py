@@ -0,0 +1,96 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import time
+import logging
+import grpc
+import p4rtclient
+from p4.v1 import p4runtime_pb2 as p4rt
+from ratelog import get_logger
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Seconds between two read-back reconciliations of a learned table (0: never)
+RECONCILE_INTERVAL = 60
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Read all entries of a table, optionally with the time since their last hit
+def ReadTableEntries(table_id, time_since_last_hit=False):
+    entity = p4rt.Entity()
+    entity.table_entry.table_id = table_id
+    if time_since_last_hit:
+        entity.table_entry.time_since_last_hit.SetInParent()  # ... ask for it
+    req = p4rt.ReadRequest(device_id=p4rtclient.client.device_id, entities=[entity])
+    for rep in p4rtclient.client.stub.Read(req):
+        for read_entity in rep.entities:
+            yield read_entity.table_entry
+
+
+###############################################################################
+# Table reconciliation
+###############################################################################
+
+# Reads a learned table back from the switch every `interval` seconds, and
+# makes the shadow table match it (see ShadowTable.reconcile), so that the
+# table log and the occupancy stay right even if an update was lost.
+# `key_of(table_entry)` gives the (key, value) of a read-back entry.
+class TableReconciler:
+    def __init__(self, writes, table_cache, table_id, key_of, interval=RECONCILE_INTERVAL):
+        self.writes = writes
+        self.table_cache = table_cache
+        self.table_id = table_id
+        self.key_of = key_of
+        self.interval = interval
+        self.deadline = time.monotonic() + interval
+        self.num_rounds = 0
+        self.num_fixed = 0
+
+    # Reconcile the table if the interval has passed
+    def check(self):
+        if self.interval and time.monotonic() >= self.deadline:
+            self.reconcile()
+
+    # Read the table back and reconcile the shadow table with it; on a warm
+    # restart (`adopt`), the entries are expected to be unknown
+    def reconcile(self, adopt=False):
+        self.deadline = time.monotonic() + self.interval
+        self.writes.flush()  # ... so that the switch has every cached entry
+        try:
+            entries = dict(self.key_of(table_entry) for table_entry in ReadTableEntries(self.table_id))
+        except grpc.RpcError as e:
+            log.warning("Reading %s failed: %s", self.table_cache.name, e.details(),
+                        extra={'kind': 'reconcile'})
+            return
+
+        num_missing, num_unknown, num_different = self.table_cache.reconcile(entries)
+        num_fixed = num_missing + num_unknown + num_different
+        self.num_rounds += 1
+        self.num_fixed += num_fixed
+        log.log(logging.INFO if adopt else logging.WARNING if num_fixed else logging.DEBUG,
+                "Table %s reconciled: %d entries, %d missing, %d unknown, %d different",
+                self.table_cache.name, len(entries), num_missing, num_unknown, num_different,
+                extra={'kind': 'reconcile'})
@@ -0,0 +1,151 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import collections
+from google.rpc import code_pb2
+from p4.v1 import p4runtime_pb2 as p4rt
+
+
+###############################################################################
+# Shadow table
+###############################################################################
+
+# Controller-side copy of the entries of a P4 table, as {key: value}, e.g.
+# {(mac, vlan_id): port}, used to decide which writes a learned entry needs.
+#
+# `update` records a learned entry and returns the value it replaced: the same
+# value means the entry is already installed (a hit, nothing to write), None a
+# new entry (a miss, to insert), and another value a moved entry (to modify).
+# Writes that fail are undone through the handler from `write_failed`, so the
+# entry is written again when it is next learned; as the handler may run on the
+# thread of the write batcher, it only queues the failure, handled by
+# `handle_failed_writes` on the thread using the table. Entries are kept in
+# the order they were last learned, least recent first. Changes to the entries
+# are recorded to each of `observers`, through `learned(key, value, old_value)`
+# and `expired(key, value)` (e.g. a snapshot.ChangeLog).
+class ShadowTable:
+    def __init__(self, name, observers=()):
+        self.name = name
+        self.entries = {}
+        self.observers = list(observers)
+        self.failed_writes = collections.deque()
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_moves = 0
+        self.num_expired = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    # Record that `key` maps to `value`; returns the previous value, or None
+    def update(self, key, value):
+        old_value = self.entries.pop(key, None)
+        self.entries[key] = value
+        if old_value == value:
+            self.num_hits += 1
+            return old_value
+        if old_value is None:
+            self.num_misses += 1
+        else:
+            self.num_moves += 1
+        for observer in self.observers:
+            observer.learned(key, value, old_value)
+        return old_value
+
+    # Forget `key`, if it still maps to `value` (any value if None)
+    def discard(self, key, value=None):
+        cached_value = self.entries.get(key)
+        if cached_value is not None and (value is None or cached_value == value):
+            del self.entries[key]
+            for observer in self.observers:
+                observer.expired(key, cached_value)
+
+    # Forget an entry the switch timed out; returns False, keeping it, if it has
+    # been rewritten with another value since (the switch entry is then not stale)
+    def expire(self, key, value):
+        cached_value = self.entries.get(key)
+        if cached_value is None:
+            return True
+        if cached_value != value:
+            return False
+        del self.entries[key]
+        self.num_expired += 1
+        for observer in self.observers:
+            observer.expired(key, value)
+        return True
+
+    # Make the table match the entries read back from the switch, as {key: value}:
+    # entries missing from the switch are forgotten, and unknown ones adopted as
+    # the least recently learned. Returns the numbers of (missing, unknown,
+    # different) entries.
+    def reconcile(self, entries):
+        missing = [key for key in self.entries if key not in entries]
+        for key in missing:
+            self.discard(key)
+
+        unknown = {}
+        num_different = 0
+        for key, value in entries.items():
+            cached_value = self.entries.get(key)
+            if cached_value is None:
+                unknown[key] = value
+            elif cached_value != value:
+                self.entries[key] = value
+                num_different += 1
+            else:
+                continue
+            for observer in self.observers:
+                observer.learned(key, value, cached_value)
+        num_unknown = len(unknown)
+        if unknown:
+            unknown.update(self.entries)
+            self.entries = unknown
+        return len(missing), num_unknown, num_different
+
+    # Error handler for the write of `key` mapping to `value`, queuing the failure
+    def write_failed(self, writes, key, value):
+        def on_error(update, error):
+            self.failed_writes.append((writes, update, error, key, value))
+        return on_error
+
+    # Handle the queued write failures: an insert of an entry already on the
+    # switch is retried as a modify, unless the entry has been rewritten since,
+    # and any other failure forgets the entry
+    def handle_failed_writes(self):
+        while self.failed_writes:
+            writes, update, error, key, value = self.failed_writes.popleft()
+            if update.type == p4rt.Update.INSERT and error.canonical_code == code_pb2.ALREADY_EXISTS:
+                if self.entries.get(key) == value:
+                    writes.add(p4rt.Update(type=p4rt.Update.MODIFY, entity=update.entity),
+                               self.write_failed(writes, key, value))
+            else:
+                self.discard(key, value)
+
+    # Entries and lookup counters, as a log message
+    def stats(self):
+        num_lookups = self.num_hits + self.num_misses + self.num_moves
+        return '{0}: entries={1} hits={2} misses={3} moves={4} expired={5} hit_ratio={6:.1f}%'.format(
+            self.name, len(self.entries), self.num_hits, self.num_misses, self.num_moves,
+            self.num_expired, 100.0 * self.num_hits / num_lookups if num_lookups else 0.0)
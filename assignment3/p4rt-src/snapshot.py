@@ -0,0 +1,194 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import json
+import queue
+import threading
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Compact the change log into a full snapshot every so many commits, or as soon
+# as it holds that many records
+COMPACT_EVERY_COMMITS = 100
+COMPACT_MAX_RECORDS = 10000
+
+# Entries up to which the table is small enough to be written out as a full
+# snapshot on every commit with changes
+COMPACT_MAX_ENTRIES = 1000
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Write a file atomically: write a temporary file, sync it, then rename it over;
+# `data` is text or bytes, and the temporary file is per process, so that
+# processes writing the same file (e.g. a P4Info cache entry) do not clash
+def write_atomic(path, data):
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as outfile:
+        outfile.write(data)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(tmp_path, path)
+
+# Apply a change record to a table of nested {part: ... {last part: {'port': port}}};
+# returns the change in the number of entries
+def apply_change(table, record):
+    *path, last = record['key']
+    nodes = [table]
+    for part in path:
+        nodes.append(nodes[-1].setdefault(part, {}))
+    if record['op'] == 'expire':
+        if nodes[-1].pop(last, None) is None:
+            return 0
+        for part, node, parent in reversed(list(zip(path, nodes[1:], nodes))):
+            if node:
+                break
+            del parent[part]
+        return -1
+    num_added = 0 if last in nodes[-1] else 1
+    nodes[-1][last] = {'port': record['port']}
+    return num_added
+
+# Load a table from its snapshot and replay its change log on top of it; a
+# last record cut short (e.g. by a crash while appending) is skipped
+def load_table(snapshot_path, changes_path):
+    with open(snapshot_path, 'r') as infile:
+        table = json.load(infile)
+    if os.path.exists(changes_path):
+        with open(changes_path, 'r') as infile:
+            for line in infile:
+                if not line.endswith('\n'):
+                    break
+                apply_change(table, json.loads(line))
+    return table
+
+
+###############################################################################
+# Snapshot writer
+###############################################################################
+
+# Records learned, moved and expired entries of a shadow table, as (key, port),
+# and hands them over in commits to the queue of a SnapshotWriter. Changes may
+# be recorded from any thread (e.g. write error handlers).
+class ChangeLog:
+    def __init__(self, commits):
+        self.changes = []
+        self.commits = commits
+        self.lock = threading.Lock()
+
+    # Record a learned entry; nothing is logged if it was already learned on that port
+    def learned(self, key, port, old_port=None):
+        if old_port is None:
+            with self.lock:
+                self.changes.append(('learn', key, port))
+        elif old_port != port:
+            with self.lock:
+                self.changes.append(('move', key, port))
+
+    # Record an expired (timed out, evicted or failed) entry
+    def expired(self, key, port):
+        with self.lock:
+            self.changes.append(('expire', key, port))
+
+    # Hand the changes recorded so far to the background thread
+    def commit(self):
+        with self.lock:
+            changes, self.changes = self.changes, []
+        self.commits.put(changes)
+
+
+# Logs the entries installed by the controller without reading the switch.
+#
+# As in assignment2, the controller only records changes, and `commit` hands
+# them in O(1) to a background thread, which appends them to a change log
+# (`<name>.changes.jsonl`, one JSON record per line) and writes its own copy of
+# the table as a full JSON snapshot (`<name>.json`), renamed atomically, before
+# truncating the log: on every commit with changes while the table is small,
+# periodically otherwise. `key_path(key)` gives the JSON path of
+# a shadow table key, e.g. [vlan, mac] for the switch and [mac] for the bridge.
+class SnapshotWriter(ChangeLog):
+    def __init__(self, logs_dir, name, key_path, compact_every=COMPACT_EVERY_COMMITS,
+                 compact_max_records=COMPACT_MAX_RECORDS, compact_max_entries=COMPACT_MAX_ENTRIES):
+        super().__init__(queue.SimpleQueue())
+        self.snapshot_path = '{0}/{1}.json'.format(logs_dir, name)
+        self.changes_path = '{0}/{1}.changes.jsonl'.format(logs_dir, name)
+        self.key_path = key_path
+        self.compact_every = compact_every
+        self.compact_max_records = compact_max_records
+        self.compact_max_entries = compact_max_entries
+        self.table = {}
+        self.num_entries = 0
+        self.thread = threading.Thread(target=self.run, name='snapshot', daemon=True)
+        self.thread.start()
+
+    # Commit, then wait for the background thread to write a final snapshot
+    def close(self):
+        self.commit()
+        self.commits.put(None)
+        self.thread.join()
+
+    # Write the full table and start a new change log
+    def compact(self):
+        write_atomic(self.snapshot_path, json.dumps(self.table))
+        write_atomic(self.changes_path, '')
+
+    # Background thread
+    def run(self):
+        self.compact()
+        num_commits = 0
+        num_records = 0
+        closing = False
+        while not closing:
+            changes = self.commits.get()
+            if changes is None:
+                break
+            # Coalesce the commits that queued up while writing
+            while not self.commits.empty():
+                more = self.commits.get()
+                if more is None:
+                    closing = True
+                    break
+                changes.extend(more)
+            num_commits += 1
+
+            if not changes:
+                continue
+            records = []
+            for op, key, port in changes:
+                record = {'op': op, 'key': self.key_path(key), 'port': port}
+                self.num_entries += apply_change(self.table, record)
+                records.append(record)
+            num_records += len(records)
+
+            # A small table is written out whole, instead of appending to the log
+            if self.num_entries <= self.compact_max_entries or \
+               num_records >= self.compact_max_records or num_commits >= self.compact_every:
+                self.compact()
+                num_commits = 0
+                num_records = 0
+            else:
+                with open(self.changes_path, 'a') as outfile:
+                    outfile.write(''.join(json.dumps(record) + '\n' for record in records))
+
+        self.compact()
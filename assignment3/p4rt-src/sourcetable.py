@@ -0,0 +1,48 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+from p4.v1 import p4runtime_pb2 as p4rt
+
+
+###############################################################################
+# Source table
+###############################################################################
+
+# Mirrors a shadow table of {key: port} into a table of the learned sources,
+# matching on the key followed by the port, e.g. (MAC, VLAN ID, ingress port)
+# for {(MAC, VLAN ID): port}, so that the switch stops sending packets from
+# them to the controller.
+#
+# Registered as an observer of the shadow table, it writes a source entry for
+# every learned entry and deletes it when the entry moves, expires, is evicted
+# or fails to be written, so a forgotten source is punted, and learned, again.
+class SourceTable:
+    def __init__(self, writes, src_table):
+        self.writes = writes
+        self.src_table = src_table
+
+    # Record a learned entry; the source entry of its old port is replaced
+    def learned(self, key, port, old_port=None):
+        if old_port is not None:
+            self.writes.add(self.src_table.build(p4rt.Update.DELETE, key + (old_port,)))
+        self.writes.add(self.src_table.build(p4rt.Update.INSERT, key + (port,)))
+
+    # Record a forgotten entry
+    def expired(self, key, port):
+        self.writes.add(self.src_table.build(p4rt.Update.DELETE, key + (port,)))
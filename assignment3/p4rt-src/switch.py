@@ -19,10 +19,29 @@
 
 
 import json
+import time
+import logging
 import argparse
+import functools
 import contextlib
-import p4runtime_sh.shell as p4sh
+import p4rtclient
 from p4.v1 import p4runtime_pb2 as p4rt
+from ratelog import LOG_RATE, ControllerLog, Lazy, get_logger, parse_samples
+from writebatch import WriteBatcher
+from tableupdate import MulticastGroupUpdate, TableUpdateBuilder
+from shadow import ShadowTable
+from sourcetable import SourceTable
+from capacity import EVICTION_POLICIES, TableCapacity
+from snapshot import SnapshotWriter, write_atomic
+from reconcile import RECONCILE_INTERVAL, TableReconciler
+from digest import LEARN_DIGEST, LEARNING_MODES, AckDigestList, DigestConfigUpdate, DigestId, DigestValues
+from topoconfig import TOPO_WATCH_INTERVAL, DiffGroups, LoadSwitchConfig, TopoConfigWatcher
+from warmstart import SetupP4Runtime, SyncMulticastGroups, SyncTableEntries
+from hotpath import PROFILER, PROFILERS, HotPathMonitor
+from idletimeout import ActionParamValue, ExpireIdleEntries, MatchValue
+from ethernet import ETH_TYPE_ARP, VLAN_ID_MASK, mac2str, parse_eth
+
+log = get_logger()
 
 ###############################################################################
 # Default parameters
@@ -39,48 +58,139 @@ BRIDGE_CPU_PORT = 255
 # Logs threshold
 NUM_LOGS_THRESHOLD = 10
 
-# Ethernet type values (https://en.wikipedia.org/wiki/EtherType)
-ETH_TYPE_ARP = 0x0806
-ETH_TYPE_VLAN = 0x8100
+# Seconds a learned entry may go unused before the switch times it out (0: never)
+IDLE_TIMEOUT = 300
 
+# Entries of the learned switch table (`size` in p4-src/switch.p4), and how
+# entries are evicted before it is full
+TABLE_SIZE = 1024
+EVICTION_POLICY = 'lru'
 
-###############################################################################
-# Helper functions
-###############################################################################
+# Learn from copies of the ARP packets sent to the CPU port ('packet'), or from digests ('digest')
+LEARNING_MODE = 'packet'
 
-# MAC address in bytes to string
-def mac2str(mac):
-	return ':'.join('{:02x}'.format(b) for b in mac)
+# Table log: JSON diffs of the shadow table ('diff'), or a read of the switch table ('read')
+TABLE_LOG = 'diff'
+
+# Log level of the controller messages (per-packet messages are logged at DEBUG)
+LOG_LEVEL = 'INFO'
 
 
 ###############################################################################
 # Multicast group functions
 ###############################################################################
 
-# Create a multicast group entry
-def InstallMcastGrpEntry(mcast_group_id, bridge_ports):
-	mcast_entry = p4sh.MulticastGroupEntry(mcast_group_id)
-	for port in bridge_ports:
-		mcast_entry.add(port)
-	mcast_entry.insert()
+# Create a multicast group entry (written with the next batch of `writes`)
+def InstallMcastGrpEntry(writes, mcast_group_id, bridge_ports):
+	writes.add(MulticastGroupUpdate(p4rt.Update.INSERT, mcast_group_id, bridge_ports))
+
+# Delete a multicast group entry (written with the next batch of `writes`)
+def DeleteMcastGrpEntry(writes, mcast_group_id):
+	writes.add(MulticastGroupUpdate(p4rt.Update.DELETE, mcast_group_id))
+
+
+###############################################################################
+# VLAN table functions
+###############################################################################
 
-# Delete a multicast group entry
-def DeleteMcastGrpEntry(mcast_group_id):
-	mcast_entry = p4sh.MulticastGroupEntry(mcast_group_id)
-	mcast_entry.delete()
+# Match values of the VLAN table entries of a {VLAN ID: ports} map: (egress port, VLAN ID)
+def VlanTableMatches(vlan_id_to_ports_map):
+	return [(port, vlan_id) for vlan_id, ports in vlan_id_to_ports_map.items() for port in ports]
+
+# Log the VLAN table: the VLAN rules as {VLAN ID: ports}, or a read of the
+# switch table (which needs the P4Runtime shell, slow to import)
+def LogVlanTable(logs_dir, switch_name, vlan_id_to_ports_map, table_log):
+	if table_log == 'diff':
+		write_atomic('{0}/{1}-vlan-table.json'.format(logs_dir, switch_name),
+					 json.dumps({str(vlan_id): ports for vlan_id, ports in vlan_id_to_ports_map.items()}))
+	else:
+		with open('{0}/{1}-vlan-table.json'.format(logs_dir, switch_name), 'w') as outfile:
+			with contextlib.redirect_stdout(outfile):
+				p4rtclient.Shell().TableEntry('MyEgress.vlan_table').read(lambda te: print(te))
+	log.info("Log committed to %s/%s-vlan-table.json", logs_dir, switch_name,
+			 extra={'kind': 'logs'})
+
+# Write only the differences between two switch configs, in one batch: the
+# ports of the broadcast group (plus `cpu_ports`), and the VLAN table entries
+def UpdateSwitchConfig(writes, vlan_table, cpu_ports, old_config, new_config):
+	if set(old_config.mcast_group_ports) != set(new_config.mcast_group_ports):
+		writes.add(MulticastGroupUpdate(p4rt.Update.MODIFY, new_config.mcast_group_id,
+										new_config.mcast_group_ports + cpu_ports))
+
+	# Only the VLANs whose ports changed are compared entry by entry
+	old_map = old_config.vlan_id_to_ports_map
+	inserted, modified, deleted = DiffGroups(old_map, new_config.vlan_id_to_ports_map)
+	new_matches = set(VlanTableMatches(inserted)) | set(VlanTableMatches(modified))
+	old_matches = set(VlanTableMatches({vlan_id: old_map[vlan_id] for vlan_id in list(modified) + deleted}))
+	for match_values in new_matches - old_matches:
+		writes.add(vlan_table.build(p4rt.Update.INSERT, match_values))
+	for match_values in old_matches - new_matches:
+		writes.add(vlan_table.build(p4rt.Update.DELETE, match_values))
+	writes.flush()
+	log.info("VLAN table: %d inserted, %d deleted", len(new_matches - old_matches),
+			 len(old_matches - new_matches), extra={'kind': 'reload'})
 
 
 ###############################################################################
 # Packet processing functions
 ###############################################################################
 
-# Process incoming packets
-def ProcPacketIn(switch_name, logs_dir, num_logs_threshold):
+# Update of the switch table entry forwarding (MAC, VLAN ID) `key` to `port`
+def SwitchTableUpdate(switch_table, update_type, key, port, idle_timeout_ns=0):
+	return switch_table.build(update_type, key, (port,), idle_timeout_ns)
+
+# JSON path of a switch table entry in the table log: [VLAN ID, MAC]
+def SwitchTablePath(key):
+	mac, vlan_id = key
+	return [str(vlan_id), mac2str(mac)]
+
+# Shadow table key and value of a switch table entry: (MAC, VLAN ID) and port,
+# by the match field and parameter IDs of `switch_table`
+def SwitchTableKey(switch_table, table_entry):
+	mac_field_id, vlan_id_field_id = switch_table.field_ids
+	key = (MatchValue(table_entry, mac_field_id), MatchValue(table_entry, vlan_id_field_id))
+	return key, ActionParamValue(table_entry, switch_table.param_ids[0])
+
+# Learn that (MAC, VLAN ID) `key` is behind `port`, writing the entry only if
+# it is new (insert) or has moved (modify)
+def LearnSwitchEntry(writes, switch_table, switch_table_cache, table_capacity, key, port, idle_timeout_ns):
+	old_port = switch_table_cache.update(key, port)
+	if old_port != port:
+		update_type = p4rt.Update.INSERT if old_port is None else p4rt.Update.MODIFY
+		writes.add(SwitchTableUpdate(switch_table, update_type, key, port, idle_timeout_ns),
+				   switch_table_cache.write_failed(writes, key, port))
+
+		# Make room for the next entries if the table is nearly full
+		table_capacity.check()
+
+# Process incoming packets, or digests in digest learning mode
+def ProcPacketIn(switch_name, writes, switch_table, switch_table_cache, table_capacity, reconciler,
+				 topo_watcher, hotpath, snapshot, learning, idle_timeout_ns, logs_dir, num_logs_threshold):
+	stats = hotpath.stats
+	switch_table_key = functools.partial(SwitchTableKey, switch_table)
 	try:
 		num_logs = 0
 		while True:
-			rep = p4sh.client.get_stream_packet("packet", timeout=1)
+			# Time the dequeue of a message already waiting, not the wait for one
+			start = time.perf_counter_ns()
+			rep = p4rtclient.client.get_stream_packet(learning, timeout=0)
 			if rep is not None:
+				now = stats.record('receive', start)
+			else:
+				rep = p4rtclient.client.get_stream_packet(learning, timeout=1)
+				now = time.perf_counter_ns()
+			if rep is not None and learning == 'digest':
+				if log.isEnabledFor(logging.DEBUG):
+					log.debug("DigestList: %d digests", len(rep.digest.data), extra={'kind': 'digest'})
+
+				# Learn the whole list, then let the switch send these digests again
+				for src_mac, vlan_id, ingress_port in DigestValues(rep.digest):
+					LearnSwitchEntry(writes, switch_table, switch_table_cache, table_capacity,
+									 (src_mac, vlan_id), ingress_port, idle_timeout_ns)
+				AckDigestList(rep.digest)
+				stats.count('packets', len(rep.digest.data))
+				now = stats.record('learn', now)
+			elif rep is not None:
 				# Read the raw packet
 				payload = rep.packet.payload
 				
@@ -88,78 +198,96 @@ def ProcPacketIn(switch_name, logs_dir, num_logs_threshold):
 				ingress_port_in_bytes = rep.packet.metadata[0].value
 				ingress_port = int.from_bytes(ingress_port_in_bytes, "big")
 
-				# Parse Ethernet header
-				dst_mac_in_bytes = payload[0:6]
-				dst_mac = mac2str(dst_mac_in_bytes)
-				src_mac_in_bytes = payload[6:12]
-				src_mac = mac2str(src_mac_in_bytes)
-				eth_type_in_bytes = payload[12:14]
-				eth_type = int.from_bytes(eth_type_in_bytes, "big")
-
-				if eth_type == ETH_TYPE_VLAN:
-					# Parse VLAN header
-					vlan_id_in_bytes = payload[14:16]
-					vlan_id = int.from_bytes(vlan_id_in_bytes, "big")
-
-					print("PacketIn: dst={0} src={1} vlan={2} port={3}".format(
-						dst_mac, src_mac, vlan_id, ingress_port))
-				else:
-					print("PacketIn: dst={0} src={1} port={2}".format(
-						dst_mac, src_mac, ingress_port))
+				# Parse Ethernet and VLAN headers (MAC addresses as integers)
+				dst_mac, src_mac, eth_type, vlan_tci, inner_eth_type = parse_eth(payload)
 
-				try:
-					with contextlib.redirect_stdout(None):  # A hack to suppress print statements 
-						# within the table_entry.match get/set objects
+				if vlan_tci is not None:
+					vlan_id = vlan_tci & VLAN_ID_MASK
 
+					if log.isEnabledFor(logging.DEBUG):
+						log.debug("PacketIn: dst=%s src=%s vlan=%d port=%d", Lazy(mac2str, dst_mac),
+								  Lazy(mac2str, src_mac), vlan_id, ingress_port, extra={'kind': 'packet_in'})
+				else:
+					vlan_id = 0
 
+					if log.isEnabledFor(logging.DEBUG):
+						log.debug("PacketIn: dst=%s src=%s port=%d", Lazy(mac2str, dst_mac),
+								  Lazy(mac2str, src_mac), ingress_port, extra={'kind': 'packet_in'})
 
+				now = stats.record('parse', now)
 
-						##################################################################################
-						# Learning Switch Logic - Begins #################################################
-						##################################################################################
+				try:
+					##################################################################################
+					# Learning Switch Logic - Begins #################################################
+					##################################################################################
 
-						# TODO: For each incoming ARP packet, learn the mapping between the tuple (source 
-						# Ethernet address, VLAN ID) to ingress port. For non-VLAN packets, set the VLAN 
-						# ID to 0. 
-						# Install flow entries in switch table (you specified in the P4 program):
-						#   - Match fields: Ethernet address, VLAN ID
-						#   - Action: `MyIngress.forward`` | parameter: `port``
-						#
-						# NOTE: please follow p4rt-src/bridge.py for a reference example on how to install
-						# table entries.
+					# TODO: For each incoming ARP packet, learn the mapping between the tuple (source 
+					# Ethernet address, VLAN ID) to ingress port. For non-VLAN packets, set the VLAN 
+					# ID to 0. 
+					# Install flow entries in switch table (you specified in the P4 program):
+					#   - Match fields: Ethernet address, VLAN ID
+					#   - Action: `MyIngress.forward`` | parameter: `port``
+					#
+					# NOTE: please follow p4rt-src/bridge.py for a reference example on how to install
+					# table entries.
 
 
-						#### ADD YOUR CODE HERE ... ####
-						# pass
-						if eth_type == ETH_TYPE_ARP:
-							vlan_id = vlan_id if eth_type == ETH_TYPE_VLAN else 0
-							table_entry = p4sh.TableEntry('MyIngress.switch_table')(action='MyIngress.forward')
-							table_entry.match['hdr.ethernet.dstAddr'] = src_mac
-							table_entry.match['meta.vid'] = str(vlan_id)
-							table_entry.action['port'] = str(ingress_port)
-							table_entry.insert()
+					#### ADD YOUR CODE HERE ... ####
+					# pass
+					if inner_eth_type == ETH_TYPE_ARP:
+						LearnSwitchEntry(writes, switch_table, switch_table_cache, table_capacity,
+										 (src_mac, vlan_id), ingress_port, idle_timeout_ns)
 
 
 
-						##################################################################################
-						# Learning Switch Logic - Ends ###################################################
-						##################################################################################
+					##################################################################################
+					# Learning Switch Logic - Ends ###################################################
+					##################################################################################
 
 
 
 
 				except:
 					pass
+				stats.count('packets')
+				now = stats.record('learn', now)
+
+			# Delete the learned entries the switch timed out
+			ExpireIdleEntries(writes, switch_table_cache, switch_table_key)
+			now = stats.record('aging', now)
+
+			# Send the learned entries once the burst of PacketIns (or DigestLists) is drained
+			if p4rtclient.client.stream_in_q[learning].empty():
+				writes.flush()
+				stats.record('table_write', now)
+
+			# Forget (or retry) the learned entries whose writes failed
+			switch_table_cache.handle_failed_writes()
 
 			# Log the Ethernet address to port mapping
 			num_logs += 1
 			if num_logs == num_logs_threshold:
 				num_logs = 0
-				with open('{0}/{1}-table.json'.format(logs_dir, switch_name), 'w') as outfile:
-					with contextlib.redirect_stdout(outfile):
-						p4sh.TableEntry('MyIngress.switch_table').read(lambda te: print(te))
-				print(
-					"INFO: Log committed to {0}/{1}-table.json".format(logs_dir, switch_name))
+				if snapshot is not None:
+					snapshot.commit()  # ... written out in the background
+				else:
+					writes.flush()
+					with open('{0}/{1}-table.json'.format(logs_dir, switch_name), 'w') as outfile:
+						with contextlib.redirect_stdout(outfile):
+							p4rtclient.Shell().TableEntry('MyIngress.switch_table').read(lambda te: print(te))
+					log.info("Log committed to %s/%s-table.json", logs_dir, switch_name,
+							 extra={'kind': 'logs'})
+				log.debug("Shadow table %s", Lazy(switch_table_cache.stats), extra={'kind': 'shadow'})
+				log.debug("Table capacity %s", Lazy(table_capacity.stats), extra={'kind': 'eviction'})
+
+			# Check the learned entries against the switch, once in a while
+			reconciler.check()
+
+			# Apply the changes of the topo config, if any
+			topo_watcher.check()
+
+			# Start or stop the profiler, or dump the hot path stats, if signaled
+			hotpath.check()
 	except KeyboardInterrupt:
 		return None
 
@@ -173,121 +301,209 @@ if __name__ == '__main__':
 						type=str, action="store", default='50001')
 	parser.add_argument('--topo-config', help='Topology Configuration File', required=True,
 						type=str, action="store")
+	parser.add_argument('--log-level', help='Log Level', choices=['DEBUG', 'INFO', 'WARNING'],
+						type=str, action="store", default=LOG_LEVEL)
+	parser.add_argument('--log-rate', help='Log Records per Second per Message Type',
+						type=float, action="store", default=LOG_RATE)
+	parser.add_argument('--log-sample', help='Log 1 in N Records of a Message Type (type=N)',
+						type=str, action="append", default=[])
+	parser.add_argument('--idle-timeout', help='Idle Timeout of Learned Entries in Seconds (0: never)',
+						type=float, action="store", default=IDLE_TIMEOUT)
+	parser.add_argument('--learning', help='Learning Mode (packet: copies sent to the CPU port, digest: digests)',
+						choices=LEARNING_MODES, type=str, action="store", default=LEARNING_MODE)
+	parser.add_argument('--table-log', help='Table Log (diff: JSON diffs of the learned entries, read: switch table read)',
+						choices=['diff', 'read'], type=str, action="store", default=TABLE_LOG)
+	parser.add_argument('--reconcile-interval', help='Seconds Between Two Read-Back Reconciliations (0: never)',
+						type=float, action="store", default=RECONCILE_INTERVAL)
+	parser.add_argument('--topo-watch-interval', help='Seconds Between Two Checks of the Topo Config for Changes (0: on SIGHUP only)',
+						type=float, action="store", default=TOPO_WATCH_INTERVAL)
+	parser.add_argument('--warm-restart', help='Keep the Running Pipeline and Entries Across Restarts',
+						action="store_true")
+	parser.add_argument('--eviction-policy', help='Eviction Policy of Learned Entries (table nearly full)',
+						choices=EVICTION_POLICIES, type=str, action="store", default=EVICTION_POLICY)
+	parser.add_argument('--profiler', help='Profiler Toggled by SIGUSR1 (stats dumped on SIGUSR2)',
+						choices=PROFILERS, type=str, action="store", default=PROFILER)
 	args = parser.parse_args()
 
+	# Log through the rate-limited background writer
+	controller_log = ControllerLog(args.log_level, args.log_rate,
+								   samples=parse_samples(args.log_sample))
+
 	# Create a bridge name postfixed with the grpc port number
 	switch_name = 'switch-{0}'.format(args.grpc_port)
 
 	# Get Multicast/VLAN ID to ports mapping
-	with open(args.topo_config, 'r') as infile:
-		topo_config = json.loads(infile.read())
-
-	mcast_group_id = topo_config['switch'][args.grpc_port]['mcast']['id']
-	mcast_group_ports = topo_config['switch'][args.grpc_port]['mcast']['ports']
-
-	vlan_id_to_ports_map = {}
-	for vlan_id, ports in topo_config['switch'][args.grpc_port]['vlan_id_to_ports'].items():
-		vlan_id_to_ports_map[int(vlan_id)] = ports
-
-	# Setup the P4Runtime connection with the bridge
-	p4sh.setup(
-		device_id=BRIDGE_ID, grpc_addr='127.0.0.1:{0}'.format(args.grpc_port), election_id=(0, 1),
-		config=p4sh.FwdPipeConfig(
-			'{0}/{1}-p4info.txt'.format(CFG_DIR, switch_name),  # Path to P4Info file
-			'{0}/{1}.json'.format(CFG_DIR, switch_name)  # Path to config file
-		)
+	switch_config = LoadSwitchConfig(args.topo_config, args.grpc_port)
+
+	mcast_group_id = switch_config.mcast_group_id
+	mcast_group_ports = switch_config.mcast_group_ports
+	vlan_id_to_ports_map = switch_config.vlan_id_to_ports_map  # ... updated in place on a reload
+
+	# Setup the P4Runtime connection with the bridge, keeping its pipeline and
+	# entries on a warm restart if it runs the same configuration
+	warm = SetupP4Runtime(
+		BRIDGE_ID, '127.0.0.1:{0}'.format(args.grpc_port), (0, 1),
+		'{0}/{1}-p4info.txt'.format(CFG_DIR, switch_name),  # Path to P4Info file
+		'{0}/{1}.json'.format(CFG_DIR, switch_name),  # Path to config file
+		args.warm_restart
 	)
 
 	print("Switch Started @ Port: {0}".format(args.grpc_port))
 	print("Press CTRL+C to stop ...")
 
-	# Install broadcast rule
-	InstallMcastGrpEntry(mcast_group_id, mcast_group_ports + [BRIDGE_CPU_PORT])
+	# Batch the P4Runtime writes
+	writes = WriteBatcher()
+
+	# Build the table updates from the IDs in the P4Info index
+	p4info_index = p4rtclient.p4info.index
+	switch_table = TableUpdateBuilder(p4info_index, 'MyIngress.switch_table', ['hdr.ethernet.dstAddr', 'meta.vid'],
+									  'MyIngress.forward', ['port'])
+	vlan_table = TableUpdateBuilder(p4info_index, 'MyEgress.vlan_table',
+									['standard_metadata.egress_port', 'meta.vid'], 'MyEgress.noop')
+	src_table = TableUpdateBuilder(p4info_index, 'MyIngress.src_table',
+								   ['hdr.ethernet.srcAddr', 'meta.vid', 'standard_metadata.ingress_port'],
+								   'MyIngress.src_learned')
+
+	# Install broadcast rule, copying ARP packets to the CPU port unless learning
+	# from digests; on a warm restart, only the differences are written
+	if args.learning == 'digest':
+		cpu_ports = []
+		writes.add(DigestConfigUpdate(DigestId(p4info_index, LEARN_DIGEST)))
+		writes.add(TableUpdateBuilder(p4info_index, 'MyIngress.learn_table', [], 'MyIngress.learn').build_default())
+	else:
+		cpu_ports = [BRIDGE_CPU_PORT]
+		if warm:  # ... undo the digests of a run learning from them
+			writes.add(TableUpdateBuilder(p4info_index, 'MyIngress.learn_table', [], 'NoAction').build_default())
+	if warm:
+		SyncMulticastGroups(writes, {mcast_group_id: mcast_group_ports + cpu_ports})
+	else:
+		InstallMcastGrpEntry(writes, mcast_group_id, mcast_group_ports + cpu_ports)
 
 	# Install VLAN rules
-	with contextlib.redirect_stdout(None):  # A hack to suppress print statements 
-		# within the table_entry.match get/set objects
 
+	##################################################################################
+	# Install VLAN Rules - Begins ####################################################
+	##################################################################################
 
+	# TODO: Install flow entries to let packets traverse only those egress ports that 
+	# match its VLAN ID.
+	# Install flow entries in the VLAN table (as specified in the P4 program):
+	#   - Match fields: `standard_metadata.egress_port`, VLAN ID
+	#   - Action: `MyEgress.noop`
+	#
+	# NOTE: please follow p4rt-src/bridge.py for a reference example on how to install
+	# table entries.
 
 
-		##################################################################################
-		# Install VLAN Rules - Begins ####################################################
-		##################################################################################
+	#### ADD YOUR CODE HERE ... ####
+	if warm:
+		SyncTableEntries(writes, vlan_table, VlanTableMatches(vlan_id_to_ports_map))
+	else:
+		for vlan_id, ports in vlan_id_to_ports_map.items():
+			for port in ports:
+				writes.add(vlan_table.build(p4rt.Update.INSERT, (port, vlan_id)))
 
-		# TODO: Install flow entries to let packets traverse only those egress ports that 
-		# match its VLAN ID.
-		# Install flow entries in the VLAN table (as specified in the P4 program):
-		#   - Match fields: `standard_metadata.egress_port`, VLAN ID
-		#   - Action: `MyEgress.noop`
-		#
-		# NOTE: please follow p4rt-src/bridge.py for a reference example on how to install
-		# table entries.
+	##################################################################################
+	# Install VLAN Rules - Ends ######################################################
+	##################################################################################
 
 
-		#### ADD YOUR CODE HERE ... ####
-		for vlan_id, ports in vlan_id_to_ports_map.items():
-			for port in ports:
-				table_entry = p4sh.TableEntry('MyEgress.vlan_table')(action='MyEgress.noop')
-				table_entry.match['standard_metadata.egress_port'] = str(port)
-				table_entry.match['meta.vid'] = str(vlan_id)
-				table_entry.insert()
 
-		##################################################################################
-		# Install VLAN Rules - Ends ######################################################
-		##################################################################################
 
+	# Write the multicast group and VLAN rules, a handful of RPCs for all of them
+	writes.flush()
 
+	LogVlanTable(LOGS_DIR, switch_name, vlan_id_to_ports_map, args.table_log)
 
+	# Apply the changes of the topo config without a restart, on SIGHUP or when the file changes
+	def reload_switch_config(old_config, new_config):
+		UpdateSwitchConfig(writes, vlan_table, cpu_ports, old_config, new_config)
+		LogVlanTable(LOGS_DIR, switch_name, new_config.vlan_id_to_ports_map, args.table_log)
 
-	with open('{0}/{1}-vlan-table.json'.format(LOGS_DIR, switch_name), 'w') as outfile:
-		with contextlib.redirect_stdout(outfile):
-			p4sh.TableEntry('MyEgress.vlan_table').read(lambda te: print(te))
-		print("INFO: Log committed to {0}/{1}-vlan-table.json".format(LOGS_DIR, switch_name))
+	topo_watcher = TopoConfigWatcher(args.topo_config, args.grpc_port, switch_config,
+									 reload_switch_config, args.topo_watch_interval)
 
-	# Start the packet-processing loop
-	ProcPacketIn(switch_name, LOGS_DIR, NUM_LOGS_THRESHOLD)
+	# Log the learned entries from the shadow table, unless the switch table is read
+	snapshot = None
+	if args.table_log == 'diff':
+		snapshot = SnapshotWriter(LOGS_DIR, '{0}-table'.format(switch_name), SwitchTablePath)
 
-	print("Switch Stopped")
+	# Cache the learned switch table entries, mirrored into the source table so
+	# that the switch stops sending the ARP packets of learned hosts
+	observers = [SourceTable(writes, src_table)]
+	if snapshot is not None:
+		observers.append(snapshot)
+	switch_table_cache = ShadowTable('MyIngress.switch_table', observers)
 
-	# Delete broadcast rule
-	DeleteMcastGrpEntry(mcast_group_id)
+	# Evict learned entries before the switch table is full
+	table_capacity = TableCapacity(switch_table_cache, switch_table.table_id, TABLE_SIZE, writes,
+								   functools.partial(SwitchTableUpdate, switch_table),
+								   functools.partial(SwitchTableKey, switch_table), args.eviction_policy)
 
-	# Delete VLAN rules
-	with contextlib.redirect_stdout(None):  # A hack to suppress print statements 
-		# within the table_entry.match get/set objects
+	# Reconcile the cached entries with the switch table once in a while
+	reconciler = TableReconciler(writes, switch_table_cache, switch_table.table_id,
+								 functools.partial(SwitchTableKey, switch_table),
+								 args.reconcile_interval)
 
+	# Take over the entries learned before a warm restart; their source entries
+	# are cleared first, as adopting them writes them again
+	if warm:
+		SyncTableEntries(writes, src_table, [])
+		reconciler.reconcile(adopt=True)
 
+	# Time the stages of the packet-processing loop, with the write counts of the batcher
+	hotpath = HotPathMonitor(LOGS_DIR, switch_name, args.profiler)
+	hotpath.sources.append(lambda: {'table_writes': writes.num_updates, 'write_failures': writes.num_errors})
 
+	# Start the packet-processing loop
+	ProcPacketIn(switch_name, writes, switch_table, switch_table_cache, table_capacity, reconciler,
+				 topo_watcher, hotpath, snapshot, args.learning, int(args.idle_timeout * 1e9), LOGS_DIR, NUM_LOGS_THRESHOLD)
+
+	print("Switch Stopped")
+	hotpath.close()
 
-		##################################################################################
-		# Delete VLAN Rules - Begins #####################################################
-		##################################################################################
+	# Delete broadcast rule, unless the switch is left running for a warm restart
+	if not args.warm_restart:
+		DeleteMcastGrpEntry(writes, mcast_group_id)
 
-		# TODO: Delete VLAN flow entries.
-		# Delete flow entries from the VLAN table (as specified in the P4 program):
-		#   - Match fields: `standard_metadata.egress_port`, VLAN ID
-		#   - Action: `MyEgress.noop`
-		#
-		# NOTE: please follow p4rt-src/bridge.py for a reference example on how to install
-		# table entries.
+	# Delete VLAN rules
 
+	##################################################################################
+	# Delete VLAN Rules - Begins #####################################################
+	##################################################################################
 
-		#### ADD YOUR CODE HERE ... ####
+	# TODO: Delete VLAN flow entries.
+	# Delete flow entries from the VLAN table (as specified in the P4 program):
+	#   - Match fields: `standard_metadata.egress_port`, VLAN ID
+	#   - Action: `MyEgress.noop`
+	#
+	# NOTE: please follow p4rt-src/bridge.py for a reference example on how to install
+	# table entries.
+
+
+	#### ADD YOUR CODE HERE ... ####
+	if not args.warm_restart:
 		for vlan_id, ports in vlan_id_to_ports_map.items():
 			for port in ports:
-				table_entry = p4sh.TableEntry('MyEgress.vlan_table')(action='MyEgress.noop')
-				table_entry.match['standard_metadata.egress_port'] = str(port)
-				table_entry.match['meta.vid'] = str(vlan_id)
-				table_entry.delete()
+				writes.add(vlan_table.build(p4rt.Update.DELETE, (port, vlan_id)))
+
 
+	##################################################################################
+	# Delete VLAN Rules - Ends #######################################################
+	##################################################################################
 
-		##################################################################################
-		# Delete VLAN Rules - Ends #######################################################
-		##################################################################################
 
 
 
+	# Write the remaining updates
+	writes.close()
+	if snapshot is not None:
+		snapshot.close()
+	log.info("Shadow table %s", switch_table_cache.stats(), extra={'kind': 'shadow'})
+	log.info("Table capacity %s", table_capacity.stats(), extra={'kind': 'eviction'})
+	log.info("Writes: %d updates in %d RPCs, %d failed, %d early flushes", writes.num_updates,
+			 writes.num_writes, writes.num_errors, writes.num_conflicts, extra={'kind': 'writes'})
+	controller_log.close()
 
 	# Close the P4Runtime connection
-	p4sh.teardown()
+	p4rtclient.client.tear_down()
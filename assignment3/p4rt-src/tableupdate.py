@@ -0,0 +1,115 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+from p4.v1 import p4runtime_pb2 as p4rt
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Canonical P4Runtime bytestring of an unsigned integer: big-endian, without
+# leading zero bytes (as the P4Runtime shell encodes match and param values)
+def EncodeValue(value):
+    return value.to_bytes((value.bit_length() + 7) // 8 or 1, byteorder='big')
+
+# Index entry of a P4Info object (table, action, digest) by its full name, in
+# a section of the P4Info index (see p4infocache.P4InfoIndex)
+def FindP4InfoObject(objs, name):
+    if name not in objs:
+        raise ValueError('{0}: not in the P4Info'.format(name))
+    return objs[name]
+
+# IDs of the named match fields or action parameters of a P4Info object, in
+# order, from their {name: ID} index
+def FindP4InfoIds(ids, names, owner):
+    for name in names:
+        if name not in ids:
+            raise ValueError('{0}: no {1}'.format(owner, name))
+    return [ids[name] for name in names]
+
+# Update of a multicast group replicating packets to `ports`
+def MulticastGroupUpdate(update_type, group_id, ports=()):
+    update = p4rt.Update(type=update_type)
+    mcast_entry = update.entity.packet_replication_engine_entry.multicast_group_entry
+    mcast_entry.multicast_group_id = group_id
+    if update_type != p4rt.Update.DELETE:
+        for port in ports:
+            mcast_entry.replicas.add(egress_port=port, instance=1)
+    return update
+
+
+###############################################################################
+# Table update builder
+###############################################################################
+
+# Builds the updates of the entries of a table with exact match fields.
+#
+# The table, match field, action and action parameter IDs are resolved from
+# the P4Info index once; each entry then only fills an Update with its integer values
+# encoded as bytes, without the P4Runtime shell's per-entry name lookups,
+# string parsing and printing. Deletes carry only the match, as P4Runtime
+# needs no more to find the entry.
+class TableUpdateBuilder:
+    def __init__(self, p4info_index, table_name, match_fields, action_name=None, params=()):
+        table = FindP4InfoObject(p4info_index['tables'], table_name)
+        self.name = table_name
+        self.table_id = table['id']
+        self.field_ids = FindP4InfoIds(table['match_fields'], match_fields, table_name)
+        self.action_id = 0
+        self.param_ids = []
+        if action_name is not None:
+            action = FindP4InfoObject(p4info_index['actions'], action_name)
+            self.action_id = action['id']
+            self.param_ids = FindP4InfoIds(action['params'], params, action_name)
+
+    # Update of the entry matching `match_values` (integers, in the order of
+    # `match_fields`), with the action parameters `param_values`
+    def build(self, update_type, match_values, param_values=(), idle_timeout_ns=0):
+        update = p4rt.Update(type=update_type)
+        table_entry = update.entity.table_entry
+        table_entry.table_id = self.table_id
+        for field_id, value in zip(self.field_ids, match_values):
+            match = table_entry.match.add()
+            match.field_id = field_id
+            match.exact.value = EncodeValue(value)
+        if update_type != p4rt.Update.DELETE:
+            self.set_action(table_entry, param_values)
+            if idle_timeout_ns:
+                table_entry.idle_timeout_ns = idle_timeout_ns
+        return update
+
+    # Update making the action the default action of the table
+    def build_default(self, param_values=()):
+        update = p4rt.Update(type=p4rt.Update.MODIFY)
+        table_entry = update.entity.table_entry
+        table_entry.table_id = self.table_id
+        table_entry.is_default_action = True
+        self.set_action(table_entry, param_values)
+        return update
+
+    # Set the action of a table entry, if any
+    def set_action(self, table_entry, param_values):
+        if self.action_id:
+            action = table_entry.action.action
+            action.action_id = self.action_id
+            for param_id, value in zip(self.param_ids, param_values):
+                param = action.params.add()
+                param.param_id = param_id
+                param.value = EncodeValue(value)
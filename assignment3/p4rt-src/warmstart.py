@@ -0,0 +1,131 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import hashlib
+import grpc
+import p4rtclient
+from p4.v1 import p4runtime_pb2 as p4rt
+from p4runtime_sh.p4runtime import P4RuntimeClient
+from ratelog import get_logger
+from p4infocache import CompiledP4Info
+from reconcile import ReadTableEntries
+from tableupdate import MulticastGroupUpdate
+
+log = get_logger()
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Cookie of a pipeline configuration: the first 8 bytes of the SHA-256 of its
+# P4Info and device configuration files
+def PipelineCookie(p4info_text, device_config):
+    digest = hashlib.sha256()
+    digest.update(p4info_text)
+    digest.update(device_config)
+    return int.from_bytes(digest.digest()[:8], byteorder='big')
+
+# Cookie of the pipeline running on the switch, or None if it has none
+def RunningPipelineCookie(client):
+    req = p4rt.GetForwardingPipelineConfigRequest(
+        device_id=client.device_id,
+        response_type=p4rt.GetForwardingPipelineConfigRequest.COOKIE_ONLY)
+    try:
+        rep = client.stub.GetForwardingPipelineConfig(req)
+    except grpc.RpcError:  # ... no pipeline yet
+        return None
+    if not rep.config.HasField('cookie'):
+        return None
+    return rep.config.cookie.cookie
+
+# Multicast groups on the switch, as {group ID: set of egress ports}
+def ReadMulticastGroups():
+    entity = p4rt.Entity()
+    entity.packet_replication_engine_entry.multicast_group_entry.SetInParent()  # ... all groups
+    req = p4rt.ReadRequest(device_id=p4rtclient.client.device_id, entities=[entity])
+    groups = {}
+    for rep in p4rtclient.client.stub.Read(req):
+        for read_entity in rep.entities:
+            mcast_entry = read_entity.packet_replication_engine_entry.multicast_group_entry
+            groups[mcast_entry.multicast_group_id] = set(replica.egress_port
+                                                         for replica in mcast_entry.replicas)
+    return groups
+
+
+###############################################################################
+# Warm restart
+###############################################################################
+
+# Connect to the switch as primary controller, like p4sh.setup (see
+# p4rtclient), and push the pipeline with its cookie, unless `warm_restart` and
+# the switch already runs it: the switch then keeps its entries. The P4Info is
+# loaded through the cache of compiled P4Infos. Returns whether the pipeline
+# was kept.
+def SetupP4Runtime(device_id, grpc_addr, election_id, p4info_path, bin_path, warm_restart):
+    p4rtclient.p4info = p4info = CompiledP4Info(p4info_path)
+    with open(bin_path, 'rb') as infile:
+        device_config = infile.read()
+    cookie = PipelineCookie(p4info.text, device_config)
+
+    p4rtclient.client = client = P4RuntimeClient(device_id, grpc_addr, election_id)
+    kept = warm_restart and RunningPipelineCookie(client) == cookie
+    if not kept:
+        req = p4rt.SetForwardingPipelineConfigRequest(
+            device_id=device_id, action=p4rt.SetForwardingPipelineConfigRequest.VERIFY_AND_COMMIT)
+        req.election_id.high, req.election_id.low = election_id
+        req.config.p4info.CopyFrom(p4info.p4info())
+        req.config.p4_device_config = device_config
+        req.config.cookie.cookie = cookie
+        client.stub.SetForwardingPipelineConfig(req)
+
+    log.info("Pipeline %s (cookie %016x)", 'kept' if kept else 'pushed', cookie,
+             extra={'kind': 'warm_restart'})
+    return kept
+
+# Write the differences between the multicast groups on the switch and `groups`,
+# as {group ID: egress ports}; groups not in `groups` are left alone
+def SyncMulticastGroups(writes, groups):
+    running_groups = ReadMulticastGroups()
+    num_changed = 0
+    for group_id, ports in groups.items():
+        running_ports = running_groups.get(group_id)
+        if running_ports == set(ports):
+            continue
+        update_type = p4rt.Update.INSERT if running_ports is None else p4rt.Update.MODIFY
+        writes.add(MulticastGroupUpdate(update_type, group_id, ports))
+        num_changed += 1
+    log.info("Multicast groups synced: %d of %d written", num_changed, len(groups),
+             extra={'kind': 'warm_restart'})
+
+# Write the differences between the entries of a table on the switch and
+# `matches`, the match values of the entries it should hold (with the
+# builder's action): missing entries are inserted, others deleted
+def SyncTableEntries(writes, table, matches):
+    matches = set(matches)
+    running_matches = set()
+    for table_entry in ReadTableEntries(table.table_id):
+        values = {match.field_id: int.from_bytes(match.exact.value, byteorder='big')
+                  for match in table_entry.match}
+        running_matches.add(tuple(values.get(field_id) for field_id in table.field_ids))
+    for match_values in matches - running_matches:
+        writes.add(table.build(p4rt.Update.INSERT, match_values))
+    for match_values in running_matches - matches:
+        writes.add(table.build(p4rt.Update.DELETE, match_values))
+    log.info("Table %s synced: %d inserted, %d deleted", table.name, len(matches - running_matches),
+             len(running_matches - matches), extra={'kind': 'warm_restart'})
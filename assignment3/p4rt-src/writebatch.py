@@ -0,0 +1,223 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import time
+import logging
+import threading
+import grpc
+import p4rtclient
+from google.rpc import code_pb2, status_pb2
+from p4.v1 import p4runtime_pb2 as p4rt
+from ratelog import get_logger
+
+log = get_logger()
+
+###############################################################################
+# Default parameters
+###############################################################################
+
+# Updates sent in one WriteRequest, and seconds an update may wait to be sent
+MAX_WRITE_UPDATES = 500
+MAX_WRITE_DELAY = 0.01
+
+# Update types, by name
+UPDATE_TYPE_NAMES = {p4rt.Update.INSERT: 'INSERT',
+                     p4rt.Update.MODIFY: 'MODIFY',
+                     p4rt.Update.DELETE: 'DELETE'}
+
+
+###############################################################################
+# Helper functions
+###############################################################################
+
+# Wrap a P4Runtime shell entity (TableEntry, MulticastGroupEntry) in an update
+def EntityUpdate(update_type, entity):
+    update = p4rt.Update()
+    update.type = update_type
+    msg = entity.msg()
+    if isinstance(msg, p4rt.TableEntry):
+        update.entity.table_entry.CopyFrom(msg)
+    else:
+        update.entity.packet_replication_engine_entry.CopyFrom(msg)
+    return update
+
+# Entity written by an update, as a hashable key: a table entry by its match
+# (or as the default entry of its table), a multicast group or a digest by ID
+def UpdateKey(update):
+    entity = update.entity
+    kind = entity.WhichOneof('entity')
+    if kind == 'table_entry':
+        table_entry = entity.table_entry
+        return (kind, table_entry.table_id, table_entry.is_default_action, table_entry.priority,
+                tuple(match.SerializeToString() for match in table_entry.match))
+    if kind == 'packet_replication_engine_entry':
+        return (kind, entity.packet_replication_engine_entry.multicast_group_entry.multicast_group_id)
+    if kind == 'digest_entry':
+        return (kind, entity.digest_entry.digest_id)
+    return (kind, entity.SerializeToString())
+
+# Errors of the failed updates of a Write RPC, as [(update index, p4.v1.Error)],
+# or None if the switch did not report them
+def WriteErrors(rpc_error):
+    for key, value in rpc_error.trailing_metadata() or ():
+        if key == 'grpc-status-details-bin':
+            errors = []
+            for i, detail in enumerate(status_pb2.Status.FromString(value).details):
+                error = p4rt.Error()
+                if detail.Unpack(error) and error.canonical_code != code_pb2.OK:
+                    errors.append((i, error))
+            return errors
+    return None
+
+# Log a failed update; inserting an entry that already exists is expected
+# from learning, and only logged at DEBUG
+def LogWriteError(update, error):
+    code_name = code_pb2.Code.Name(error.canonical_code)
+    level = logging.WARNING
+    if update.type == p4rt.Update.INSERT and error.canonical_code == code_pb2.ALREADY_EXISTS:
+        level = logging.DEBUG
+    if log.isEnabledFor(level):
+        log.log(level, "Write failed: %s %s: %s %s", UPDATE_TYPE_NAMES[update.type],
+                update.entity.WhichOneof('entity'), code_name, error.message,
+                extra={'kind': 'write_error'})
+
+
+###############################################################################
+# Write batcher
+###############################################################################
+
+# Accumulates INSERT/MODIFY/DELETE updates into WriteRequests.
+#
+# Updates are sent in one Write RPC once `max_updates` of them are pending, or
+# `max_delay` seconds after the first of them was added (by a background
+# thread), or on `flush`. Batches are written in the order they were formed,
+# but P4Runtime does not order the updates within a batch, so an update of an
+# entity already pending (see UpdateKey), e.g. the re-insert of an entry just
+# deleted, flushes the batch before being queued (counted in `num_conflicts`).
+# A failed update does
+# not fail the others: each one is reported to `on_error(update, error)`, with
+# `error` a p4.v1.Error, and counted in `num_errors`; an update may also carry
+# its own `on_error`, called first (e.g. to undo a cached change).
+class WriteBatcher:
+    def __init__(self, max_updates=MAX_WRITE_UPDATES, max_delay=MAX_WRITE_DELAY,
+                 on_error=LogWriteError):
+        self.max_updates = max_updates
+        self.max_delay = max_delay
+        self.on_error = on_error
+        self.updates = []
+        self.keys = set()
+        self.deadline = None
+        self.closed = False
+        self.lock = threading.Lock()
+        self.pending = threading.Condition(self.lock)
+        self.write_lock = threading.Lock()
+        self.num_writes = 0
+        self.num_updates = 0
+        self.num_errors = 0
+        self.num_conflicts = 0
+        self.thread = threading.Thread(target=self.run, name='write-batcher', daemon=True)
+        self.thread.start()
+
+    def insert(self, entity, on_error=None):
+        self.add(EntityUpdate(p4rt.Update.INSERT, entity), on_error)
+
+    def modify(self, entity, on_error=None):
+        self.add(EntityUpdate(p4rt.Update.MODIFY, entity), on_error)
+
+    def delete(self, entity, on_error=None):
+        self.add(EntityUpdate(p4rt.Update.DELETE, entity), on_error)
+
+    # Queue an update, writing the batch first if it updates the same entity,
+    # and once it is full
+    def add(self, update, on_error=None):
+        key = UpdateKey(update)
+        while True:
+            with self.lock:
+                if key not in self.keys:
+                    self.updates.append((update, on_error))
+                    self.keys.add(key)
+                    if self.deadline is None:
+                        self.deadline = time.monotonic() + self.max_delay
+                        self.pending.notify()
+                    full = len(self.updates) >= self.max_updates
+                    break
+            self.num_conflicts += 1
+            self.flush()
+        if full:
+            self.flush()
+
+    # Write the pending updates; returns the failed ones as (update, error)
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                updates, self.updates = self.updates, []
+                self.keys = set()
+                self.deadline = None
+            if not updates:
+                return []
+
+            client = p4rtclient.client
+            req = p4rt.WriteRequest(device_id=client.device_id)
+            req.election_id.high, req.election_id.low = client.election_id
+            req.updates.extend(update for update, _ in updates)
+            failed = []
+            try:
+                client.stub.Write(req)
+            except grpc.RpcError as e:
+                failed = WriteErrors(e)
+                if failed is None:
+                    # The whole RPC failed (e.g. the switch is gone), so did every update
+                    error = p4rt.Error(canonical_code=e.code().value[0], message=e.details() or '')
+                    failed = [(i, error) for i in range(len(updates))]
+
+            self.num_writes += 1
+            self.num_updates += len(updates)
+            self.num_errors += len(failed)
+
+        # Report errors outside of the locks, so that handlers may queue updates
+        results = []
+        for i, error in failed:
+            update, on_error = updates[i]
+            if on_error is not None:
+                on_error(update, error)
+            self.on_error(update, error)
+            results.append((update, error))
+        return results
+
+    # Flush and stop the background thread
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.pending.notify()
+        self.thread.join()
+        return self.flush()
+
+    # Background thread, writing batches whose deadline has passed
+    def run(self):
+        while True:
+            with self.lock:
+                while self.deadline is None and not self.closed:
+                    self.pending.wait()
+                if self.closed:
+                    return
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.pending.wait(remaining)
+                    continue
+            self.flush()
@@ -0,0 +1,173 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from p4.v1 import p4runtime_pb2 as p4rt
+from digest import LEARN_DIGEST, LEARNING_MODES, DigestId
+from p4infocache import P4InfoIndex
+from p4rtstandin import ControllerError, ControllerProcess, P4RuntimeStandIn, serve
+
+ASSIGNMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Bytes of the members of each controller's learn digest (see p4-src/*.p4):
+# (source MAC, [VLAN ID,] ingress port)
+DIGEST_MEMBER_BYTES = {'bridge': [6, 2], 'switch': [6, 2, 2]}
+
+
+# Tagged ARP request from `src_mac` in `vlan_id`
+def arp_request(src_mac, vlan_id):
+    return (bytes.fromhex('ffffffffffff') + src_mac.to_bytes(6, byteorder='big') +
+            b'\x81\x00' + vlan_id.to_bytes(2, byteorder='big') + b'\x08\x06' + bytes(42))
+
+
+# Times at which the PacketIn of each source MAC was sent and handled: when the
+# controller writes an entry matching the MAC (learned in a table), or sends the
+# packet back out (learned by the controller, and flooded)
+class Latencies:
+    def __init__(self, num_packets):
+        self.lock = threading.Lock()
+        self.sent = {}
+        self.handled = {}
+        self.done = threading.Event()
+        self.num_packets = num_packets
+
+    def mark_handled(self, mac):
+        with self.lock:
+            if mac in self.sent and mac not in self.handled:
+                self.handled[mac] = time.perf_counter()
+                if len(self.handled) == self.num_packets:
+                    self.done.set()
+
+    def on_write(self, updates):
+        for update in updates:
+            if update.type == p4rt.Update.INSERT and update.entity.HasField('table_entry'):
+                for match in update.entity.table_entry.match:
+                    if len(match.exact.value) == 6:
+                        self.mark_handled(match.exact.value)
+
+    def on_packet_out(self, packet):
+        self.mark_handled(packet.payload[6:12])
+
+
+# Value at fraction `q` of sorted `values`
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Controller Load Benchmark Script')
+    parser.add_argument('--controller', help='Controller (p4rt-src/<name>.py)', choices=['bridge', 'switch'],
+                        type=str, action="store", default='bridge')
+    parser.add_argument('--topo-config', help='Topology Configuration File', type=str, action="store",
+                        default=os.path.join(ASSIGNMENT_DIR, 'topo', 'linear,2,2.json'))
+    parser.add_argument('--learning', help='Learning Mode (digest: the controller learns from DigestLists)',
+                        choices=LEARNING_MODES, type=str, action="store", default='packet')
+    parser.add_argument('--hosts', help='PacketIns or Digests, One per New Source MAC', type=int,
+                        action="store", default=800)
+    parser.add_argument('--rate', help='PacketIns or Digests per Second (0: as fast as possible)', type=float,
+                        action="store", default=0)
+    parser.add_argument('--list-size', help='Digests per DigestList (digest learning)', type=int,
+                        action="store", default=1)
+    parser.add_argument('--vlan-id', help='VLAN ID of the Packets', type=int, action="store", default=100)
+    parser.add_argument('--ingress-port', help='Ingress Port of the Packets', type=int, action="store",
+                        default=1)
+    parser.add_argument('--settle', help='Seconds Given to the Controller to Set Up', type=float,
+                        action="store", default=1)
+    parser.add_argument('--timeout', help='Seconds to Wait for the Packets to be Handled', type=float,
+                        action="store", default=60)
+    parser.add_argument('--controller-output', help='Show the Controller Output', action="store_true")
+    parser.add_argument('args', help='Controller Arguments (after --)', nargs='*')
+    args = parser.parse_args()
+
+    with open(args.topo_config, 'r') as infile:
+        topo_config = json.loads(infile.read())
+
+    standin = P4RuntimeStandIn()
+    server, grpc_port = serve(standin)
+    controller_args = ['--learning', args.learning] + args.args
+    controller = ControllerProcess(os.path.join(ASSIGNMENT_DIR, 'p4rt-src'), args.controller,
+                                   os.path.join(ASSIGNMENT_DIR, 'cfg'), '{0}-50001'.format(args.controller),
+                                   topo_config, '50001', grpc_port, controller_args)
+    try:
+        controller.start(None if args.controller_output else subprocess.DEVNULL)
+        controller.wait_ready(standin, args.timeout)
+        time.sleep(args.settle)
+
+        latencies = Latencies(args.hosts)
+        standin.on_write = latencies.on_write
+        standin.on_packet_out = latencies.on_packet_out
+        num_write_rpcs, num_updates = standin.num_write_rpcs, standin.num_updates
+
+        # Send the ARP requests, or their digests in DigestLists of up to
+        # `list_size`, paced if asked to
+        if args.learning == 'digest':
+            digest_id = DigestId(P4InfoIndex(standin.config.p4info), LEARN_DIGEST)
+            member_bytes = DIGEST_MEMBER_BYTES[args.controller]
+        digests = []
+        start = time.perf_counter()
+        for i in range(args.hosts):
+            src_mac = 0x020000000000 + i
+            if args.rate:
+                delay = start + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            latencies.sent[src_mac.to_bytes(6, byteorder='big')] = time.perf_counter()
+            if args.learning == 'digest':
+                digests.append((src_mac, args.vlan_id, args.ingress_port) if args.controller == 'switch' else
+                               (src_mac, args.ingress_port))
+                if len(digests) == args.list_size or i == args.hosts - 1:
+                    standin.send_digest_list(digest_id, i, digests, member_bytes)
+                    digests = []
+            else:
+                standin.send_packet_in(arp_request(src_mac, args.vlan_id), args.ingress_port)
+        deadline = time.perf_counter() + args.timeout
+        while not latencies.done.wait(0.1) and time.perf_counter() < deadline:
+            controller.check()
+        seconds = max(latencies.handled.values(), default=start) - start
+        num_write_rpcs = standin.num_write_rpcs - num_write_rpcs
+        num_updates = standin.num_updates - num_updates
+        controller.stop()
+        controller.check()  # ... the results only count if it ran and stopped cleanly
+    except ControllerError as e:
+        sys.exit(str(e))
+    finally:
+        controller.close()
+        server.stop(None)
+
+    samples = sorted((latencies.handled[mac] - sent) * 1e3 for mac, sent in latencies.sent.items()
+                     if mac in latencies.handled)
+    print("{0}: {1} of {2} {3} handled in {4:.2f} s".format(
+        args.controller, len(samples), args.hosts, 'digests' if args.learning == 'digest' else 'PacketIns',
+        seconds))
+    if samples:
+        print("{0:>12} {1:>12} {2:>12}".format("packets/s", "writes/s", "updates/s"))
+        print("{0:>12.0f} {1:>12.0f} {2:>12.0f}".format(len(samples) / seconds, num_write_rpcs / seconds,
+                                                        num_updates / seconds))
+        print("{0:>12} {1:>12} {2:>12} {3:>12}".format("p50 ms", "p90 ms", "p99 ms", "max ms"))
+        print("{0:>12.2f} {1:>12.2f} {2:>12.2f} {3:>12.2f}".format(
+            percentile(samples, 0.5), percentile(samples, 0.9), percentile(samples, 0.99), samples[-1]))
+    print("Stand-in: {0}".format(standin.stats()))
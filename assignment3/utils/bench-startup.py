@@ -0,0 +1,144 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import sys
+import json
+import time
+import shutil
+import timeit
+import argparse
+import threading
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from google.protobuf import text_format
+from p4.config.v1 import p4info_pb2
+from p4.v1 import p4runtime_pb2 as p4rt
+from p4infocache import CACHE_DIRNAME, CompiledP4Info, P4InfoIndex
+from p4rtstandin import ControllerError, ControllerProcess, P4RuntimeStandIn, serve
+
+ASSIGNMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Learned table of each controller
+LEARNED_TABLES = {'switch': 'MyIngress.switch_table', 'bridge': 'MyIngress.bridge_table'}
+
+# Tagged ARP request from 02:00:00:00:00:a1 (VLAN 100) on port 1
+ARP_PACKET = bytes.fromhex('ffffffffffff' '0200000000a1' '8100' '0064' '0806') + bytes(42)
+
+
+# Start the controller against the stand-in, send it a PacketIn once it has
+# set up, and return the seconds until it connected, pushed the pipeline
+# and wrote the entry learned from the PacketIn
+def run_controller(standin, controller, table_id, timeout):
+    handled = threading.Event()
+    handled_time = []
+
+    def on_write(updates):
+        for update in updates:
+            if update.type == p4rt.Update.INSERT and update.entity.table_entry.table_id == table_id:
+                handled_time.append(time.perf_counter())
+                handled.set()
+
+    standin.on_write = on_write
+    standin.connected.clear()
+    standin.connect_time = standin.pipeline_time = None
+    num_write_rpcs = standin.num_write_rpcs
+    start = time.perf_counter()
+    controller.start()
+    try:
+        controller.wait_ready(standin, timeout, num_write_rpcs)
+        standin.send_packet_in(ARP_PACKET, 1)
+        deadline = time.perf_counter() + timeout
+        while not handled.wait(0.1):
+            controller.check()
+            if time.perf_counter() > deadline:
+                controller.fail('did not handle the PacketIn in {0}s'.format(timeout))
+    finally:
+        controller.stop()
+    controller.check()
+    return [(event_time or float('nan')) - start
+            for event_time in [standin.connect_time, standin.pipeline_time, handled_time[0]]]
+
+
+# Median seconds to run a Python statement in a new interpreter
+def run_python(statement, runs):
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Controller Startup Benchmark Script')
+    parser.add_argument('--controller', help='Controller', choices=sorted(LEARNED_TABLES),
+                        type=str, action="store", default='bridge')
+    parser.add_argument('--topo-config', help='Topology Configuration File', type=str, action="store",
+                        default=os.path.join(ASSIGNMENT_DIR, 'topo', 'linear,2,2.json'))
+    parser.add_argument('--runs', help='Controller Starts per Mode', type=int, action="store",
+                        default=5)
+    parser.add_argument('--timeout', help='Seconds to Wait for the First PacketIn Handled', type=float,
+                        action="store", default=30)
+    args = parser.parse_args()
+
+    cfg_dir = os.path.join(ASSIGNMENT_DIR, 'cfg')
+    cfg_name = '{0}-50001'.format(args.controller)
+    p4info_path = os.path.join(cfg_dir, '{0}-p4info.txt'.format(cfg_name))
+    p4info = p4info_pb2.P4Info()
+    with open(p4info_path, 'r') as infile:
+        text_format.Merge(infile.read(), p4info)
+    table_id = P4InfoIndex(p4info)['tables'][LEARNED_TABLES[args.controller]]['id']
+    with open(args.topo_config, 'r') as infile:
+        topo_config = json.loads(infile.read())
+
+    standin = P4RuntimeStandIn()
+    server, grpc_port = serve(standin)
+    controller = ControllerProcess(os.path.join(ASSIGNMENT_DIR, 'p4rt-src'), args.controller, cfg_dir, cfg_name,
+                                   topo_config, '50001', grpc_port)
+    try:
+        # Seconds to the first PacketIn handled, with the P4Info compiled by
+        # that start ('cold') or by an earlier one ('cached')
+        print("{0:>8} {1:>12} {2:>12} {3:>16}".format("p4info", "connect ms", "pipeline ms", "1st PacketIn ms"))
+        for mode in ['cold', 'cached']:
+            results = []
+            for _ in range(args.runs):
+                if mode == 'cold':
+                    shutil.rmtree(os.path.join(controller.work_dir, 'cfg', CACHE_DIRNAME), ignore_errors=True)
+                results.append(run_controller(standin, controller, table_id, args.timeout))
+            print("{0:>8} {1:>12.1f} {2:>12.1f} {3:>16.1f}".format(
+                mode, *(statistics.median(times) * 1e3 for times in zip(*results))))
+    except ControllerError as e:
+        sys.exit(str(e))
+    finally:
+        controller.close()
+        server.stop(None)
+
+    # What the controllers no longer pay: parsing the text P4Info, and importing
+    # the P4Runtime shell (IPython) rather than only its client
+    number = 100
+    parse = timeit.timeit(lambda: text_format.Merge(open(p4info_path).read(), p4info_pb2.P4Info()),
+                          number=number) / number
+    load = timeit.timeit(lambda: CompiledP4Info(p4info_path).index, number=number) / number
+    shell = run_python('import p4runtime_sh.shell', 3) - run_python('import p4runtime_sh.p4runtime', 3)
+    print()
+    print("P4Info: text parse {0:.2f} ms, cached index {1:.2f} ms".format(parse * 1e3, load * 1e3))
+    print("P4Runtime shell import: {0:.0f} ms".format(shell * 1e3))
@@ -0,0 +1,85 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+import p4runtime_sh.shell as p4sh
+from google.protobuf import text_format
+from p4.config.v1 import p4info_pb2
+from p4.v1 import p4runtime_pb2 as p4rt
+from writebatch import EntityUpdate
+from tableupdate import TableUpdateBuilder
+from p4infocache import P4InfoIndex
+from ethernet import mac2str
+
+
+# Build every update through the P4Runtime shell, as the switch controller used to do
+def build_shell(entries, idle_timeout_ns):
+    for mac, vlan_id, port in entries:
+        with contextlib.redirect_stdout(None):
+            table_entry = p4sh.TableEntry('MyIngress.switch_table')(action='MyIngress.forward')
+            table_entry.match['hdr.ethernet.dstAddr'] = mac2str(mac)
+            table_entry.match['meta.vid'] = str(vlan_id)
+            table_entry.action['port'] = str(port)
+            table_entry.idle_timeout_ns = idle_timeout_ns
+            EntityUpdate(p4rt.Update.INSERT, table_entry)
+
+
+# Build every update from the IDs resolved once
+def build_direct(entries, idle_timeout_ns):
+    switch_table = TableUpdateBuilder(P4InfoIndex(p4sh.context.p4info), 'MyIngress.switch_table',
+                                      ['hdr.ethernet.dstAddr', 'meta.vid'], 'MyIngress.forward', ['port'])
+    for mac, vlan_id, port in entries:
+        switch_table.build(p4rt.Update.INSERT, (mac, vlan_id), (port,), idle_timeout_ns)
+
+
+# Build all updates and return (updates/sec, us/update)
+def run(build, entries):
+    start = time.perf_counter()
+    build(entries, 300 * 10**9)
+    seconds = time.perf_counter() - start
+    return len(entries) / seconds, seconds * 1e6 / len(entries)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Table Update Benchmark Script')
+    parser.add_argument('--p4info', help='P4Info File of the Switch Program', type=str, action="store",
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cfg',
+                                             'switch-50001-p4info.txt'))
+    parser.add_argument('--entries', help='Number of Table Entries', type=int, action="store",
+                        default=20000)
+    args = parser.parse_args()
+
+    # The shell only needs the P4Info to build entries, not a switch
+    p4info = p4info_pb2.P4Info()
+    with open(args.p4info, 'r') as infile:
+        text_format.Merge(infile.read(), p4info)
+    p4sh.context.set_p4info(p4info)
+
+    # Hosts spread over a few VLANs and ports
+    entries = [(0x020000000000 + i, i % 4, 1 + i % 8) for i in range(args.entries)]
+
+    print("{0:>8} {1:>12} {2:>12}".format("builder", "updates/s", "us/update"))
+    for name, build in [('shell', build_shell), ('direct', build_direct)]:
+        print("{0:>8} {1:>12.0f} {2:>12.2f}".format(name, *run(build, entries)))
@@ -0,0 +1,379 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'p4rt-src'))
+from topoconfig import TOPO_INDEX_SUFFIX
+
+ASSIGNMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# gRPC port of switch sN is TOPO_GRPC_PORT_BASE + N (as mn-stratum numbers them)
+TOPO_GRPC_PORT_BASE = 50000
+
+# Broadcast group ID of every switch
+MCAST_GROUP_ID = 1
+
+# VLAN IDs the hosts of a switch are assigned to, in turn: 100, 200, ...
+VLAN_ID_STEP = 100
+MAX_VLAN_ID = 4094
+
+
+###############################################################################
+# Topology shapes
+###############################################################################
+
+# Switches, hosts and links of a topology. Ports are numbered from 1 per
+# switch, in the order links are added, as Mininet numbers them. Links not in
+# the spanning tree (`tree=False`) are wired but left out of the multicast
+# groups and VLANs, as the controllers flood without loop prevention.
+class Topology:
+    def __init__(self):
+        self.switches = []
+        self.num_ports = {}
+        self.hosts = []  # ... [(name, switch, port)]
+        self.links = []  # ... [(switch, port, switch, port, in spanning tree)]
+
+    def add_switch(self):
+        switch = str(TOPO_GRPC_PORT_BASE + len(self.switches) + 1)
+        self.switches.append(switch)
+        self.num_ports[switch] = 0
+        return switch
+
+    def add_port(self, switch):
+        self.num_ports[switch] += 1
+        return self.num_ports[switch]
+
+    def add_host(self, name, switch):
+        self.hosts.append((name, switch, self.add_port(switch)))
+
+    def add_link(self, switch_a, switch_b, tree=True):
+        self.links.append((switch_a, self.add_port(switch_a), switch_b, self.add_port(switch_b), tree))
+
+    def switch_name(self, switch):
+        return 's{0}'.format(int(switch) - TOPO_GRPC_PORT_BASE)
+
+
+# `num_switches` switches in a chain, with `num_hosts` hosts each (Mininet's
+# LinearTopo)
+def linear_topology(num_switches, num_hosts=1):
+    topo = Topology()
+    last_switch = None
+    for _ in range(num_switches):
+        switch = topo.add_switch()
+        for j in range(1, num_hosts + 1):
+            name = 'h{0}{1}'.format(j, topo.switch_name(switch)) if num_hosts > 1 else \
+                   'h{0}'.format(topo.switch_name(switch)[1:])
+            topo.add_host(name, switch)
+        if last_switch is not None:
+            topo.add_link(switch, last_switch)
+        last_switch = switch
+    return topo
+
+# Tree of switches of depth `depth`, each with `fanout` children, hosts at
+# the leaves (Mininet's TreeTopo)
+def tree_topology(depth, fanout=2):
+    topo = Topology()
+
+    def add_tree(depth):
+        if depth == 0:
+            return None
+        switch = topo.add_switch()
+        for _ in range(fanout):
+            child = add_tree(depth - 1)
+            if child is None:
+                topo.add_host('h{0}'.format(len(topo.hosts) + 1), switch)
+            else:
+                topo.add_link(switch, child)
+        return switch
+
+    add_tree(depth)
+    return topo
+
+# k-ary fat-tree: (k/2)^2 core switches, then k pods of k/2 aggregation and
+# k/2 edge switches, k/2 hosts per edge switch. The spanning tree goes through
+# the first aggregation switch of each pod and the first core switch.
+def fattree_topology(k):
+    if k < 2 or k % 2:
+        raise ValueError('fattree: k must be even')
+    half = k // 2
+    topo = Topology()
+    cores = [topo.add_switch() for _ in range(half * half)]
+    for _ in range(k):
+        aggs = [topo.add_switch() for _ in range(half)]
+        edges = [topo.add_switch() for _ in range(half)]
+        for edge in edges:
+            for j in range(1, half + 1):
+                topo.add_host('h{0}{1}'.format(j, topo.switch_name(edge)), edge)
+            for i, agg in enumerate(aggs):
+                topo.add_link(edge, agg, tree=(i == 0))
+        for i, agg in enumerate(aggs):
+            for j in range(half):
+                topo.add_link(agg, cores[i * half + j], tree=(i == 0 and j == 0))
+    return topo
+
+SHAPES = {'linear': linear_topology, 'tree': tree_topology, 'fattree': fattree_topology}
+
+# Topology of a shape such as "linear,3,2", "tree,3,2" or "fattree,4"
+def build_topology(shape):
+    name, *params = shape.split(',')
+    if name not in SHAPES:
+        raise ValueError('{0}: unknown shape (one of {1})'.format(shape, ', '.join(sorted(SHAPES))))
+    return SHAPES[name](*(int(param) for param in params))
+
+
+###############################################################################
+# Topo config
+###############################################################################
+
+# Topo config of a topology, its hosts assigned to `num_vlans` VLANs. A trunk
+# port is in a VLAN only if the VLAN has hosts on both sides of its link.
+def topo_config(topo, num_vlans):
+    vlan_ids = [VLAN_ID_STEP * (i + 1) for i in range(num_vlans)]
+    if vlan_ids[-1] > MAX_VLAN_ID:
+        raise ValueError('At most {0} VLANs'.format(MAX_VLAN_ID // VLAN_ID_STEP))
+    host_vlans = {}
+    hosts_per_switch = {}
+    for name, switch, _ in topo.hosts:
+        index = hosts_per_switch.get(switch, 0)
+        hosts_per_switch[switch] = index + 1
+        host_vlans[name] = vlan_ids[index % num_vlans]
+
+    # Hosts of each VLAN in the subtree of each switch of the spanning tree,
+    # and in the whole tree
+    neighbors = {switch: [] for switch in topo.switches}
+    for switch_a, port_a, switch_b, port_b, tree in topo.links:
+        if tree:
+            neighbors[switch_a].append((port_a, switch_b))
+            neighbors[switch_b].append((port_b, switch_a))
+    subtree = {switch: dict.fromkeys(vlan_ids, 0) for switch in topo.switches}
+    for name, switch, _ in topo.hosts:
+        subtree[switch][host_vlans[name]] += 1
+    parents = {}
+    tree_totals = {}
+    for root in topo.switches:
+        if root in parents:
+            continue
+        parents[root] = None
+        order = [root]
+        for switch in order:  # ... breadth first, then summed up from the leaves
+            for _, neighbor in neighbors[switch]:
+                if neighbor not in parents:
+                    parents[neighbor] = switch
+                    order.append(neighbor)
+        for switch in reversed(order[1:]):
+            for vlan_id in vlan_ids:
+                subtree[parents[switch]][vlan_id] += subtree[switch][vlan_id]
+        for switch in order:
+            tree_totals[switch] = subtree[root]
+
+    ports = {switch: {vlan_id: [] for vlan_id in vlan_ids} for switch in topo.switches}
+    mcast_ports = {switch: [] for switch in topo.switches}
+    for name, switch, port in topo.hosts:
+        ports[switch][host_vlans[name]].append(port)
+        mcast_ports[switch].append(port)
+    for switch in topo.switches:
+        for port, neighbor in neighbors[switch]:
+            mcast_ports[switch].append(port)
+            for vlan_id in vlan_ids:
+                total = tree_totals[switch][vlan_id]
+                if parents[neighbor] == switch:
+                    far = subtree[neighbor][vlan_id]
+                else:
+                    far = total - subtree[switch][vlan_id]
+                if 0 < far < total:
+                    ports[switch][vlan_id].append(port)
+
+    return {
+        'switch': {switch: {'mcast': {'id': MCAST_GROUP_ID, 'ports': sorted(mcast_ports[switch])},
+                            'vlan_id_to_ports': {str(vlan_id): sorted(vlan_ports)
+                                                 for vlan_id, vlan_ports in ports[switch].items() if vlan_ports}}
+                   for switch in topo.switches},
+        'host': {name: {'vlan': host_vlans[name], 'switch': switch, 'port': port}
+                 for name, switch, port in topo.hosts},
+        'link': [[switch_a, port_a, switch_b, port_b] for switch_a, port_a, switch_b, port_b, _ in topo.links],
+    }
+
+# Wiring of a topo config, as ({host: (switch, port)}, [(switch, port, switch,
+# port)]): its own, else that of the shape its file is named after, else None
+def topo_wiring(config, path):
+    if 'link' in config and all('switch' in host and 'port' in host for host in config['host'].values()):
+        return ({name: (host['switch'], host['port']) for name, host in config['host'].items()},
+                [tuple(link) for link in config['link']])
+    try:
+        topo = build_topology(os.path.splitext(os.path.basename(path))[0])
+    except (ValueError, TypeError):
+        return None
+    return ({name: (switch, port) for name, switch, port in topo.hosts},
+            [link[:4] for link in topo.links])
+
+# Errors in a topo config: malformed sections, VLAN ports outside the
+# multicast group, and, given its wiring, hosts on ports outside their VLAN,
+# trunk ports whose two ends are not in the same VLANs, and VLANs that loop
+# or whose hosts cannot reach each other
+def check_topo_config(config, wiring=None):
+    errors = []
+    switches = config.get('switch', {})
+    vlan_ports = {}  # ... {(switch, port): set of VLAN IDs}
+    mcast_ports = set()
+    for switch, section in switches.items():
+        try:
+            group_id = section['mcast']['id']
+            ports = section['mcast']['ports']
+            vlans = section['vlan_id_to_ports']
+        except (KeyError, TypeError):
+            errors.append('switch {0}: needs mcast id and ports, and vlan_id_to_ports'.format(switch))
+            continue
+        if not isinstance(group_id, int) or group_id <= 0:
+            errors.append('switch {0}: bad multicast group ID {1!r}'.format(switch, group_id))
+        if len(set(ports)) != len(ports) or not all(isinstance(port, int) and port > 0 for port in ports):
+            errors.append('switch {0}: bad multicast ports {1}'.format(switch, ports))
+        mcast_ports.update((switch, port) for port in ports)
+        for vlan_id, ports_of_vlan in vlans.items():
+            if not vlan_id.isdigit() or not 1 <= int(vlan_id) <= MAX_VLAN_ID:
+                errors.append('switch {0}: bad VLAN ID {1!r}'.format(switch, vlan_id))
+                continue
+            outside = sorted(set(ports_of_vlan) - set(ports))
+            if outside:
+                errors.append('switch {0}: VLAN {1} ports {2} not in the multicast group'.format(
+                    switch, vlan_id, outside))
+            for port in ports_of_vlan:
+                vlan_ports.setdefault((switch, port), set()).add(int(vlan_id))
+    for name, host in config.get('host', {}).items():
+        if not isinstance(host.get('vlan'), int) or not 1 <= host['vlan'] <= MAX_VLAN_ID:
+            errors.append('host {0}: bad VLAN {1!r}'.format(name, host.get('vlan')))
+    if wiring is None:
+        return errors
+
+    hosts, links = wiring
+    host_ports = {}
+    for name, (switch, port) in hosts.items():
+        vlan_id = config['host'].get(name, {}).get('vlan')
+        if name not in config['host']:
+            errors.append('host {0}: missing'.format(name))
+        elif switch not in switches:
+            errors.append('host {0}: on switch {1}, not in the config'.format(name, switch))
+        elif vlan_ports.get((switch, port)) != {vlan_id}:
+            errors.append('host {0}: switch {1} port {2} is in VLANs {3}, not only in {4}'.format(
+                name, switch, port, sorted(vlan_ports.get((switch, port), ())), vlan_id))
+        host_ports[(switch, port)] = name
+    for switch_a, port_a, switch_b, port_b in links:
+        for end in [(switch_a, port_a), (switch_b, port_b)]:
+            if end in host_ports:
+                errors.append('switch {0} port {1}: both a trunk and host {2}'.format(*end, host_ports[end]))
+        if vlan_ports.get((switch_a, port_a), set()) != vlan_ports.get((switch_b, port_b), set()) or \
+           ((switch_a, port_a) in mcast_ports) != ((switch_b, port_b) in mcast_ports):
+            errors.append('trunk {0}:{1} - {2}:{3}: VLANs {4} and {5}, not the same at both ends'.format(
+                switch_a, port_a, switch_b, port_b, sorted(vlan_ports.get((switch_a, port_a), ())),
+                sorted(vlan_ports.get((switch_b, port_b), ()))))
+
+    # Per VLAN, its trunks must form a forest, in which its hosts are connected
+    for vlan_id in sorted(set().union(*vlan_ports.values()) if vlan_ports else ()):
+        components = {switch: switch for switch in switches}
+
+        def find(switch):
+            while components[switch] != switch:
+                components[switch] = components[components[switch]]
+                switch = components[switch]
+            return switch
+
+        for switch_a, port_a, switch_b, port_b in links:
+            if vlan_id in vlan_ports.get((switch_a, port_a), ()) and \
+               vlan_id in vlan_ports.get((switch_b, port_b), ()) and \
+               switch_a in components and switch_b in components:
+                root_a, root_b = find(switch_a), find(switch_b)
+                if root_a == root_b:
+                    errors.append('VLAN {0}: loops through trunk {1}:{2} - {3}:{4}'.format(
+                        vlan_id, switch_a, port_a, switch_b, port_b))
+                components[root_a] = root_b
+        roots = set(find(switch) for name, (switch, _) in hosts.items()
+                    if config['host'].get(name, {}).get('vlan') == vlan_id and switch in components)
+        if len(roots) > 1:
+            errors.append('VLAN {0}: hosts split over {1} unconnected parts'.format(vlan_id, len(roots)))
+    return errors
+
+
+# Write a topo config with a switch section per line, and its index (see
+# topoconfig.ReadSwitchSection)
+def write_topo_config(path, config):
+    index = {}
+    with open(path, 'wb') as outfile:
+        outfile.write(b'{\n    "switch": {')
+        for i, (switch, section) in enumerate(config['switch'].items()):
+            outfile.write('{0}\n        "{1}": '.format(',' if i else '', switch).encode())
+            data = json.dumps(section).encode()
+            index[switch] = [outfile.tell(), len(data)]
+            outfile.write(data)
+        outfile.write(b'\n    },\n    "host": {')
+        for i, (name, host) in enumerate(config['host'].items()):
+            outfile.write('{0}\n        "{1}": {2}'.format(',' if i else '', name, json.dumps(host)).encode())
+        outfile.write(b'\n    },\n    "link": [')
+        for i, link in enumerate(config['link']):
+            outfile.write('{0}\n        {1}'.format(',' if i else '', json.dumps(link)).encode())
+        outfile.write(b'\n    ]\n}\n')
+        size = outfile.tell()
+    with open(path + TOPO_INDEX_SUFFIX, 'w') as outfile:
+        json.dump({'size': size, 'switch': index}, outfile)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Topology Configuration Generator Script')
+    parser.add_argument('shape', help='Shape (linear,SWITCHES,HOSTS | tree,DEPTH,FANOUT | fattree,K)', type=str,
+                        action="store", nargs='?', default=None)
+    parser.add_argument('--vlans', help='Number of VLANs', type=int, action="store", default=2)
+    parser.add_argument('--output', help='Output File (default: topo/<shape>.json)', type=str, action="store",
+                        default=None)
+    parser.add_argument('--check', help='Topology Configuration Files to Validate Instead', type=str,
+                        action="store", nargs='+', default=None)
+    args = parser.parse_args()
+
+    if args.check:
+        num_invalid = 0
+        for path in args.check:
+            with open(path, 'r') as infile:
+                config = json.loads(infile.read())
+            wiring = topo_wiring(config, path)
+            errors = check_topo_config(config, wiring)
+            num_invalid += bool(errors)
+            print("{0}: {1}{2}".format(path, 'invalid' if errors else 'valid',
+                                       '' if wiring else ' (no wiring: trunks not checked)'))
+            for error in errors:
+                print("  {0}".format(error))
+        sys.exit(1 if num_invalid else 0)
+    if args.shape is None:
+        parser.error('a shape or --check is needed')
+
+    start = time.perf_counter()
+    try:
+        topo = build_topology(args.shape)
+        config = topo_config(topo, args.vlans)
+    except (ValueError, TypeError) as e:
+        sys.exit("{0}: {1}".format(args.shape, e))
+    errors = check_topo_config(config, topo_wiring(config, args.shape))
+    if errors:
+        sys.exit("{0}: generated an invalid config:\n  {1}".format(args.shape, '\n  '.join(errors)))
+    output = args.output or os.path.join(ASSIGNMENT_DIR, 'topo', '{0}.json'.format(args.shape))
+    write_topo_config(output, config)
+    print("{0}: {1} switches, {2} hosts, {3} links in {4:.2f} s".format(
+        output, len(topo.switches), len(topo.hosts), len(topo.links), time.perf_counter() - start))
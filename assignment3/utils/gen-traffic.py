@@ -0,0 +1,175 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import json
+import time
+import random
+import argparse
+import itertools
+
+from l2stream import KIND_ARP, KIND_UNICAST, L2StreamWriter, build_frame
+from pcapfile import write_pcap
+
+# Most hosts a stream may have (their MAC and IPv4 addresses differ in the
+# lower 24 bits)
+MAX_HOSTS = 1000000
+
+# MAC address of host 0, and VLAN ID of the first VLAN
+HOST_MAC_BASE = 0x020000000000
+VLAN_ID_BASE = 100
+
+# Packets drawn from the random generators at once
+CHUNK_PACKETS = 4096
+
+
+# Traffic of `num_hosts` hosts spread round-robin over `num_vlans` VLANs and
+# `num_ports` ports. After an optional announcement (an ARP request from every
+# host), each packet is, at random:
+# - a MAC move (`move_rate`): a host moves to another port and sends a
+#   gratuitous ARP request from there;
+# - an ARP request (`arp_ratio`), or else a unicast packet, from a uniformly
+#   drawn host to a destination of its VLAN drawn from a Zipf distribution of
+#   exponent `zipf` (0: uniform), the most popular hosts being spread at random.
+class TrafficModel:
+    def __init__(self, num_hosts, num_vlans, num_ports, arp_ratio, move_rate, zipf, rng):
+        self.num_hosts = num_hosts
+        self.num_vlans = num_vlans
+        self.num_ports = num_ports
+        self.arp_ratio = arp_ratio
+        self.move_rate = move_rate
+        self.rng = rng
+        self.host_ports = [1 + (host // num_vlans) % num_ports for host in range(num_hosts)]
+        self.ranked_hosts = list(range(num_hosts))
+        rng.shuffle(self.ranked_hosts)
+        self.cum_weights = list(itertools.accumulate((rank + 1) ** -zipf for rank in range(num_hosts)))
+        self.counts = {'arp': 0, 'unicast': 0, 'move': 0}
+
+    def vlan_id(self, host):
+        return VLAN_ID_BASE + host % self.num_vlans
+
+    # Packet as (ingress port, VLAN ID, kind, source MAC, destination MAC)
+    def packet(self, kind, src, dst):
+        self.counts['unicast' if kind == KIND_UNICAST else 'arp'] += 1
+        return (self.host_ports[src], self.vlan_id(src), kind, HOST_MAC_BASE + src, HOST_MAC_BASE + dst)
+
+    # Destination in the VLAN of `src` for a host drawn from the popularity ranking
+    def destination(self, src, ranked):
+        dst = ranked - ranked % self.num_vlans + src % self.num_vlans
+        if dst >= self.num_hosts:
+            dst -= self.num_vlans
+        if dst == src:
+            dst = dst + self.num_vlans if dst + self.num_vlans < self.num_hosts else dst - self.num_vlans
+        return max(dst, 0)
+
+    def announce(self):
+        for host in range(self.num_hosts):
+            yield self.packet(KIND_ARP, host, host)
+
+    def mix(self, num_packets):
+        rng = self.rng
+        for start in range(0, num_packets, CHUNK_PACKETS):
+            count = min(CHUNK_PACKETS, num_packets - start)
+            ranked = rng.choices(self.ranked_hosts, cum_weights=self.cum_weights, k=count)
+            for i in range(count):
+                src = rng.randrange(self.num_hosts)
+                draw = rng.random()
+                if draw < self.move_rate and self.num_ports > 1:
+                    port = self.host_ports[src]
+                    self.host_ports[src] = 1 + (port - 1 + rng.randrange(1, self.num_ports)) % self.num_ports
+                    self.counts['move'] += 1
+                    yield self.packet(KIND_ARP, src, src)
+                elif draw < self.move_rate + self.arp_ratio:
+                    yield self.packet(KIND_ARP, src, self.destination(src, ranked[i]))
+                else:
+                    yield self.packet(KIND_UNICAST, src, self.destination(src, ranked[i]))
+
+
+# Topology configuration of a switch (gRPC port 50001) with every port in
+# every VLAN of the traffic
+def topo_config(num_vlans, num_ports):
+    ports = list(range(1, num_ports + 1))
+    return {'switch': {'50001': {'mcast': {'id': 1, 'ports': ports},
+                                 'vlan_id_to_ports': {str(VLAN_ID_BASE + vlan): ports
+                                                      for vlan in range(num_vlans)}}},
+            'host': {}}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic L2 Traffic Generator Script')
+    parser.add_argument('output', help='Output File', type=str, action="store")
+    parser.add_argument('--format', help='Output Format (l2: PacketIn stream, with ingress ports)',
+                        choices=['l2', 'pcap'], type=str, action="store", default='l2')
+    parser.add_argument('--hosts', help='Number of Hosts (MAC Addresses)', type=int, action="store",
+                        default=10000)
+    parser.add_argument('--vlans', help='Number of VLANs', type=int, action="store", default=2)
+    parser.add_argument('--ports', help='Number of Switch Ports', type=int, action="store", default=4)
+    parser.add_argument('--packets', help='Packets After the Announcement', type=int, action="store",
+                        default=100000)
+    parser.add_argument('--arp-ratio', help='Fraction of ARP Requests', type=float, action="store",
+                        default=0.1)
+    parser.add_argument('--move-rate', help='Fraction of MAC Moves', type=float, action="store",
+                        default=0.001)
+    parser.add_argument('--zipf', help='Zipf Exponent of the Destinations (0: Uniform)', type=float,
+                        action="store", default=1.0)
+    parser.add_argument('--rate', help='Packets per Second of the Timestamps (0: All at Once)', type=float,
+                        action="store", default=0)
+    parser.add_argument('--skip-announce', help='Skip the ARP Request of Every Host First',
+                        action="store_true")
+    parser.add_argument('--seed', help='Random Seed', type=int, action="store", default=1)
+    parser.add_argument('--topo-config', help='Also Write a Matching Topology Configuration File', type=str,
+                        action="store", default=None)
+    args = parser.parse_args()
+
+    if not 1 <= args.hosts <= MAX_HOSTS:
+        parser.error('--hosts must be between 1 and {0}'.format(MAX_HOSTS))
+    if not 1 <= args.vlans <= min(args.hosts, 4094 - VLAN_ID_BASE):
+        parser.error('--vlans must be between 1 and min(--hosts, {0})'.format(4094 - VLAN_ID_BASE))
+    if args.ports < 1 or args.arp_ratio + args.move_rate > 1:
+        parser.error('--ports must be positive, and --arp-ratio plus --move-rate at most 1')
+
+    start = time.perf_counter()
+    model = TrafficModel(args.hosts, args.vlans, args.ports, args.arp_ratio, args.move_rate, args.zipf,
+                         random.Random(args.seed))
+    packets = model.mix(args.packets)
+    if not args.skip_announce:
+        packets = itertools.chain(model.announce(), packets)
+    timestamps = (i / args.rate for i in itertools.count()) if args.rate else itertools.repeat(0.0)
+
+    num_packets = 0
+    if args.format == 'l2':
+        writer = L2StreamWriter(args.output)
+        for timestamp, packet in zip(timestamps, packets):
+            writer.add(timestamp, *packet)
+        writer.close()
+        num_packets = writer.num_records
+    else:
+        # pcap has no ingress port: replay-pcap.py sends all from --ingress-port
+        frames = [(timestamp, build_frame(vlan_id, kind, src_mac.to_bytes(6, byteorder='big'),
+                                          dst_mac.to_bytes(6, byteorder='big')))
+                  for timestamp, (_, vlan_id, kind, src_mac, dst_mac) in zip(timestamps, packets)]
+        write_pcap(args.output, frames)
+        num_packets = len(frames)
+
+    if args.topo_config:
+        with open(args.topo_config, 'w') as outfile:
+            json.dump(topo_config(args.vlans, args.ports), outfile, indent=4)
+    print("{0}: {1} packets ({2}) in {3:.2f} s".format(
+        args.output, num_packets, ', '.join('{0}={1}'.format(kind, count) for kind, count in model.counts.items()),
+        time.perf_counter() - start))
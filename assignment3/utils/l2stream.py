@@ -0,0 +1,134 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import struct
+
+# File header: magic, format version and record size
+MAGIC = b'L2PI'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+
+# Record of a PacketIn: nanoseconds since the start of the stream, ingress
+# port, VLAN ID (0: untagged), kind, source and destination MAC addresses.
+# The frame is rebuilt from it, so that a million-host stream stays small.
+RECORD = struct.Struct('<QHHB6s6s')
+
+# Record kinds: ARP request from the source for the destination (sent to the
+# broadcast address), or unicast IPv4 packet from the source to the destination
+KIND_ARP = 0
+KIND_UNICAST = 1
+
+# Records read or written at once
+CHUNK_RECORDS = 4096
+
+# Frames kept built while reading, as frames repeat a lot
+FRAME_CACHE_SIZE = 65536
+
+ETH_BROADCAST = b'\xff' * 6
+ETH_TYPE_VLAN = b'\x81\x00'
+ETH_TYPE_IPV4 = b'\x08\x00'
+ETH_TYPE_ARP = b'\x08\x06'
+
+# Minimum Ethernet frame size, without the frame check sequence
+MIN_FRAME_SIZE = 60
+
+
+class L2StreamError(Exception):
+    pass
+
+
+# IPv4 address of a host in the ARP packets, from its MAC address
+def host_ip(mac):
+    return b'\x0a' + mac[3:]
+
+
+# Ethernet frame of a record
+def build_frame(vlan_id, kind, src_mac, dst_mac):
+    if kind == KIND_ARP:
+        header = ETH_BROADCAST + src_mac
+        eth_type = ETH_TYPE_ARP
+        body = (b'\x00\x01\x08\x00\x06\x04\x00\x01' + src_mac + host_ip(src_mac) +
+                bytes(6) + host_ip(dst_mac))
+    else:
+        header = dst_mac + src_mac
+        eth_type = ETH_TYPE_IPV4
+        body = b''
+    if vlan_id:
+        header += ETH_TYPE_VLAN + vlan_id.to_bytes(2, byteorder='big')
+    frame = header + eth_type + body
+    return frame + bytes(max(0, MIN_FRAME_SIZE + (4 if vlan_id else 0) - len(frame)))
+
+
+# Whether a file is a stream of PacketIn records
+def is_l2stream(path):
+    with open(path, 'rb') as infile:
+        return infile.read(len(MAGIC)) == MAGIC
+
+
+# Read the records of a stream, as (timestamp in seconds, ingress port, frame)
+def read_packets(path):
+    frames = {}
+    with open(path, 'rb') as infile:
+        header = infile.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise L2StreamError('{0}: not a PacketIn stream'.format(path))
+        magic, version, record_size = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise L2StreamError('{0}: not a version {1} PacketIn stream'.format(path, VERSION))
+        while True:
+            data = infile.read(CHUNK_RECORDS * RECORD.size)
+            if len(data) % RECORD.size:
+                raise L2StreamError('{0}: truncated record'.format(path))
+            if not data:
+                break
+            for nanoseconds, ingress_port, vlan_id, kind, src_mac, dst_mac in RECORD.iter_unpack(data):
+                key = (vlan_id, kind, src_mac, dst_mac)
+                frame = frames.get(key)
+                if frame is None:
+                    if len(frames) == FRAME_CACHE_SIZE:
+                        frames.clear()
+                    frame = frames[key] = build_frame(*key)
+                yield nanoseconds * 1e-9, ingress_port, frame
+
+
+# Writes a stream of PacketIn records
+class L2StreamWriter:
+    def __init__(self, path):
+        self.outfile = open(path, 'wb')
+        self.outfile.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.records = []
+        self.num_records = 0
+
+    # Add a record; MAC addresses are integers
+    def add(self, timestamp, ingress_port, vlan_id, kind, src_mac, dst_mac):
+        self.records.append(RECORD.pack(int(round(timestamp * 1e9)), ingress_port, vlan_id, kind,
+                                        src_mac.to_bytes(6, byteorder='big'),
+                                        dst_mac.to_bytes(6, byteorder='big')))
+        if len(self.records) == CHUNK_RECORDS:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write(b''.join(self.records))
+        self.num_records += len(self.records)
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
@@ -0,0 +1,129 @@
+############################################################################
+##
+##     This file is part of Purdue CS 536.
+##
+##     Purdue CS 536 is free software: you can redistribute it and/or modify
+##     it under the terms of the GNU General Public License as published by
+##     the Free Software Foundation, either version 3 of the License, or
+##     (at your option) any later version.
+##
+##     Purdue CS 536 is distributed in the hope that it will be useful,
+##     but WITHOUT ANY WARRANTY; without even the implied warranty of
+##     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##     GNU General Public License for more details.
+##
+##     You should have received a copy of the GNU General Public License
+##     along with Purdue CS 536. If not, see <https://www.gnu.org/licenses/>.
+##
+#############################################################################
+
+
+import struct
+
+# Link type of Ethernet frames (https://www.tcpdump.org/linktypes.html)
+LINKTYPE_ETHERNET = 1
+
+# pcap magic numbers, with microsecond or nanosecond timestamps
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+
+# pcapng block types
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+# pcapng interface option carrying the timestamp resolution
+PCAPNG_OPT_TSRESOL = 9
+
+
+class PcapError(Exception):
+    pass
+
+
+# Read the frames of a pcap or pcapng file, as (timestamp in seconds, frame
+# bytes); frames of other link types than Ethernet are skipped
+def read_frames(path):
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    if len(data) < 4:
+        raise PcapError('{0}: not a pcap file'.format(path))
+    if struct.unpack_from('<I', data)[0] == PCAPNG_SHB:
+        return read_pcapng(data)
+    return read_pcap(data, path)
+
+
+def read_pcap(data, path):
+    for order in '<>':
+        magic, = struct.unpack_from(order + 'I', data)
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            break
+    else:
+        raise PcapError('{0}: not a pcap file'.format(path))
+    scale = 1e-6 if magic == PCAP_MAGIC_US else 1e-9
+    linktype, = struct.unpack_from(order + 'I', data, 20)
+    if linktype & 0x0fffffff != LINKTYPE_ETHERNET:
+        raise PcapError('{0}: link type {1}, not Ethernet'.format(path, linktype))
+
+    record = struct.Struct(order + 'IIII')
+    offset = 24
+    while offset + record.size <= len(data):
+        seconds, fraction, caplen, _ = record.unpack_from(data, offset)
+        offset += record.size
+        yield seconds + fraction * scale, data[offset:offset + caplen]
+        offset += caplen
+
+
+def read_pcapng(data):
+    order = '<'
+    linktypes = []
+    scales = []
+    offset = 0
+    while offset + 12 <= len(data):
+        block_type, = struct.unpack_from(order + 'I', data, offset)
+        if block_type == PCAPNG_SHB:
+            byte_order_magic, = struct.unpack_from('<I', data, offset + 8)
+            order = '<' if byte_order_magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            linktypes, scales = [], []  # ... interfaces are per section
+        block_len, = struct.unpack_from(order + 'I', data, offset + 4)
+        if block_len < 12:
+            raise PcapError('pcapng block of {0} bytes at offset {1}'.format(block_len, offset))
+        body = offset + 8
+
+        if block_type == PCAPNG_IDB:
+            linktype, = struct.unpack_from(order + 'H', data, body)
+            linktypes.append(linktype)
+            scales.append(read_tsresol(data, order, body + 8, offset + block_len - 4))
+        elif block_type == PCAPNG_EPB:
+            interface_id, ts_high, ts_low, caplen = struct.unpack_from(order + 'IIII', data, body)
+            if linktypes[interface_id] == LINKTYPE_ETHERNET:
+                yield (ts_high << 32 | ts_low) * scales[interface_id], data[body + 20:body + 20 + caplen]
+        elif block_type == PCAPNG_SPB and linktypes and linktypes[0] == LINKTYPE_ETHERNET:
+            packet_len, = struct.unpack_from(order + 'I', data, body)
+            caplen = min(packet_len, block_len - 16)
+            yield 0.0, data[body + 4:body + 4 + caplen]  # ... no timestamp
+        offset += block_len
+
+
+# Seconds per timestamp unit of an interface, from its if_tsresol option
+def read_tsresol(data, order, offset, end):
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(order + 'HH', data, offset)
+        if code == 0:  # ... opt_endofopt
+            break
+        if code == PCAPNG_OPT_TSRESOL and length >= 1:
+            tsresol = data[offset + 4]
+            return 2.0 ** -(tsresol & 0x7f) if tsresol & 0x80 else 10.0 ** -tsresol
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+# Write Ethernet frames to a pcap file, from (timestamp in seconds, frame bytes)
+def write_pcap(path, frames):
+    with open(path, 'wb') as outfile:
+        outfile.write(struct.pack('<IHHiIII', PCAP_MAGIC_NS, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET))
+        for timestamp, frame in frames:
+            nanoseconds = int(round(timestamp * 1e9))
+            outfile.write(struct.pack('<IIII', nanoseconds // 10**9, nanoseconds % 10**9, len(frame), len(frame)))
+            outfile.write(frame)